@@ -64,6 +64,7 @@ UPDATE_CYCLE_ASSETS = 30 # MINTUES
 UPDATE_CYCLE_RANSOMWARELIVE = 1 # DAYS
 UPDATE_CYCLE_RSS_FEED=1 # HOURS
 UPDATE_CYCLE_CVE_DATA=1 # DAYS
+UPDATE_CYCLE_MLNIDS_RETENTION=60 # MINUTES
 EOF
 
 cat << EOF > services/mlnids_service/.env
@@ -95,7 +96,7 @@ EOF
 
 # Apply migrations
 echo "Applying migrations..."
-source $DJANGO_DIR/$VENV_NAME/bin/activate && python manage.py makemigrations accounts api assets backup chat cvedata dashboard dnsops ipcheck main mlnids nmapapp ransomwarelive rssapp webops yarascan
+source $DJANGO_DIR/$VENV_NAME/bin/activate && python manage.py makemigrations accounts api assets backup chat cvedata dashboard dnsops ipcheck jobs main mlnids nmapapp ransomwarelive rssapp webops yarascan
 source $DJANGO_DIR/$VENV_NAME/bin/activate && python manage.py migrate
 
 # Create a superuser (optional)
@@ -9,7 +9,12 @@ urlpatterns = [
     path('ransomwarelive/victims/fetch', views.fetch_victims, name='ransomware_fetch_victims'),
     path('rssapp/feeds/update', views.rss_feed_update, name='rss_feed_update'),
     path('nmap/scan', views.nmap_scan, name='nmap_scan'),
+    path('nmap/changes', views.nmap_changes, name='nmap_changes'),
     path('mlnids/upload', views.mlnids_upload_csv, name='mlnids_upload_csv'),
+    path('mlnids/upload/<str:upload_id>', views.mlnids_upload_status, name='mlnids_upload_status'),
+    path('mlnids/upload/<str:upload_id>/<int:index>', views.mlnids_upload_chunk, name='mlnids_upload_chunk'),
+    path('mlnids/retention', views.mlnids_retention, name='mlnids_retention'),
+    path('jobs/<int:job_id>', views.job_progress, name='job_progress'),
     path('assets/gather/all', views.assets_gather_all, name='assets_gather_all'),
     path('cve/daily/get', views.cve_get_daily, name='cve_get_daily'),
     path('dns/enumerate', views.api_dns_enumerate, name='api_dns_enumerate'),
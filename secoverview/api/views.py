@@ -3,12 +3,17 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
 from rest_framework.decorators import api_view
 from assets.assetsoperations import gather_all
 from dnsops.dnsops import enumerate_dns_records
 from rssapp.views import fetch_rss_feed
 from ransomwarelive.models import RansomwareliveVictim, RansomwareliveGroupsGroup, RansomwareliveGroupsLocation, RansomwareliveGroupsProfile
 from mlnids.models import NetworkFlow, RfPrediction
+from mlnids.mlnidsops import ingest_flow_csv, ingest_flow_chunk, flow_upload_status, apply_flow_retention
 from cvedata.cve_ops import get_load_all_cve_data
 from ransomwarelive.ransomwareliveops import fetch_ransomwarelive_victims, fetch_ransomwarelive_groups
 from webops.models import CRTSHResult, WebTechFingerprinting_Results
@@ -16,11 +21,11 @@ from webops.webops.crt_sh_ops import query_crtsh
 from webops.webops.web_headers import check_security_headers
 from webops.webops.web_tech_fingerprinting import analyze_technologies
 from ipcheck.views import get_external_ip_info
-from nmapapp.nmapops import execute_nmap_scan_db
+from nmapapp.nmapops import execute_nmap_scan_db, service_changes
+from jobs.models import Job
+from jobs.jobops import job_status
 from .serializers import CRTSHResultSerializer, WebHeaderCheckSerializer, WebTechFingerprinting_ResultsSerializer
 import requests
-import csv
-import io
 
 @api_view(['POST'])
 def logout_view(request):
@@ -67,10 +72,29 @@ def nmap_scan(request):
     ip = request.data.get('ip', 'Guest')
     parameters = request.data.get('parameters', None)
 
-    combined = execute_nmap_scan_db(ip, parameters)
+    try:
+        combined = execute_nmap_scan_db(ip, parameters)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
 
     return Response(combined, status=200)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def nmap_changes(request):
+    # Changes since ?since=<ISO datetime> or the last ?hours=<n> (default 24), optionally of one ?ip=
+    try:
+        since = parse_datetime(request.GET.get('since', '')) or timezone.now() - timedelta(hours=float(request.GET.get('hours', 24)))
+    except (ValueError, OverflowError):
+        return Response({'error': 'Invalid since or hours'}, status=400)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+
+    changes = service_changes(since, ip=request.GET.get('ip') or None)
+    fields = ['ip_address', 'port', 'protocol', 'state', 'service', 'product', 'version', 'cpe', 'first_seen', 'last_seen', 'changed_at', 'previous', 'missing_since', 'last_scan_id']
+    result = {name: list(services.values(*fields)) for name, services in changes.items()}
+    return Response({'since': since, **result}, status=200)
+
     
 
 
@@ -86,50 +110,66 @@ def mlnids_upload_csv(request):
         return Response({'error': 'Only CSV files are supported'}, status=400)
 
     try:
-        decoded_file = file.read().decode('utf-8')
-        io_string = io.StringIO(decoded_file)
-        reader = csv.DictReader(io_string)
-        print(reader)
-        entries = []
-        for row in reader:
-            prediction_label = row.pop("rf_prediction", "Unknown")
-            prediction, _ = RfPrediction.objects.get_or_create(label=prediction_label)
-            print(prediction)
-            # Boolean conversion
-            anomaly_flag = row.get("if_is_anomaly", "False") in ["True", "true", "1"]
-
-            flow = NetworkFlow(
-                rf_prediction=prediction,
-                rf_confidence=row.pop("rf_confidence", 0),
-                if_anomaly_score=row.pop("if_anomaly_score", 0),
-                if_is_anomaly=anomaly_flag
-            )
-
-            for key, value in row.items():
-                print(f"Setting {key} to {value}")
-                if hasattr(flow, key):
-                    # Try to cast to appropriate type if needed
-                    setattr(flow, key, value)
-            
-            try:
-                flow.save()
-            except Exception as e:
-                print(f"Error saving flow: {e}")
-
-            entries.append(flow)
-        print(f"{entries}")
-        NetworkFlow.objects.bulk_create(entries, ignore_conflicts=True)
-        return Response({'message': f'{len(entries)} records uploaded.'}, status=201)
+        inserted, skipped = ingest_flow_csv(file)
+        message = f'{inserted} records uploaded.' + (f' {skipped} invalid rows skipped.' if skipped else '')
+        return Response({'message': message}, status=201)
+
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mlnids_upload_status(request, upload_id):
+    return Response(flow_upload_status(upload_id), status=200)
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def mlnids_upload_chunk(request, upload_id, index):
+    # Body: JSON object {"column": [values, ...]}, optionally gzip/zstd compressed (Content-Encoding)
+    stream = request.stream
+    body = stream.read(settings.MLNIDS_UPLOAD_MAX_CHUNK_BYTES + 1) if stream is not None else b''
+    if not body:
+        return Response({'error': 'Empty chunk'}, status=400)
+    if len(body) > settings.MLNIDS_UPLOAD_MAX_CHUNK_BYTES:
+        return Response({'error': 'Chunk too large'}, status=413)
+
+    total_chunks = request.headers.get('X-Total-Chunks')
+    try:
+        upload, inserted, skipped, duplicate = ingest_flow_chunk(
+            upload_id, index, body, encoding=request.headers.get('Content-Encoding'),
+            total_chunks=int(total_chunks) if total_chunks else None)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
+
+    status_code = 200 if duplicate else 201
+    return Response({'message': f'Chunk {index}: {inserted} records uploaded.' + (f' {skipped} invalid rows skipped.' if skipped else ''),
+                     'duplicate': duplicate, 'completed': upload.completed}, status=status_code)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mlnids_retention(request):
+    try:
+        result = apply_flow_retention()
+        return Response({'message': f"{result['rolled_up']} flows rolled up, {result['deleted']} expired flows deleted."}, status=200)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_progress(request, job_id):
+    job = Job.objects.filter(id=job_id).first()
+    if job is None:
+        return Response({'error': 'Job not found'}, status=404)
+    return Response(job_status(job), status=200)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def assets_gather_all(request):
     try:
-        # Call the function you want to execute
-        gather_all()
+        # Incremental by default, ?full=true reprocesses all scans, flows and CVEs
+        gather_all(full=request.GET.get('full', '').lower() == 'true')
         return Response({'message': 'Gather assets and detection information successfully'}, status=200)
     except Exception as e:
         return Response({f'error': 'Failed gather assets and detection information'}, status=500)
@@ -149,8 +189,11 @@ def rss_feed_update(request):
 def cve_get_daily(request):
     try:
         # Call the function you want to execute
-        get_load_all_cve_data()
-        return Response({'message': 'Gather CVE successfully'}, status=200)
+        results = get_load_all_cve_data(full=request.GET.get('full', '').lower() == 'true')
+        failed = [name for name, (status, _) in results.items() if status == 'failed']
+        if failed:
+            return Response({'error': f'Failed gather CVE feeds: {", ".join(failed)}'}, status=502)
+        return Response({'message': 'Gather CVE successfully', 'cves': sum(cves for _, cves in results.values())}, status=200)
     except Exception as e:
         return Response({f'error': 'Failed gather CVE'}, status=500)
 
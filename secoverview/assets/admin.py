@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ComputeAssets, ComputeAssetsNetworkPorts, ComputeAssetsNetworkDetection, ComputeAssetsCVE
+from .models import ComputeAssets, ComputeAssetsNetworkPorts, ComputeAssetsNetworkDetection, ComputeAssetsCVE, GatherWatermark
 
 # Register your models here.
 
@@ -46,4 +46,14 @@ class ComputeAssetsCVEAdmin(admin.ModelAdmin):
         'cve', 
     ]
     search_fields = ['cve', 'compute_assets']
-    list_filter = ['compute_assets']
\ No newline at end of file
+    list_filter = ['compute_assets']
+
+@admin.register(GatherWatermark)
+class GatherWatermarkAdmin(admin.ModelAdmin):
+    list_display = [
+        'name', 
+        'last_id', 
+        'last_modified', 
+        'updated', 
+    ]
+    search_fields = ['name']
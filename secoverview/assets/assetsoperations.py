@@ -1,10 +1,18 @@
-from django.db.models import Q
-from nmapapp.models import NmapAssets, Nmapscan, AssetsNmapscan
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from django.db.models import Max, Q
+from nmapapp.models import NmapAssets, Nmapscan, AssetsNmapscan, NmapService
 from mlnids.models import NetworkFlow
+from mlnids.mlnidsops import flow_severity_levels
 from .models import *
-from nmapapp.nmapops import parse_cpe_info
+from nmapapp.nmapops import last_complete_scan_id, parse_cpe_info
+from cvedata.cpe_ops import asset_cpe_version, cached_match_cpe, cve_data_version, match_cpe
+from cvedata.search_ops import LIST_DEFERRED_FIELDS
+from django.utils import timezone
+from datetime import timedelta
 import json
 import ipaddress
+import numpy as np
 
 def is_internal_ip(ip):
     try:
@@ -13,93 +21,281 @@ def is_internal_ip(ip):
     except ValueError:
         return False
 
-def gather_nmap_assets_infos():
-    """Gather compute assets"""
-    nmapassets = NmapAssets.objects.all()
-    for asset in nmapassets:
-        computeasset, flag = ComputeAssets.objects.update_or_create(ip_address=asset.ip_address, defaults={"nmap_asset": asset, "hostname": asset.hostname})
-        string_json = str(asset.json_data)
-        assetjson = json.loads(string_json)
-        tcp_data = assetjson.get("tcp", {})
-        for port_str, port_info in tcp_data.items():
-            record = {
-                "service": port_info.get("name"),
-                "product": port_info.get("product") or None,
-                "version": port_info.get("version") or None,
-                "extrainfo": port_info.get("extrainfo") or None,
-                "cpe": port_info.get("cpe") or None
+# Fields of ComputeAssetsNetworkPorts taken from the nmap service detection
+PORT_FIELDS = ["service", "product", "version", "extrainfo", "cpe", "detection_severity"]
+BULK_BATCH_SIZE = 1000
+DETECTION_BATCH_SIZE = 10000 # Flows per batch in gather_mlnids_assets_info
+LOOKUP_BATCH_SIZE = 500 # Values per __in lookup, below SQLite's parameter limit
+CVE_INGEST_OVERLAP = timedelta(minutes=10) # CVEs stored this long before the CVE watermark are matched again (links are only added once)
+
+def nmap_host_data(json_data):
+    """Nmap host result of an NmapAssets row: the referenced AssetsNmapscan result, or json_data (a JSON encoded string or the object) of older rows."""
+    if isinstance(json_data, str):
+        return json.loads(json_data)
+    return json_data or {}
+
+def nmap_port_records(host_data):
+    """Port number -> ComputeAssetsNetworkPorts values for the TCP ports of a nmap host result."""
+    records = {}
+    for port_str, port_info in host_data.get("tcp", {}).items():
+        records[int(port_str)] = {
+            "service": port_info.get("name"),
+            "product": port_info.get("product") or None,
+            "version": port_info.get("version") or None,
+            "extrainfo": port_info.get("extrainfo") or None,
+            "cpe": port_info.get("cpe") or None,
+            "detection_severity": 1, # Default to 'Negligible'
+        }
+    return records
+
+def nmap_service_port_records(latest):
+    """IP -> port records of the TCP ports in the nmap port history (NmapService) for the IPs of
+    latest (IP -> (NmapAssets id, hostname)). Hosts without history, stored before it existed,
+    are read from the host result of their NmapAssets row."""
+    ips, records = list(latest), {}
+    for start in range(0, len(ips), LOOKUP_BATCH_SIZE):
+        services = NmapService.objects.filter(ip_address__in=ips[start:start + LOOKUP_BATCH_SIZE], protocol="tcp")
+        for ip_address, port, service, product, version, extrainfo, cpe in services.values_list("ip_address", "port", "service", "product", "version", "extrainfo", "cpe"):
+            records.setdefault(ip_address, {})[port] = {
+                "service": service,
+                "product": product or None,
+                "version": version or None,
+                "extrainfo": extrainfo or None,
+                "cpe": cpe or None,
+                "detection_severity": 1, # Default to 'Negligible'
             }
-            ComputeAssetsNetworkPorts.objects.update_or_create(
-                asset=computeasset,
-                port_number=int(port_str),
-                defaults={
-                    **record,
-                    "detection_severity": 1, # Default to 'Negligible'
-                },
-            )
-
-def gather_mlnids_assets_info():
-    networkflows = NetworkFlow.objects.all()
-    for mlnids in networkflows:
-        if mlnids.rf_prediction != "Benign":
-            rf_confidence_level = round(mlnids.rf_confidence * 100)
-        else:
-            rf_confidence_level = 0
-            
-        if_confidence_level = round(mlnids.if_anomaly_score * -100)
-        confidence_level = (rf_confidence_level + if_confidence_level) / 2
-        calculate_confidence_level = round((confidence_level - 1) * 4 / 99 + 1)
-        if is_internal_ip(mlnids.src_ip):
-            computeassets, flag = ComputeAssets.objects.get_or_create(ip_address=mlnids.src_ip)
-            ComputeAssetsNetworkDetection.objects.get_or_create(
-                mlnids_detection=mlnids,
-                detection_severity=calculate_confidence_level,
-                compute_assets=computeassets,
-            )
-        if is_internal_ip(mlnids.dst_ip):
-            computeassets, flag = ComputeAssets.objects.get_or_create(ip_address=mlnids.dst_ip)
-            ComputeAssetsNetworkDetection.objects.get_or_create(
-                mlnids_detection=mlnids,
-                detection_severity=calculate_confidence_level,
-                compute_assets=computeassets,
-            )
-
-def gather_assets_cve_infos():
-    computeassets = ComputeAssets.objects.all()
-    for asset in computeassets:
-        network_ports = ComputeAssetsNetworkPorts.objects.filter(asset=asset)
-        for port in network_ports:
-            cves = []
-            type, vendor, product, version, update, edition, language = parse_cpe_info(port.cpe)
-            if type == None and vendor == None and product == None and version == None and update == None and edition == None and language == None:
-                continue
-            query = Q()
-
-            if product is not None:
-                query |= Q(cve_id__icontains=product)
-                query |= Q(source_identifier__icontains=product)
-                query |= Q(vuln_status__icontains=product)
-                query |= Q(descriptions__icontains=product)
-                query |= Q(metrics__icontains=product)
-                query |= Q(weaknesses__icontains=product)
-                query |= Q(references__icontains=product)
-
-            if port.product is not None:
-                query |= Q(cve_id__icontains=port.product)
-                query |= Q(source_identifier__icontains=port.product)
-                query |= Q(vuln_status__icontains=port.product)
-                query |= Q(descriptions__icontains=port.product)
-                query |= Q(metrics__icontains=port.product)
-                query |= Q(weaknesses__icontains=port.product)
-                query |= Q(references__icontains=port.product)
-            
-            cves = CveItem.objects.filter(query).order_by('-cve_id')
-
-            for cve in cves:
-                ComputeAssetsCVE.objects.get_or_create(compute_assets=asset, cve=cve)
- 
-def gather_all():
-    gather_nmap_assets_infos()
-    gather_mlnids_assets_info()
-    gather_assets_cve_infos()
+    missing = [latest[ip_address][0] for ip_address in ips if ip_address not in records]
+    for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+        nmapassets = NmapAssets.objects.filter(id__in=missing[start:start + LOOKUP_BATCH_SIZE])
+        for ip_address, json_data, result_data in nmapassets.values_list("ip_address", "json_data", "result__assets_json_data"):
+            records[ip_address] = nmap_port_records(nmap_host_data(result_data if result_data is not None else json_data))
+    return records
+
+def insert_rows(model, field_names, rows, unique_fields=None, update_fields=None):
+    """Inserts value tuples (in field_names order) with one prepared statement (executemany).
+
+    With unique_fields and update_fields, rows that already exist are updated (upsert).
+    bulk_create is limited to a few hundred rows per query on SQLite and compiles every
+    value, which dominated large scans and flow imports.
+    """
+    meta = model._meta
+    quote = connection.ops.quote_name
+    fields = [meta.get_field(name) for name in field_names]
+    columns = ", ".join(quote(field.column) for field in fields)
+    sql = f"INSERT INTO {quote(meta.db_table)} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})"
+    if unique_fields and update_fields:
+        sql += " " + connection.ops.on_conflict_suffix_sql(
+            fields, OnConflict.UPDATE, [meta.get_field(name).column for name in update_fields], [meta.get_field(name).column for name in unique_fields])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+def correlate_nmap_assets(nmapassets):
+    """Creates or updates compute assets and their ports from NmapAssets rows.
+
+    The compute assets and ports of these IPs are loaded into dicts with two queries, the differences
+    are computed in memory and written in one transaction: assets with bulk_create and
+    bulk_update, ports with one upsert on (asset, port number). The newest NmapAssets
+    row of an IP wins, ports come from the nmap port history. Ports no longer reported are kept.
+    Returns counts of created and updated assets and ports.
+    """
+    latest = {}
+    for nmap_id, ip_address, hostname in nmapassets.order_by("id").values_list("id", "ip_address", "hostname").iterator(chunk_size=2000):
+        latest[ip_address] = (nmap_id, hostname)
+    port_records = nmap_service_port_records(latest)
+
+    with transaction.atomic():
+        existing_assets = {}
+        for asset in ComputeAssets.objects.filter(ip_address__in=nmapassets.values("ip_address")).order_by("-id").only("id", "ip_address", "hostname", "nmap_asset_id"):
+            existing_assets[asset.ip_address] = asset # Lowest id wins for IPs stored more than once
+
+        new_assets, changed_assets = [], []
+        for ip_address, (nmap_id, hostname) in latest.items():
+            asset = existing_assets.get(ip_address)
+            if asset is None:
+                new_assets.append(ComputeAssets(ip_address=ip_address, hostname=hostname, nmap_asset_id=nmap_id))
+            elif asset.hostname != hostname or asset.nmap_asset_id != nmap_id:
+                asset.hostname, asset.nmap_asset_id = hostname, nmap_id
+                changed_assets.append(asset)
+        ComputeAssets.objects.bulk_create(new_assets, batch_size=BULK_BATCH_SIZE)
+        ComputeAssets.objects.bulk_update(changed_assets, ["hostname", "nmap_asset"], batch_size=BULK_BATCH_SIZE)
+        asset_ids = {asset.ip_address: asset.id for asset in list(existing_assets.values()) + new_assets}
+
+        existing_ports = {}
+        for asset_id, port_number, *values in ComputeAssetsNetworkPorts.objects.filter(asset__ip_address__in=nmapassets.values("ip_address")).values_list("asset_id", "port_number", *PORT_FIELDS).iterator(chunk_size=10000):
+            existing_ports[(asset_id, port_number)] = tuple(values)
+
+        ports, created_ports = [], 0
+        for ip_address, records in port_records.items():
+            asset_id = asset_ids[ip_address]
+            for port_number, record in records.items():
+                values = existing_ports.get((asset_id, port_number))
+                if values is None:
+                    created_ports += 1
+                elif values == tuple(record[field] for field in PORT_FIELDS):
+                    continue
+                ports.append((asset_id, port_number, *(record[field] for field in PORT_FIELDS)))
+        # New and changed ports in one upsert on (asset, port_number)
+        if ports:
+            insert_rows(ComputeAssetsNetworkPorts, ["asset", "port_number", *PORT_FIELDS], ports,
+                        unique_fields=["asset", "port_number"], update_fields=PORT_FIELDS)
+
+    return {
+        "assets_created": len(new_assets),
+        "assets_updated": len(changed_assets),
+        "ports_created": created_ports,
+        "ports_updated": len(ports) - created_ports,
+    }
+
+# --- Incremental Gathering ---
+# Every step only processes what changed since its watermark; full=True reprocesses everything.
+def get_watermark(name):
+    return GatherWatermark.objects.get_or_create(name=name)[0]
+
+def save_watermark(watermark, last_id=None, last_modified=None):
+    if last_id is not None:
+        watermark.last_id = last_id
+    if last_modified is not None:
+        watermark.last_modified = last_modified
+    watermark.save()
+
+def gather_nmap_assets_infos(full=False):
+    """Gather compute assets"""
+    # NmapAssets point to the scan that last reported them, so new and updated hosts have a newer scan id
+    watermark = get_watermark("nmapscan")
+    last_scan = last_complete_scan_id()
+    nmapassets = NmapAssets.objects.filter(added_by_scan_id__lte=last_scan)
+    if not full:
+        nmapassets = nmapassets.filter(added_by_scan_id__gt=watermark.last_id)
+    result = correlate_nmap_assets(nmapassets)
+    save_watermark(watermark, last_id=last_scan)
+    return result
+
+def gather_mlnids_assets_info(full=False, batch_size=DETECTION_BATCH_SIZE):
+    """Maps ML NIDS flows to detections on the internal compute assets they involve.
+
+    Flows are read in id batches with only the needed columns; severities are computed
+    for the whole batch at once, private-IP checks and asset ids are cached per IP and
+    detections are inserted in batches. A flow is linked to an asset at most once.
+    """
+    watermark = get_watermark("networkflow")
+    last_flow = NetworkFlow.objects.aggregate(last=Max("id"))["last"] or 0
+    networkflows = NetworkFlow.objects.filter(id__lte=last_flow).order_by("id")
+    last_id = 0 if full else watermark.last_id
+    internal, asset_ids = {}, {}
+    while True:
+        rows = list(networkflows.filter(id__gt=last_id).values_list(
+            "id", "src_ip", "dst_ip", "rf_prediction__label", "rf_confidence", "if_anomaly_score")[:batch_size])
+        if not rows:
+            break
+        ids, src_ips, dst_ips, labels, rf_confidence, if_anomaly_score = zip(*rows)
+        benign = np.array([label == "Benign" for label in labels])
+        severities = np.clip(flow_severity_levels(benign, np.array(rf_confidence, dtype=float), np.array(if_anomaly_score, dtype=float)), 1, 5).astype(int).tolist()
+
+        for ip in set(src_ips + dst_ips) - internal.keys():
+            internal[ip] = is_internal_ip(ip)
+        with transaction.atomic():
+            new_ips = {ip for ip in src_ips + dst_ips if internal[ip]} - asset_ids.keys()
+            if new_ips:
+                asset_ids.update(internal_asset_ids(new_ips))
+
+            existing = set(ComputeAssetsNetworkDetection.objects.filter(mlnids_detection_id__gte=ids[0], mlnids_detection_id__lte=ids[-1])
+                           .values_list("mlnids_detection_id", "compute_assets_id"))
+            detections = []
+            for flow_id, src_ip, dst_ip, severity in zip(ids, src_ips, dst_ips, severities):
+                for ip in {src_ip, dst_ip}:
+                    if internal[ip] and (flow_id, asset_ids[ip]) not in existing:
+                        detections.append((flow_id, asset_ids[ip], severity))
+            if detections:
+                insert_rows(ComputeAssetsNetworkDetection, ["mlnids_detection", "compute_assets", "detection_severity"], detections)
+        last_id = ids[-1]
+    save_watermark(watermark, last_id=last_flow)
+
+def internal_asset_ids(ips):
+    """Compute asset id per IP (lowest id if stored more than once), creating missing assets in bulk."""
+    ips = list(ips)
+    found = {}
+    for start in range(0, len(ips), LOOKUP_BATCH_SIZE):
+        for asset_id, ip in ComputeAssets.objects.filter(ip_address__in=ips[start:start + LOOKUP_BATCH_SIZE]).order_by("-id").values_list("id", "ip_address"):
+            found[ip] = asset_id
+    missing = [ComputeAssets(ip_address=ip) for ip in ips if ip not in found]
+    ComputeAssets.objects.bulk_create(missing, batch_size=BULK_BATCH_SIZE)
+    found.update((asset.ip_address, asset.id) for asset in missing)
+    return found
+
+def port_cpe(cpe, service_version):
+    """(vendor, product, version) of a port from its nmap CPE, None without a usable CPE."""
+    try:
+        type, vendor, product, version, update, edition, language = parse_cpe_info(cpe)
+    except ValueError:
+        return None
+    if product is None:
+        return None
+    return vendor, product, asset_cpe_version(version, update, service_version)
+
+def match_ports_cves(network_ports, cveitems=None):
+    """Links ports to the CVEs whose CPE index entries match their vendor, product and version.
+
+    Ports are grouped by their distinct (vendor, product, version); every tuple is resolved
+    once (cached across runs while the CVE data is unchanged when matching against all CVEs)
+    and the results are fanned out to the assets with bulk inserts.
+    Returns the number of new asset CVE links.
+    """
+    assets_by_cpe = {}
+    for asset_id, cpe, service_version in network_ports.values_list("asset_id", "cpe", "version").iterator(chunk_size=10000):
+        key = port_cpe(cpe, service_version)
+        if key is not None:
+            assets_by_cpe.setdefault(key, set()).add(asset_id)
+
+    data_version = cve_data_version() if cveitems is None else None
+    links = set()
+    for key, asset_ids in assets_by_cpe.items():
+        cve_ids = cached_match_cpe(*key, data_version) if cveitems is None else match_cpe(*key, cves=cveitems)
+        links.update((asset_id, cve_id) for asset_id in asset_ids for cve_id in cve_ids)
+    if not links:
+        return 0
+
+    asset_ids = sorted({asset_id for asset_id, _ in links})
+    existing = set()
+    for start in range(0, len(asset_ids), LOOKUP_BATCH_SIZE):
+        existing.update(ComputeAssetsCVE.objects.filter(compute_assets_id__in=asset_ids[start:start + LOOKUP_BATCH_SIZE]).values_list("compute_assets_id", "cve_id"))
+    new_links = [ComputeAssetsCVE(compute_assets_id=asset_id, cve_id=cve_id) for asset_id, cve_id in sorted(links - existing)]
+    with transaction.atomic():
+        ComputeAssetsCVE.objects.bulk_create(new_links, batch_size=BULK_BATCH_SIZE)
+    return len(new_links)
+
+def gather_assets_cve_infos(full=False):
+    # Ports of assets reported by a new scan are matched against all CVEs,
+    # all other ports only against the CVEs stored since the last run. By ingest time, not NVD's
+    # lastModified: a retried or still running yearly feed stores CVEs with older lastModified values.
+    scan_watermark = get_watermark("nmapscan_cve")
+    cve_watermark = get_watermark("cve_ingest")
+    last_scan = last_complete_scan_id()
+    last_ingested = CveItem.objects.aggregate(last=Max("ingested_at"))["last"]
+    network_ports = ComputeAssetsNetworkPorts.objects.all()
+    if full:
+        match_ports_cves(network_ports)
+    else:
+        rescanned = Q(asset__nmap_asset__added_by_scan_id__gt=scan_watermark.last_id, asset__nmap_asset__added_by_scan_id__lte=last_scan)
+        match_ports_cves(network_ports.filter(rescanned))
+        if last_ingested and (cve_watermark.last_modified is None or last_ingested > cve_watermark.last_modified):
+            changed_cves = CveItem.objects.filter(ingested_at__lte=last_ingested)
+            if cve_watermark.last_modified is not None:
+                # Overlap: a CVE batch stamped just before the watermark may commit after this run read it
+                changed_cves = changed_cves.filter(ingested_at__gt=cve_watermark.last_modified - CVE_INGEST_OVERLAP)
+            match_ports_cves(network_ports.exclude(rescanned), changed_cves)
+    save_watermark(scan_watermark, last_id=last_scan)
+    save_watermark(cve_watermark, last_modified=last_ingested)
+
+def gather_all(full=False, progress=None):
+    steps = [('Assets', gather_nmap_assets_infos), ('Detections', gather_mlnids_assets_info), ('CVEs', gather_assets_cve_infos)]
+    for number, (name, gather) in enumerate(steps):
+        if progress:
+            progress(number, len(steps), name)
+        gather(full)
 
+# --- CVE Queries ---
+def recent_asset_cves(days=7, severities=('CRITICAL',)):
+    """CVE links of assets whose CVE was published within the last days with one of the severities, newest first (uses the CveItem severity/published index)."""
+    since = timezone.now() - timedelta(days=days)
+    return (ComputeAssetsCVE.objects.filter(cve__severity__in=severities, cve__published__gte=since)
+            .select_related('compute_assets', 'cve').defer(*[f'cve__{field}' for field in LIST_DEFERRED_FIELDS]).order_by('-cve__published'))
@@ -0,0 +1,63 @@
+import ipaddress
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from assets.assetsoperations import correlate_nmap_assets
+from assets.models import ComputeAssets
+from nmapapp.models import NmapAssets, Nmapscan
+
+BENCHMARK_SCAN_IP = "benchmark" # Nmapscan.ip of the generated scan, removed with its assets unless --keep
+BENCHMARK_FIRST_HOST = ipaddress.ip_address("100.64.0.1") # Shared address space, not used by real scans
+SERVICES = [("ssh", "OpenSSH", "8.9p1", "cpe:/a:openbsd:openssh:8.9p1"), ("http", "nginx", "1.24.0", "cpe:/a:nginx:nginx:1.24.0"),
+            ("https", "Apache httpd", "2.4.58", "cpe:/a:apache:http_server:2.4.58"), ("mysql", "MySQL", "8.0.36", "cpe:/a:mysql:mysql:8.0.36")]
+
+def host_json(ip_address, ports, variant=0):
+    """Nmap host result (as stored by nmapops) with the given number of open TCP ports."""
+    tcp = {}
+    for i in range(ports):
+        name, product, version, cpe = SERVICES[(i + variant) % len(SERVICES)]
+        tcp[str(1000 + i)] = {"state": "open", "name": name, "product": product, "version": version, "extrainfo": "", "cpe": cpe}
+    return json.dumps({"addresses": {"ipv4": ip_address}, "hostnames": [], "tcp": tcp})
+
+class Command(BaseCommand):
+    help = "Times gather_nmap_assets_infos' correlation on synthetic nmap results (default 50,000 hosts x 20 ports). Use a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hosts", type=int, default=50000, help="Synthetic hosts. Default: 50,000")
+        parser.add_argument("--ports", type=int, default=20, help="Open ports per host. Default: 20")
+        parser.add_argument("--changed", type=float, default=0.1, help="Share of hosts whose services change before the third run. Default: 0.1")
+        parser.add_argument("--keep", action='store_true', help="Keep the generated scan, nmap assets and compute assets.")
+
+    def handle(self, *args, **options):
+        if options['hosts'] <= 0 or options['ports'] < 0 or not 0 <= options['changed'] <= 1:
+            raise CommandError("hosts must be positive, ports non-negative and changed between 0 and 1.")
+        if Nmapscan.objects.filter(ip=BENCHMARK_SCAN_IP).exists():
+            raise CommandError("A benchmark scan already exists, delete it first.")
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            scan = Nmapscan.objects.create(data="[]", ip=BENCHMARK_SCAN_IP, parameters="benchmark")
+            ips = [str(BENCHMARK_FIRST_HOST + i) for i in range(options['hosts'])]
+            NmapAssets.objects.bulk_create([NmapAssets(ip_address=ip, hostname="", added_by_scan=scan, json_data=host_json(ip, options['ports'])) for ip in ips], batch_size=1000)
+        self.stdout.write(f"Generated {len(ips):,} nmap assets in {time.perf_counter() - start:.1f}s.")
+
+        nmapassets = NmapAssets.objects.filter(added_by_scan=scan)
+        self.run("initial", nmapassets)
+        self.run("unchanged", nmapassets)
+        changed = list(nmapassets.order_by('id')[:int(len(ips) * options['changed'])])
+        for asset in changed:
+            asset.json_data = host_json(asset.ip_address, options['ports'], variant=1)
+        NmapAssets.objects.bulk_update(changed, ["json_data"], batch_size=1000)
+        self.run(f"{options['changed']:.0%} changed", nmapassets)
+
+        if not options['keep']:
+            ComputeAssets.objects.filter(nmap_asset__added_by_scan=scan).delete()
+            scan.delete()
+
+    def run(self, name, nmapassets):
+        start = time.perf_counter()
+        result = correlate_nmap_assets(nmapassets)
+        self.stdout.write(f"{name:<12} {time.perf_counter() - start:>8.2f}s {result}")
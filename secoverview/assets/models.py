@@ -29,6 +29,12 @@ class ComputeAssetsNetworkPorts(models.Model):
     detection_severity = models.IntegerField(choices=[(1, 'Negligible'), (2, 'Low'), (3, 'Medium'), (4, 'High'), (5, 'Critical')], default=1)
     asset = models.ForeignKey(ComputeAssets, on_delete=models.CASCADE)
 
+    class Meta:
+        # One row per asset and port, the asset correlation upserts on it
+        constraints = [
+            models.UniqueConstraint(fields=['asset', 'port_number'], name='unique_compute_asset_port'),
+        ]
+
     def __str__(self):
         return str(f"Port: {self.port_number}, Service: {self.service}, Product: {self.product}, Version: {self.version}, Extra Info: {self.extrainfo}, CPE: {self.cpe}, detection severity: {self.detection_severity}")
 
@@ -43,4 +49,14 @@ class ComputeAssetsNetworkDetection(models.Model):
 class ComputeAssetsCVE(models.Model):
     compute_assets = models.ForeignKey(ComputeAssets, on_delete=models.CASCADE)
     cve = models.ForeignKey(CveItem, on_delete=models.CASCADE)
-    detected_date = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    detected_date = models.DateTimeField(auto_now_add=True)
+
+class GatherWatermark(models.Model):
+    # Progress of the incremental gather steps: last processed id (Nmapscan, NetworkFlow) or CveItem.ingested_at
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: id {self.last_id}, last modified {self.last_modified or '-'}"
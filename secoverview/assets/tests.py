@@ -1,3 +1,40 @@
 from django.test import TestCase
 
-# Create your tests here.
+from cvedata.cve_ops import cve_record, upsert_cve_records
+from .assetsoperations import gather_assets_cve_infos
+from .models import ComputeAssets, ComputeAssetsCVE, ComputeAssetsNetworkPorts
+
+def openssh_cve(cve_id, last_modified, version="8.9p1"):
+    """CveItem record of an NVD entry affecting OpenSSH at version."""
+    criteria = f"cpe:2.3:a:openbsd:openssh:{version[:-2]}:{version[-2:]}:*:*:*:*:*:*"
+    return cve_record({"cve": {"id": cve_id, "sourceIdentifier": "cve@mitre.org", "published": "2020-01-01T00:00:00.000",
+                               "lastModified": last_modified, "vulnStatus": "Analyzed", "descriptions": [], "metrics": {},
+                               "weaknesses": [], "references": [],
+                               "configurations": [{"nodes": [{"operator": "OR", "cpeMatch": [{"vulnerable": True, "criteria": criteria}]}]}]}})
+
+class CveGatherTests(TestCase):
+    def setUp(self):
+        asset = ComputeAssets.objects.create(ip_address="192.0.2.1")
+        ComputeAssetsNetworkPorts.objects.create(asset=asset, port_number=22, service="ssh", product="OpenSSH", version="8.9p1", cpe="cpe:/a:openbsd:openssh:8.9p1")
+
+    def linked(self):
+        return set(ComputeAssetsCVE.objects.values_list("cve_id", flat=True))
+
+    def test_new_cve_is_matched_against_known_ports(self):
+        gather_assets_cve_infos()
+        upsert_cve_records([openssh_cve("CVE-2024-0001", "2024-06-01T00:00:00.000")])
+        gather_assets_cve_infos()
+        self.assertEqual(self.linked(), {"CVE-2024-0001"})
+
+    def test_cve_with_older_last_modified_stored_later_is_matched(self):
+        # E.g. a yearly feed retried or still loading after the delta feed was applied
+        upsert_cve_records([openssh_cve("CVE-2024-0001", "2024-06-01T00:00:00.000")])
+        gather_assets_cve_infos()
+        upsert_cve_records([openssh_cve("CVE-2019-0001", "2019-01-01T00:00:00.000")])
+        gather_assets_cve_infos()
+        self.assertEqual(self.linked(), {"CVE-2024-0001", "CVE-2019-0001"})
+
+    def test_unaffected_version_is_not_linked(self):
+        upsert_cve_records([openssh_cve("CVE-2024-0002", "2024-06-01T00:00:00.000", version="9.6p1")])
+        gather_assets_cve_infos()
+        self.assertEqual(self.linked(), set())
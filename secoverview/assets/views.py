@@ -4,20 +4,25 @@ from django.core.paginator import Paginator
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from datetime import datetime
-from .assetsoperations import gather_all, gather_nmap_assets_infos, gather_mlnids_assets_info
+from django.urls import reverse
+from jobs.jobops import enqueue_job
 from .models import ComputeAssets, ComputeAssetsNetworkPorts, ComputeAssetsNetworkDetection, ComputeAssetsCVE
+from cvedata.search_ops import LIST_DEFERRED_FIELDS
 
 @login_required
 def assetsoverview(request):
     """Renders the about page."""
     assert isinstance(request, HttpRequest)
     if request.method == 'POST':
-        if request.POST.get('update_action') == 'updateall':
-            gather_all()
-        elif request.POST.get('update_action') == 'updateassets':
-            gather_nmap_assets_infos()
-        elif request.POST.get('update_action') == 'updatedetection':
-            gather_mlnids_assets_info()
+        update_actions = {
+            'updateall': ('assets.assetsoperations.gather_all', 'Update assets and detections'),
+            'updateassets': ('assets.assetsoperations.gather_nmap_assets_infos', 'Update assets'),
+            'updatedetection': ('assets.assetsoperations.gather_mlnids_assets_info', 'Update detections'),
+        }
+        if request.POST.get('update_action') in update_actions:
+            task, label = update_actions[request.POST.get('update_action')]
+            job = enqueue_job(task, label, request.user, next_url=reverse('assetsoverview'))
+            return redirect('jobview', id=job.id)
 
     query = request.GET.get("search")
     if query == None or query == "":
@@ -46,7 +51,7 @@ def assetview(request, id):
     asset = ComputeAssets.objects.get(id=id)
     ports = ComputeAssetsNetworkPorts.objects.filter(asset=asset)
     network_detection = ComputeAssetsNetworkDetection.objects.filter(compute_assets=asset)
-    cves = ComputeAssetsCVE.objects.filter(compute_assets=asset)
+    cves = ComputeAssetsCVE.objects.filter(compute_assets=asset).select_related('cve').defer(*[f'cve__{field}' for field in LIST_DEFERRED_FIELDS]).order_by('-cve__base_score', '-cve__published')
     contextstring = f"This Asset {(asset.context_string() if asset != None else 'No information available')} and the following ports detected: {ports} and the following network detections: {network_detection}"
     return render(
         request,
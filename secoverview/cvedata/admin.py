@@ -1,11 +1,45 @@
 from django.contrib import admin
-from .models import CveItem
+from .models import CveItem, CveCpeMatch, CveFeed, CveWeakness
 
 @admin.register(CveItem)
 class IpcheckbgpviewAdmin(admin.ModelAdmin):
     list_display = [
         'cve_id',
         'vuln_status', 
+        'severity',
+        'base_score',
+        'published',
     ]
     search_fields = ['cve_id']
-    list_filter = ['vuln_status']
\ No newline at end of file
+    list_filter = ['vuln_status', 'severity']
+
+@admin.register(CveWeakness)
+class CveWeaknessAdmin(admin.ModelAdmin):
+    list_display = [
+        'cve',
+        'cwe_id',
+    ]
+    search_fields = ['cve__cve_id', 'cwe_id']
+
+@admin.register(CveCpeMatch)
+class CveCpeMatchAdmin(admin.ModelAdmin):
+    list_display = [
+        'cve',
+        'vendor',
+        'product',
+        'version',
+        'version_start_including',
+        'version_end_excluding',
+    ]
+    search_fields = ['cve__cve_id', 'vendor', 'product']
+    list_filter = ['part']
+
+@admin.register(CveFeed)
+class CveFeedAdmin(admin.ModelAdmin):
+    list_display = [
+        'name',
+        'cves',
+        'last_synced',
+        'last_applied',
+    ]
+    search_fields = ['name']
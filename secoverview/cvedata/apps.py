@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CvedataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cvedata'
+
+    def ready(self):
+        from .search_ops import create_search_index
+        post_migrate.connect(create_search_index, sender=self)
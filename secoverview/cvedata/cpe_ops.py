@@ -0,0 +1,160 @@
+from django.db import transaction
+from django.db.models import Count, Max
+from .models import CveItem, CveCpeMatch
+from functools import lru_cache
+import re
+
+CPE_INDEX_BATCH_SIZE = 1000 # CVEs per transaction when rebuilding the index
+ANY_VERSION = ('*', '-', '')
+# Index column -> cpeMatch key of a version range bound
+RANGE_FIELDS = {
+    'version_start_including': 'versionStartIncluding',
+    'version_start_excluding': 'versionStartExcluding',
+    'version_end_including': 'versionEndIncluding',
+    'version_end_excluding': 'versionEndExcluding',
+}
+PRE_RELEASE = ('alpha', 'beta', 'rc', 'pre', 'dev')
+CPE_CACHE_SIZE = 8192 # Resolved (vendor, product, version) tuples kept between matching runs
+
+# --- CPE Parsing ---
+def split_cpe23(criteria):
+    """Splits a CPE 2.3 formatted string (cpe:2.3:part:vendor:product:version:update:...) at unescaped colons."""
+    return [part.replace('\\', '') for part in re.split(r'(?<!\\):', criteria)]
+
+def cve_cpe_matches(cve_id, configurations):
+    """CveCpeMatch rows for the vulnerable cpeMatch entries of a CVE's configurations (NVD 2.0 layout)."""
+    matches = []
+    for configuration in configurations or []:
+        for node in configuration.get('nodes', []):
+            if node.get('negate'):
+                continue
+            for cpe_match in node.get('cpeMatch', []):
+                if not cpe_match.get('vulnerable'):
+                    continue
+                parts = split_cpe23(cpe_match.get('criteria', ''))
+                if len(parts) < 6 or parts[0] != 'cpe' or parts[1] != '2.3':
+                    continue
+                matches.append(CveCpeMatch(
+                    cve_id=cve_id,
+                    part=parts[2][:1],
+                    vendor=parts[3][:255],
+                    product=parts[4][:255],
+                    version=parts[5][:100],
+                    version_update=(parts[6] if len(parts) > 6 and parts[6] not in ANY_VERSION else '')[:100],
+                    **{field: cpe_match.get(key, '')[:100] for field, key in RANGE_FIELDS.items()},
+                ))
+    return matches
+
+# --- Index Maintenance ---
+def index_cve_cpes(cve_ids_configurations):
+    """Replaces the CPE index rows of the given (cve_id, configurations) pairs. Call inside the ingest transaction."""
+    cve_ids = [cve_id for cve_id, _ in cve_ids_configurations]
+    for start in range(0, len(cve_ids), 500):
+        CveCpeMatch.objects.filter(cve_id__in=cve_ids[start:start + 500]).delete()
+    matches = []
+    for cve_id, configurations in cve_ids_configurations:
+        matches.extend(cve_cpe_matches(cve_id, configurations))
+    CveCpeMatch.objects.bulk_create(matches, batch_size=CPE_INDEX_BATCH_SIZE)
+    return len(matches)
+
+def rebuild_cpe_index(batch_size=CPE_INDEX_BATCH_SIZE):
+    """Extracts the CPE index of every stored CVE (once after upgrading, or to repair the index)."""
+    total = 0
+    cves = CveItem.objects.order_by('cve_id').values_list('cve_id', 'configurations')
+    last_id = ''
+    while True:
+        batch = list(cves.filter(cve_id__gt=last_id)[:batch_size])
+        if not batch:
+            return total
+        with transaction.atomic():
+            total += index_cve_cpes(batch)
+        last_id = batch[-1][0]
+
+# --- Version Comparison ---
+def version_key(version):
+    """Sortable key of a version string: numbers compare numerically, pre-release tags sort before the release."""
+    key = []
+    for token in re.findall(r'\d+|[a-z]+', version.lower()):
+        if token.isdigit():
+            key.append((2, int(token), ''))
+        elif token in PRE_RELEASE:
+            key.append((0, 0, token))
+        else:
+            key.append((1, 0, token))
+    return key
+
+def compare_versions(a, b):
+    """-1, 0 or 1. Missing trailing parts count as 0 against numbers, so 1.0 == 1.0.0 and 1.0rc1 < 1.0 < 1.0p1 < 1.0.1."""
+    key_a, key_b = version_key(a), version_key(b)
+    for i in range(max(len(key_a), len(key_b))):
+        token_a = key_a[i] if i < len(key_a) else None
+        token_b = key_b[i] if i < len(key_b) else None
+        if token_a is None:
+            token_a = (2, 0, '') if token_b[0] == 2 else (1, 0, '')
+        if token_b is None:
+            token_b = (2, 0, '') if token_a[0] == 2 else (1, 0, '')
+        if token_a != token_b:
+            return 1 if token_a > token_b else -1
+    return 0
+
+def version_matches(match, version):
+    """Whether an asset version is affected by an index row (exact version or version range)."""
+    if any(getattr(match, field) for field in RANGE_FIELDS):
+        if not version:
+            return False # Unknown version, a range would only produce false positives
+        return ((not match.version_start_including or compare_versions(version, match.version_start_including) >= 0)
+                and (not match.version_start_excluding or compare_versions(version, match.version_start_excluding) > 0)
+                and (not match.version_end_including or compare_versions(version, match.version_end_including) <= 0)
+                and (not match.version_end_excluding or compare_versions(version, match.version_end_excluding) < 0))
+    if match.version in ANY_VERSION:
+        return True
+    if not version:
+        return False
+    return compare_versions(version, match.version + match.version_update) == 0
+
+# --- Matching ---
+def asset_cpe_version(cpe_version, cpe_update, service_version):
+    """Version of an asset's service: from its CPE (2.2 URI, version and update) or the first token of nmap's version."""
+    if cpe_version:
+        return cpe_version + (cpe_update or '')
+    if service_version:
+        return service_version.split()[0]
+    return None
+
+def match_cpe(vendor, product, version, cves=None):
+    """CVE ids affecting vendor:product at version, from the CPE index.
+
+    Candidates are found by the indexed (vendor, product) columns, the version is then
+    compared against the exact versions and ranges. Nmap's CPE dictionary lags behind NVD
+    vendor renames (e.g. igor_sysoev -> f5 for nginx), so when the vendor has no entries
+    for the product the product alone is used. cves optionally restricts the result to a
+    CveItem queryset (e.g. recently modified CVEs).
+    """
+    if not product:
+        return set()
+    candidates = CveCpeMatch.objects.filter(product=product.lower())
+    if vendor and candidates.filter(vendor=vendor.lower()).exists():
+        candidates = candidates.filter(vendor=vendor.lower())
+    if cves is not None:
+        candidates = candidates.filter(cve__in=cves.values('cve_id'))
+    return {match.cve_id for match in candidates.only('cve_id', 'version', 'version_update', *RANGE_FIELDS) if version_matches(match, version)}
+
+# --- Cached Matching ---
+def cve_data_version():
+    """Changes whenever CVEs are added or modified; part of the cache key of resolved CPEs."""
+    state = CveItem.objects.aggregate(ingested_at=Max('ingested_at'), count=Count('cve_id'))
+    return state['ingested_at'], state['count']
+
+@lru_cache(maxsize=CPE_CACHE_SIZE)
+def _cached_match_cpe(vendor, product, version, data_version):
+    return frozenset(match_cpe(vendor, product, version))
+
+_cached_data_version = None
+
+def cached_match_cpe(vendor, product, version, data_version):
+    """match_cpe against all CVEs, cached across runs until the CVE data changes (data_version from cve_data_version)."""
+    global _cached_data_version
+    if data_version != _cached_data_version: # CVE update: drop results of the old data
+        _cached_match_cpe.cache_clear()
+        _cached_data_version = data_version
+    return _cached_match_cpe(vendor, product, version, data_version)
@@ -1,64 +1,251 @@
+import codecs
+import hashlib
 import json
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import tempfile
 import zipfile
-import io
-from .models import CveItem
+from .models import CveItem, CveFeed, CveWeakness
+from .cpe_ops import index_cve_cpes
+from .search_ops import index_cve_search
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-def download_and_extract_cve_zips(start_year=2002, end_year=None, download_dir='./cvedata/cve_data'):
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+CVE_BATCH_SIZE = 1000 # CVEs per bulk upsert and transaction
+STREAM_CHUNK_SIZE = 1024 * 1024 # Bytes read per step when streaming a feed without ijson
+NVD_FIRST_YEAR = 2002
+DELTA_FEEDS = ['modified', 'recent'] # Applied after the yearly feeds on every sync
+MODIFIED_FEED_DAYS = 8 # The modified feed holds the CVEs changed during the last 8 days
+FEED_TIMEOUT = 60 # Seconds without data before a feed download fails
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+FEED_DOWNLOAD_WORKERS = 4 # Concurrent feed downloads; NVD throttles clients opening many more connections
+CVE_SUMMARY_FIELDS = ['base_score', 'severity', 'cvss_v3_score', 'cvss_v4_score', 'description']
+CVE_UPDATE_FIELDS = ['source_identifier', 'published', 'last_modified', 'vuln_status', 'descriptions', 'metrics', 'weaknesses', 'configurations', 'references', 'ingested_at'] + CVE_SUMMARY_FIELDS
+CVSS_METRICS = ['cvssMetricV40', 'cvssMetricV31', 'cvssMetricV30', 'cvssMetricV2'] # Newest CVSS version first
+
+def download_and_extract_cve_zips(start_year=2002, end_year=None, download_dir='./cvedata/cve_data', base_url=None, workers=FEED_DOWNLOAD_WORKERS):
     """
     Download and unzip all NVD CVE JSON zip files from start_year up to end_year (inclusive).
     Files are saved/unzipped into download_dir. Yearly Zip-Files are created once a day at midnight.
+    The zips are downloaded concurrently into temp files and extracted from disk.
     """
     if end_year is None:
         end_year = datetime.now().year
+    base_url = base_url or settings.NVD_FEED_URL
 
     dest_path = Path(download_dir)
     dest_path.mkdir(parents=True, exist_ok=True)
 
-    for year in range(start_year, end_year + 1):
-        zip_filename = f"nvdcve-2.0-{year}.json.zip"
-        url = f"https://nvd.nist.gov/feeds/json/cve/2.0/{zip_filename}"
-        print(f"Downloading {url}...")
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            print(f"Extracting {zip_filename}...")
-            with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
-                zf.extractall(dest_path)
+    downloads = [(str(year), feed_url(str(year), base_url), None) for year in range(start_year, end_year + 1)]
+    with feed_session(workers) as session:
+        for year, future in download_feeds(session, downloads, workers):
+            try:
+                file, _ = future.result()
+            except Exception as e:
+                print(f"Failed to download {feed_url(year, base_url)}: {e}")
+                continue
+            with file:
+                with zipfile.ZipFile(file) as zf:
+                    zf.extractall(dest_path)
             print(f"Saved JSON for {year} to {download_dir}")
-        else:
-            print(f"Failed to download {zip_filename}: HTTP {response.status_code}")
 
-def load_cve_data(file_path):
+def iter_json_array(file, key, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields the items of the top level array `key` of a JSON document one at a time.
+
+    Only the current item and one read chunk are held in memory. Uses ijson when it is
+    installed, otherwise decodes the items incrementally with json.JSONDecoder.raw_decode.
+    """
+    if IJSON_AVAILABLE:
+        yield from ijson.items(file, f'{key}.item', use_float=True)
+        return
+
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')() # A chunk may end inside a multi-byte character
+    marker = f'"{key}"'
+    buffer, pos, eof = '', 0, False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk, final=eof)
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    # Seek to the opening bracket of the array
+    while True:
+        index = buffer.find(marker, pos)
+        if index >= 0:
+            pos = index + len(marker)
+            break
+        if eof:
+            return
+        pos = max(pos, len(buffer) - len(marker))
+        read_more()
+    while True:
+        index = buffer.find('[', pos)
+        if index >= 0:
+            pos = index + 1
+            break
+        if eof:
+            raise ValueError(f"Array '{key}' is not closed.")
+        pos = len(buffer)
+        read_more()
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            read_more() # Item continues in the next chunk
+            continue
+        pos = end
+        yield item
+
+def nvd_datetime(value):
+    """Timezone aware datetime of an NVD timestamp (2024-01-01T00:00:00.000, UTC without offset)."""
+    parsed = parse_datetime(value) if value else None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+def primary_metric(metrics, keys):
+    """First metric of the first present CVSS version in keys, preferring the primary (NVD) score. None when unscored."""
+    for key in keys:
+        entries = (metrics or {}).get(key) or []
+        if entries:
+            return next((entry for entry in entries if entry.get('type') == 'Primary'), entries[0])
+    return None
+
+def metric_score(metric):
+    return float(metric.get('cvssData', {}).get('baseScore') or 0) if metric else None
+
+def cve_summary(record):
+    """Summary column values (scores, severity, English description) of a CVE's metrics and descriptions."""
+    metric = primary_metric(record['metrics'], CVSS_METRICS)
+    # CVSS v2 keeps the severity next to cvssData
+    severity = (metric.get('cvssData', {}).get('baseSeverity') or metric.get('baseSeverity') or '').upper() if metric else ''
+    return {
+        'base_score': metric_score(metric) or 0.0,
+        'severity': severity,
+        'cvss_v3_score': metric_score(primary_metric(record['metrics'], ['cvssMetricV31', 'cvssMetricV30'])),
+        'cvss_v4_score': metric_score(primary_metric(record['metrics'], ['cvssMetricV40'])),
+        'description': (record['descriptions'] or {}).get('en', ''),
+    }
+
+def cve_cwe_ids(weaknesses):
+    """CWE ids (CWE-79, NVD-CWE-noinfo, ...) of the stored weaknesses, without duplicates."""
+    values = [description.get('value', '') for group in weaknesses or [] for description in group]
+    return list(dict.fromkeys(value[:32] for value in values if 'CWE-' in value))
+
+def cve_record(vuln):
+    """CveItem field values of one NVD 2.0 `vulnerabilities` entry."""
+    cve = vuln.get('cve', {})
+    record = {
+        'cve_id': cve.get('id'),
+        'source_identifier': cve.get('sourceIdentifier'),
+        'published': nvd_datetime(cve.get('published')),
+        'last_modified': nvd_datetime(cve.get('lastModified')),
+        'vuln_status': cve.get('vulnStatus'),
+        'descriptions': {d['lang']: d['value'] for d in cve.get('descriptions', [])},
+        'metrics': cve.get('metrics', {}),
+        'weaknesses': [w.get('description', []) for w in cve.get('weaknesses', [])],
+        'configurations':  cve.get('configurations', {}),
+        'references': [{ 'url': r.get('url'), 'source': r.get('source') } for r in cve.get('references', [])],
+    }
+    record.update(cve_summary(record))
+    return record
+
+def index_cve_weaknesses(cve_ids_weaknesses):
+    """Replaces the CveWeakness rows of the given (cve_id, weaknesses) pairs. Call inside the ingest transaction."""
+    cve_ids = [cve_id for cve_id, _ in cve_ids_weaknesses]
+    for start in range(0, len(cve_ids), 500):
+        CveWeakness.objects.filter(cve_id__in=cve_ids[start:start + 500]).delete()
+    CveWeakness.objects.bulk_create([CveWeakness(cve_id=cve_id, cwe_id=cwe_id) for cve_id, weaknesses in cve_ids_weaknesses for cwe_id in cve_cwe_ids(weaknesses)],
+                                    batch_size=CVE_BATCH_SIZE)
+
+def upsert_cve_records(records):
+    """Inserts or updates CveItems (one bulk upsert) and rebuilds their CPE, CWE and full-text index, in one transaction."""
+    records = list({record['cve_id']: record for record in records}.values()) # A CVE may only be upserted once per statement
+    with transaction.atomic():
+        CveItem.objects.bulk_create([CveItem(**record) for record in records], batch_size=CVE_BATCH_SIZE,
+                                    update_conflicts=True, unique_fields=['cve_id'], update_fields=CVE_UPDATE_FIELDS)
+        index_cve_cpes([(record['cve_id'], record['configurations']) for record in records])
+        index_cve_weaknesses([(record['cve_id'], record['weaknesses']) for record in records])
+        index_cve_search(records)
+    return len(records)
+
+def is_newer(last_modified, other):
+    return other is None or (last_modified is not None and last_modified > other)
+
+def newer_cve_records(records):
+    """The records whose lastModified advanced past the stored CVE (or that are not stored yet)."""
+    latest = {}
+    for record in records:
+        current = latest.get(record['cve_id'])
+        if current is None or is_newer(record['last_modified'], current['last_modified']):
+            latest[record['cve_id']] = record
+    cve_ids = list(latest)
+    stored = {}
+    for start in range(0, len(cve_ids), 500):
+        stored.update(CveItem.objects.filter(cve_id__in=cve_ids[start:start + 500]).values_list('cve_id', 'last_modified'))
+    return [record for cve_id, record in latest.items()
+            if cve_id not in stored or is_newer(record['last_modified'], stored[cve_id])]
+
+def load_cve_stream(file, batch_size=CVE_BATCH_SIZE, only_newer=False):
+    """Upserts the CVEs of an open NVD JSON feed in batches; with only_newer unchanged CVEs are not written."""
+    total = 0
+    batch = []
+
+    def flush(batch):
+        if only_newer:
+            batch = newer_cve_records(batch)
+        return upsert_cve_records(batch) if batch else 0
+
+    for vuln in iter_json_array(file, 'vulnerabilities'):
+        batch.append(cve_record(vuln))
+        if len(batch) >= batch_size:
+            total += flush(batch)
+            batch = []
+    if batch:
+        total += flush(batch)
+    return total
+
+def load_cve_data(file_path, batch_size=CVE_BATCH_SIZE, only_newer=False):
     """
     Load CVE data from NVDCVE JSON and populate the CveItem table.
+    The file is parsed as a stream and upserted in batches of batch_size CVEs.
     Usage: load_cve_data('/path/to/nvdcve-2.0-recent.json')
     """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    for vuln in data.get('vulnerabilities', []):
-        cve = vuln.get('cve', {})
-        item, created = CveItem.objects.update_or_create(
-            cve_id=cve.get('id'),
-            defaults={
-                'source_identifier': cve.get('sourceIdentifier'),
-                'published': cve.get('published'),
-                'last_modified': cve.get('lastModified'),
-                'vuln_status': cve.get('vulnStatus'),
-                'descriptions': {d['lang']: d['value'] for d in cve.get('descriptions', [])},
-                'metrics': cve.get('metrics', {}),
-                'weaknesses': [w.get('description', []) for w in cve.get('weaknesses', [])],
-                'configurations':  cve.get('configurations', {}),
-                'references': [{ 'url': r.get('url'), 'source': r.get('source') } for r in cve.get('references', [])],
-            }
-        )
-        #if created:
-        #    print(f"Created CVE record {item.cve_id}")
-        #else:
-        #    print(f"Updated CVE record {item.cve_id}")
-#
+    with open(file_path, 'rb') as f:
+        return load_cve_stream(f, batch_size, only_newer)
+
+def load_cve_zip(file, only_newer=False):
+    """Loads the JSON feeds inside a downloaded feed zip without extracting them to disk."""
+    total = 0
+    with zipfile.ZipFile(file) as zf:
+        for member in zf.namelist():
+            if member.endswith('.json'):
+                with zf.open(member) as f:
+                    total += load_cve_stream(f, only_newer=only_newer)
+    return total
+
 def load_all_cve_data(directory_path='./cvedata/cve_data'):
     """
     Iterate through all JSON files in the given directory and load each into the database.
@@ -69,7 +256,139 @@ def load_all_cve_data(directory_path='./cvedata/cve_data'):
         print(f"Processing {path}")
         load_cve_data(str(path))
 
-def get_load_all_cve_data():
-    download_and_extract_cve_zips()
-    load_all_cve_data()
+def refresh_cve_summaries(batch_size=CVE_BATCH_SIZE):
+    """Recomputes the summary columns and CWE rows of all stored CVEs from their JSON, e.g. after upgrading."""
+    total = 0
+    cves = CveItem.objects.order_by('cve_id').only('cve_id', 'metrics', 'descriptions', 'weaknesses')
+    last_id = ''
+    while True:
+        batch = list(cves.filter(cve_id__gt=last_id)[:batch_size])
+        if not batch:
+            return total
+        with transaction.atomic():
+            for cve in batch:
+                for field, value in cve_summary({'metrics': cve.metrics, 'descriptions': cve.descriptions}).items():
+                    setattr(cve, field, value)
+            CveItem.objects.bulk_update(batch, CVE_SUMMARY_FIELDS, batch_size=100)
+            index_cve_weaknesses([(cve.cve_id, cve.weaknesses) for cve in batch])
+        total += len(batch)
+        last_id = batch[-1].cve_id
+
+# --- Incremental Sync ---
+def feed_url(name, base_url):
+    return f"{base_url.rstrip('/')}/nvdcve-2.0-{name}.json.zip"
+
+def feed_session(workers=FEED_DOWNLOAD_WORKERS):
+    """Session shared by the download threads, keeping one pooled connection per worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def fetch_feed(session, url, validators=None):
+    """
+    Downloads a feed zip into a temp file (runs in a download thread, no database access).
+    validators is the stored (ETag, Last-Modified) for a conditional request. Returns
+    (file, (ETag, Last-Modified, sha256)), or (None, None) when the server reports it unchanged.
+    """
+    headers = {}
+    if validators and validators[0]:
+        headers['If-None-Match'] = validators[0]
+    if validators and validators[1]:
+        headers['If-Modified-Since'] = validators[1]
+    file = tempfile.TemporaryFile()
+    try:
+        with session.get(url, headers=headers, stream=True, timeout=FEED_TIMEOUT) as response:
+            if response.status_code == 304:
+                file.close()
+                return None, None
+            response.raise_for_status()
+            digest = hashlib.sha256()
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                file.write(chunk)
+            file.seek(0)
+            return file, (response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''), digest.hexdigest())
+    except Exception:
+        file.close()
+        raise
+
+def download_feeds(session, downloads, workers=FEED_DOWNLOAD_WORKERS):
+    """
+    Downloads (name, url, validators) feeds with a bounded thread pool. Yields (name, future of
+    fetch_feed) in the given order, so the caller parses a feed while the next ones download.
+    The caller closes the returned files; files of feeds it did not consume are closed here.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='nvd-download') as pool:
+        futures = [(name, pool.submit(fetch_feed, session, url, validators)) for name, url, validators in downloads]
+        try:
+            for name, future in futures:
+                yield name, future
+        finally:
+            for _, future in futures:
+                if not future.cancel() and future.exception() is None and future.result()[0] is not None:
+                    future.result()[0].close()
+
+def apply_feed(feed, file, result, full=False):
+    """Upserts the changed CVEs of a downloaded feed unless its sha256 is unchanged and stores its validators. Returns (status, cves)."""
+    now = timezone.now()
+    if file is None or (not full and result[2] == feed.sha256):
+        feed.last_synced = now
+        feed.save(update_fields=['last_synced'])
+        return 'unchanged', 0
+    print(f"Loading feed {feed.name}...")
+    cves = load_cve_zip(file, only_newer=not full)
+    # The validators are only stored once the feed is applied, a failed load is retried on the next sync
+    feed.etag, feed.http_last_modified, feed.sha256 = result
+    feed.cves, feed.last_synced, feed.last_applied = cves, now, now
+    feed.save()
+    return 'updated', cves
+
+def yearly_feeds_due(full=False, now=None):
+    """Yearly feeds to check: all on a full sync or when the modified feed no longer covers the time since the last sync, otherwise only never loaded years."""
+    now = now or timezone.now()
+    years = [str(year) for year in range(NVD_FIRST_YEAR, now.year + 1)]
+    if full:
+        return years
+    modified = CveFeed.objects.filter(name='modified', last_synced__gt=now - timedelta(days=MODIFIED_FEED_DAYS)).exists()
+    if not modified:
+        return years
+    applied = set(CveFeed.objects.filter(name__in=years, last_applied__isnull=False).values_list('name', flat=True))
+    return [year for year in years if year not in applied]
+
+def sync_cve_feeds(full=False, base_url=None, workers=FEED_DOWNLOAD_WORKERS, progress=None):
+    """
+    Incremental NVD sync: the yearly feeds build the baseline, afterwards the modified and
+    recent feeds are applied as deltas. Unchanged feeds are skipped and only CVEs whose
+    lastModified advanced are written. full=True downloads and reloads every feed.
+    Feeds download concurrently while the already fetched ones are parsed in order.
+    Returns {feed name: (status, upserted CVEs)}. progress(current, total, message) is called per feed.
+    """
+    base_url = base_url or settings.NVD_FEED_URL
+    feeds = {}
+    for name in yearly_feeds_due(full) + DELTA_FEEDS:
+        feeds[name], _ = CveFeed.objects.get_or_create(name=name)
+    downloads = [(name, feed_url(name, base_url), None if full else (feed.etag, feed.http_last_modified)) for name, feed in feeds.items()]
+    results = {}
+    with feed_session(workers) as session:
+        for number, (name, future) in enumerate(download_feeds(session, downloads, workers)):
+            if progress:
+                progress(number, len(downloads), f"Feed {name}")
+            try:
+                file, result = future.result()
+                if file is None:
+                    results[name] = apply_feed(feeds[name], None, None, full)
+                    continue
+                with file:
+                    results[name] = apply_feed(feeds[name], file, result, full)
+            except Exception as e:
+                print(f"Failed to sync feed {name}: {e}")
+                results[name] = ('failed', 0)
+    print(f"CVE sync: {sum(cves for _, cves in results.values())} CVEs upserted, "
+          f"{sum(status == 'unchanged' for status, _ in results.values())} feeds unchanged, "
+          f"{sum(status == 'failed' for status, _ in results.values())} failed")
+    return results
 
+def get_load_all_cve_data(full=False, progress=None):
+    return sync_cve_feeds(full=full, progress=progress)
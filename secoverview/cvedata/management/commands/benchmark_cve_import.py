@@ -0,0 +1,84 @@
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cvedata.cve_ops import IJSON_AVAILABLE, load_cve_data
+from cvedata.models import CveItem, CveCpeMatch
+
+PRODUCTS = [("openbsd", "openssh"), ("nginx", "nginx"), ("apache", "http_server"), ("mysql", "mysql"), ("microsoft", "windows_10"), ("linux", "linux_kernel")]
+
+def synthetic_cve(rng, year, number):
+    """One NVD 2.0 `vulnerabilities` entry with the size and layout of a typical analysed CVE."""
+    vendor, product = rng.choice(PRODUCTS)
+    major, minor = rng.randint(1, 9), rng.randint(0, 20)
+    return {"cve": {
+        "id": f"CVE-{year}-{number:05d}",
+        "sourceIdentifier": "cve@mitre.org",
+        "published": f"{year}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T12:00:00.000",
+        "lastModified": f"{year}-1{rng.randint(0, 2)}-2{rng.randint(0, 8)}T12:00:00.000",
+        "vulnStatus": "Analyzed",
+        "descriptions": [{"lang": "en", "value": f"Buffer overflow in {product} before {major}.{minor} allows remote attackers to execute arbitrary code. " * 3},
+                         {"lang": "es", "value": f"Desbordamiento de búfer en {product} antes de {major}.{minor}."}],
+        "metrics": {"cvssMetricV31": [{"source": "nvd@nist.gov", "type": "Primary", "cvssData": {
+            "version": "3.1", "vectorString": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H", "baseScore": round(rng.uniform(1, 10), 1), "baseSeverity": "HIGH"},
+            "exploitabilityScore": 3.9, "impactScore": 5.9}]},
+        "weaknesses": [{"source": "nvd@nist.gov", "type": "Primary", "description": [{"lang": "en", "value": f"CWE-{rng.randint(20, 900)}"}]}],
+        "configurations": [{"nodes": [{"operator": "OR", "negate": False, "cpeMatch": [
+            {"vulnerable": True, "criteria": f"cpe:2.3:a:{vendor}:{product}:*:*:*:*:*:*:*:*", "versionEndExcluding": f"{major}.{minor}", "matchCriteriaId": "00000000-0000-0000-0000-000000000000"}]}]}],
+        "references": [{"url": f"https://example.com/advisory/{year}/{number}/{i}", "source": "cve@mitre.org", "tags": ["Third Party Advisory"]} for i in range(rng.randint(2, 8))],
+    }}
+
+def write_feed(path, year, count, rng):
+    """Writes a yearly feed file in the NVD 2.0 layout."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"resultsPerPage": count, "startIndex": 0, "totalResults": count, "format": "NVD_CVE", "version": "2.0"})[:-1])
+        f.write(', "vulnerabilities": [')
+        for number in range(count):
+            if number:
+                f.write(',')
+            json.dump(synthetic_cve(rng, year, number), f, ensure_ascii=False)
+        f.write(']}')
+
+class Command(BaseCommand):
+    help = "Times a full NVD import (streaming parse + bulk upsert) on real feed files or a synthetic history (default 250,000 CVEs). Use a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--feed-dir", help="Directory with extracted nvdcve-2.0-*.json feeds to import instead of synthetic ones.")
+        parser.add_argument("--cves", type=int, default=250000, help="Synthetic CVEs, spread over the years 2002 up to now. Default: 250,000")
+        parser.add_argument("--repeat-import", action='store_true', help="Import a second time to time the update path (all CVEs already stored).")
+
+    def handle(self, *args, **options):
+        if options['cves'] <= 0:
+            raise CommandError("cves must be positive.")
+        with tempfile.TemporaryDirectory() as workdir:
+            feed_dir = Path(options['feed_dir'] or workdir)
+            if not options['feed_dir']:
+                rng = random.Random(42)
+                years = list(range(2002, 2026))
+                per_year = -(-options['cves'] // len(years))
+                start = time.perf_counter()
+                for year in years:
+                    write_feed(feed_dir / f"nvdcve-2.0-{year}.json", year, per_year, rng)
+                self.stdout.write(f"Generated {per_year * len(years):,} synthetic CVEs in {time.perf_counter() - start:.1f}s.")
+            feeds = sorted(feed_dir.glob('*.json'))
+            if not feeds:
+                raise CommandError(f"No JSON feeds in {feed_dir}.")
+            size = sum(os.path.getsize(feed) for feed in feeds)
+            self.stdout.write(f"Importing {len(feeds)} feeds ({size / 1024 / 1024:.0f} MB), parser: {'ijson' if IJSON_AVAILABLE else 'json.raw_decode stream'}")
+            self.import_feeds("initial", feeds)
+            if options['repeat_import']:
+                self.import_feeds("re-import", feeds)
+        self.stdout.write(f"CveItem rows: {CveItem.objects.count():,}, CPE index rows: {CveCpeMatch.objects.count():,}")
+
+    def import_feeds(self, name, feeds):
+        start = time.perf_counter()
+        total = sum(load_cve_data(str(feed)) for feed in feeds)
+        seconds = time.perf_counter() - start
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f"{name:<10} {total:,} CVEs in {seconds:.1f}s ({total / seconds:,.0f} CVEs/s), peak RSS {peak_mb:.0f} MB")
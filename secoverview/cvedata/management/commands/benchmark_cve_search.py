@@ -0,0 +1,61 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+from cvedata.models import CveItem
+from cvedata.search_ops import search_available, search_cves
+
+DEFAULT_QUERIES = ["remote code execution", "openssh", "sql injection", "CVE-2021-44228", "CWE-79"]
+
+def icontains_page(query, page):
+    """The CVE search before the full-text index: icontains over the JSON columns, Paginator with COUNT."""
+    cves = CveItem.objects.filter(Q(cve_id__icontains=query) | Q(source_identifier__icontains=query) | Q(vuln_status__icontains=query) | Q(descriptions__icontains=query) | Q(metrics__icontains=query) | Q(weaknesses__icontains=query) | Q(references__icontains=query)).order_by('-cve_id')
+    return list(Paginator(cves, 5).get_page(page))
+
+def page_cursor(query, sort, page):
+    """Keyset cursor of the given page (None for the first page), found by following the pages before it."""
+    after = None
+    for _ in range(page - 1):
+        _, after = search_cves(query, sort, after)
+        if after is None:
+            break
+    return after
+
+def median_ms(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+class Command(BaseCommand):
+    help = "Times the CVE browser search: the old icontains query against the full-text index (ranked and by score), first and a later page. Load the NVD data (or benchmark_cve_import) first."
+
+    def add_arguments(self, parser):
+        parser.add_argument("queries", nargs='*', default=DEFAULT_QUERIES, help="Search terms to time.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query, the median is reported. Default: 5")
+        parser.add_argument("--page", type=int, default=20, help="Later page to time. Default: 20")
+
+    def handle(self, *args, **options):
+        if options['repeat'] <= 0 or options['page'] <= 1:
+            raise CommandError("repeat must be positive and page larger than 1.")
+        if not search_available():
+            raise CommandError("No full-text index on this database, run migrate (and rebuild_cve_search) first.")
+        repeat, page = options['repeat'], options['page']
+        self.stdout.write(f"{CveItem.objects.count():,} CVEs")
+        self.stdout.write(f"{'query':<24} {'icontains p1':>13} {'icontains p' + str(page):>14} {'fts rank p1':>12} {'fts rank p' + str(page):>13} {'fts score p1':>13} {'fts score p' + str(page):>14}")
+        for query in options['queries']:
+            relevance_cursor, score_cursor = page_cursor(query, 'relevance', page), page_cursor(query, 'score', page)
+            results = [
+                median_ms(lambda: icontains_page(query, 1), repeat),
+                median_ms(lambda: icontains_page(query, page), repeat),
+                median_ms(lambda: search_cves(query, 'relevance'), repeat),
+                median_ms(lambda: search_cves(query, 'relevance', relevance_cursor), repeat),
+                median_ms(lambda: search_cves(query, 'score'), repeat),
+                median_ms(lambda: search_cves(query, 'score', score_cursor), repeat),
+            ]
+            self.stdout.write(f"{query:<24} " + ' '.join(f"{ms:>{width}.1f}" for ms, width in zip(results, (12, 14, 12, 13, 13, 14))) + "  (ms)")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from cvedata.cpe_ops import rebuild_cpe_index
+
+class Command(BaseCommand):
+    help = "Extracts the CPE index (CveCpeMatch) from the configurations of all stored CVEs. Run once after upgrading."
+
+    def handle(self, *args, **options):
+        total = rebuild_cpe_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} vulnerable CPE entries."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cvedata.cve_ops import refresh_cve_summaries
+from cvedata.search_ops import rebuild_search_index, search_available
+
+class Command(BaseCommand):
+    help = "Recomputes the CVE summary columns (scores, severity, description, CWEs) and rebuilds the full-text search index of all stored CVEs. Run once after upgrading."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Updated the summary of {refresh_cve_summaries()} CVEs.")
+        total = rebuild_search_index()
+        if not search_available():
+            self.stdout.write(self.style.WARNING("This database has no full-text search, CVE search uses icontains."))
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} CVEs for full-text search."))
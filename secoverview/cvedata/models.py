@@ -4,14 +4,78 @@ from django.db import models
 class CveItem(models.Model):
     cve_id = models.CharField(max_length=50, primary_key=True)
     source_identifier = models.CharField(max_length=200)
-    published = models.CharField(max_length=64)
-    last_modified = models.CharField(max_length=64)
+    published = models.DateTimeField(null=True)
+    last_modified = models.DateTimeField(null=True)
     vuln_status = models.CharField(max_length=50)
     descriptions = models.JSONField()
     metrics = models.JSONField()
     weaknesses = models.JSONField()
     configurations = models.JSONField(null=True)
     references = models.JSONField()
+    # Summary columns for sorting and filtering, extracted at ingest (cve_ops.cve_record) so views don't dig into the JSON
+    base_score = models.FloatField(default=0) # Newest CVSS version, primary source first; 0 = not scored yet
+    severity = models.CharField(max_length=16, blank=True, default="") # Of the base score, e.g. CRITICAL
+    cvss_v3_score = models.FloatField(null=True, blank=True)
+    cvss_v4_score = models.FloatField(null=True, blank=True)
+    description = models.TextField(blank=True, default="") # English description
+    ingested_at = models.DateTimeField(auto_now=True) # When this copy was stored; NVD's last_modified is not in ingest order
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['base_score', 'cve_id'], name='cveitem_score_idx'),
+            models.Index(fields=['severity', 'published'], name='cveitem_severity_idx'),
+            models.Index(fields=['published'], name='cveitem_published_idx'),
+            models.Index(fields=['last_modified'], name='cveitem_last_modified_idx'),
+            models.Index(fields=['ingested_at'], name='cveitem_ingested_idx'),
+        ]
+
+    def __str__(self):
+        return self.cve_id
+
+class CveWeakness(models.Model):
+    # CWE id of a CVE's weaknesses, for filtering by weakness type
+    cve = models.ForeignKey(CveItem, on_delete=models.CASCADE, related_name='cwes')
+    cwe_id = models.CharField(max_length=32) # e.g. CWE-79, NVD-CWE-noinfo
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cwe_id', 'cve'], name='unique_cve_weakness'),
+        ]
+
+    def __str__(self):
+        return f"{self.cve_id}: {self.cwe_id}"
+
+class CveCpeMatch(models.Model):
+    # Vulnerable CPE (vendor/product/version range) extracted from a CVE's configurations (cpeMatch)
+    cve = models.ForeignKey(CveItem, on_delete=models.CASCADE, related_name='cpe_matches')
+    part = models.CharField(max_length=1) # a = application, o = operating system, h = hardware
+    vendor = models.CharField(max_length=255)
+    product = models.CharField(max_length=255)
+    version = models.CharField(max_length=100) # '*' = any version (or range below), '-' = not applicable
+    version_update = models.CharField(max_length=100, blank=True, default="")
+    version_start_including = models.CharField(max_length=100, blank=True, default="")
+    version_start_excluding = models.CharField(max_length=100, blank=True, default="")
+    version_end_including = models.CharField(max_length=100, blank=True, default="")
+    version_end_excluding = models.CharField(max_length=100, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vendor', 'product'], name='cvecpematch_vendor_product_idx'),
+            models.Index(fields=['product'], name='cvecpematch_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cve_id}: {self.vendor}:{self.product}:{self.version}"
+
+class CveFeed(models.Model):
+    # Last downloaded version of an NVD feed (yearly, modified or recent); unchanged feeds are skipped
+    name = models.CharField(max_length=50, unique=True) # e.g. "2024", "modified", "recent"
+    etag = models.CharField(max_length=255, blank=True, default="")
+    http_last_modified = models.CharField(max_length=64, blank=True, default="")
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    cves = models.IntegerField(default=0) # CVEs upserted by the last applied download
+    last_synced = models.DateTimeField(null=True, blank=True) # Last time the feed was checked successfully
+    last_applied = models.DateTimeField(null=True, blank=True) # Last time a changed feed was loaded
 
     def __str__(self):
-        return self.cve_id
\ No newline at end of file
+        return f"{self.name}, sha256: {self.sha256}, synced: {self.last_synced}"
@@ -0,0 +1,160 @@
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import CveItem
+import re
+
+SEARCH_TABLE = 'cvedata_cvesearch'
+SEARCH_INDEX_BATCH_SIZE = 1000 # CVEs per transaction when rebuilding the index
+CVE_PAGE_SIZE = 5
+SORTS = ('relevance', 'score', 'newest')
+LIST_DEFERRED_FIELDS = ['descriptions', 'metrics', 'weaknesses', 'configurations', 'references'] # Not shown in the CVE list
+
+# --- Index Table ---
+# Not a model: SQLite keeps the documents in an FTS5 virtual table, Postgres in a tsvector
+# column with a GIN index. Created after migrate (see apps.py), other databases fall back
+# to the old icontains search.
+def create_search_index(using='default', **kwargs):
+    """Creates the full-text table if the database supports it. Connected to post_migrate."""
+    db = connections[using]
+    with db.cursor() as cursor:
+        if db.vendor == 'sqlite':
+            try:
+                # rowid is derived from the CVE id (cve_rowid), so replacing a document is an indexed delete
+                cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(cve_id UNINDEXED, document, tokenize='porter unicode61')")
+            except Exception as e:
+                print(f"SQLite without FTS5, CVE search falls back to icontains: {e}")
+        elif db.vendor == 'postgresql':
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (cve_id varchar(50) PRIMARY KEY, document tsvector NOT NULL)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)")
+
+_search_available = set() # Aliases of databases known to have the full-text table
+
+def search_available():
+    """Whether the full-text table exists on the default database."""
+    if connection.alias in _search_available:
+        return True
+    if connection.vendor in ('sqlite', 'postgresql') and SEARCH_TABLE in connection.introspection.table_names():
+        _search_available.add(connection.alias)
+        return True
+    return False
+
+def cve_rowid(cve_id):
+    """Integer key of a CVE id for the FTS5 rowid (CVE-2024-12345 -> 2024000012345), None for other ids."""
+    match = re.fullmatch(r'CVE-(\d{4})-(\d{4,8})', cve_id or '')
+    return int(match.group(1)) * 100000000 + int(match.group(2)) if match else None
+
+def cve_search_document(cve):
+    """Searchable text of a CVE (a cve_record dict or CveItem values): id, description, CWEs, source, status, references."""
+    descriptions = cve.get('descriptions') or {}
+    weaknesses = [w.get('value', '') for group in cve.get('weaknesses') or [] for w in group]
+    references = [r.get('url') or '' for r in cve.get('references') or []]
+    return ' '.join([cve['cve_id'], descriptions.get('en', ''), *weaknesses, cve.get('source_identifier') or '', cve.get('vuln_status') or '', *references])
+
+def index_cve_search(cves):
+    """Replaces the full-text documents of the given CVEs. Call inside the ingest transaction."""
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            rows = [(cve_rowid(cve['cve_id']), cve['cve_id'], cve_search_document(cve)) for cve in cves]
+            rows = [row for row in rows if row[0] is not None]
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, cve_id, document) VALUES (%s, %s, %s)", rows)
+        else:
+            rows = [(cve['cve_id'], cve_search_document(cve)) for cve in cves]
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (cve_id, document) VALUES (%s, to_tsvector('english', %s)) "
+                               "ON CONFLICT (cve_id) DO UPDATE SET document = EXCLUDED.document", rows)
+    return len(rows)
+
+# --- Search ---
+def fts5_query(query):
+    """FTS5 MATCH expression of free text: every word becomes a quoted phrase (CVE-2021-44228 -> "cve 2021 44228"), all must match."""
+    phrases = [' '.join(re.findall(r'\w+', word)) for word in query.split()]
+    return ' '.join(f'"{phrase}"' for phrase in phrases if phrase)
+
+def ranked_matches_sql(query):
+    """
+    SQL and params selecting (cve_id, rank, key) of the matching CVEs, lower rank = better match,
+    ends in a WHERE clause so conditions can be appended. key breaks rank ties for keyset
+    pagination: the integer rowid on SQLite (sorting by the UNINDEXED cve_id is twice as slow).
+    """
+    if connection.vendor == 'sqlite':
+        return f"SELECT cve_id, rank, rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [fts5_query(query)], 'rowid'
+    return (f"SELECT * FROM (SELECT cve_id, -ts_rank_cd(document, query) AS rank, cve_id AS key FROM {SEARCH_TABLE}, "
+            "websearch_to_tsquery('english', %s) query WHERE document @@ query) matches WHERE TRUE"), [query], 'key'
+
+def parse_cursor(after, sort):
+    """(sort key, tie-breaker) of the last CVE on the previous page, None for the first page or a malformed cursor."""
+    if not after or '|' not in after:
+        return None
+    value, key = after.rsplit('|', 1)
+    if sort == 'newest':
+        return None, key
+    try:
+        if sort == 'relevance' and connection.vendor == 'sqlite':
+            key = int(key)
+        return float(value), key
+    except ValueError:
+        return None
+
+def search_cves(query='', sort=None, after=None, limit=CVE_PAGE_SIZE):
+    """
+    One page of CVEs matching the free text query with keyset pagination.
+    sort: 'relevance' (full-text rank, default with a query), 'score' (CVSS base score)
+    or 'newest' (CVE id, default without a query). after is the cursor of the previous page.
+    Returns (CveItems, cursor of the next page or None).
+    """
+    query = (query or '').strip()
+    use_index = bool(query) and search_available() and (connection.vendor != 'sqlite' or fts5_query(query))
+    if sort not in SORTS or (sort == 'relevance' and not use_index):
+        sort = 'relevance' if use_index else 'newest' # No rank without the full-text index
+    cursor = parse_cursor(after, sort)
+
+    if sort == 'relevance' and use_index:
+        sql, params, key = ranked_matches_sql(query)
+        if cursor:
+            sql += f" AND (rank > %s OR (rank = %s AND {key} > %s))"
+            params += [cursor[0], cursor[0], cursor[1]]
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql + f" ORDER BY rank, {key} LIMIT %s", params + [limit])
+            ranked = db_cursor.fetchall()
+        items = CveItem.objects.defer(*LIST_DEFERRED_FIELDS).in_bulk([cve_id for cve_id, _, _ in ranked])
+        cves = [items[cve_id] for cve_id, _, _ in ranked if cve_id in items]
+        next_cursor = f"{ranked[-1][1]!r}|{ranked[-1][2]}" if len(ranked) == limit else None
+        return cves, next_cursor
+
+    cves = CveItem.objects.defer(*LIST_DEFERRED_FIELDS)
+    if query and use_index:
+        sql, params, _ = ranked_matches_sql(query)
+        cves = cves.filter(cve_id__in=RawSQL(f"SELECT cve_id FROM ({sql}) matches", params))
+    elif query: # No full-text index on this database
+        cves = cves.filter(Q(cve_id__icontains=query) | Q(source_identifier__icontains=query) | Q(vuln_status__icontains=query) | Q(descriptions__icontains=query) | Q(metrics__icontains=query) | Q(weaknesses__icontains=query) | Q(references__icontains=query))
+    if sort == 'score':
+        if cursor:
+            cves = cves.filter(Q(base_score__lt=cursor[0]) | Q(base_score=cursor[0], cve_id__lt=cursor[1]))
+        page = list(cves.order_by('-base_score', '-cve_id')[:limit])
+        next_cursor = f"{page[-1].base_score!r}|{page[-1].cve_id}" if len(page) == limit else None
+    else:
+        if cursor:
+            cves = cves.filter(cve_id__lt=cursor[1])
+        page = list(cves.order_by('-cve_id')[:limit])
+        next_cursor = f"|{page[-1].cve_id}" if len(page) == limit else None
+    return page, next_cursor
+
+# --- Rebuild ---
+def rebuild_search_index(batch_size=SEARCH_INDEX_BATCH_SIZE):
+    """Indexes every stored CVE (once after upgrading, or to repair the index)."""
+    create_search_index()
+    if not search_available():
+        return 0
+    total = 0
+    cves = CveItem.objects.order_by('cve_id').values('cve_id', 'descriptions', 'weaknesses', 'references', 'source_identifier', 'vuln_status')
+    last_id = ''
+    while True:
+        batch = list(cves.filter(cve_id__gt=last_id)[:batch_size])
+        if not batch:
+            return total
+        with transaction.atomic():
+            total += index_cve_search(batch)
+        last_id = batch[-1]['cve_id']
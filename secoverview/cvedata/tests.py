@@ -1,3 +1,149 @@
+import hashlib
+import io
+import json
+import tempfile
+import threading
+import zipfile
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 from django.test import TestCase
 
-# Create your tests here.
+from .cve_ops import cve_record, download_and_extract_cve_zips, sync_cve_feeds, upsert_cve_records, yearly_feeds_due
+from .models import CveItem, CveFeed
+from .search_ops import search_cves
+
+def feed_zip(name, cves):
+    """Zipped NVD 2.0 feed with (cve id, lastModified, description) entries."""
+    document = {"format": "NVD_CVE", "version": "2.0", "vulnerabilities": [
+        {"cve": {"id": cve_id, "sourceIdentifier": "cve@mitre.org", "published": "2024-01-01T00:00:00.000",
+                 "lastModified": last_modified, "vulnStatus": "Analyzed",
+                 "descriptions": [{"lang": "en", "value": description}], "metrics": {}, "weaknesses": [], "references": []}}
+        for cve_id, last_modified, description in cves]}
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as zf:
+        zf.writestr(f"nvdcve-2.0-{name}.json", json.dumps(document))
+    return data.getvalue()
+
+class FeedServer(ThreadingHTTPServer):
+    """Local stand-in for the NVD feed server, answers conditional requests with 304 like NVD."""
+
+    def __init__(self):
+        self.feeds = {} # path -> zip bytes
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), FeedHandler)
+
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/feeds"
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        data = self.server.feeds.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{hashlib.sha256(data).hexdigest()[:16]}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class CveSyncTests(TestCase):
+    def setUp(self):
+        self.server = FeedServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.years = yearly_feeds_due(full=True)
+        for year in self.years:
+            self.serve(year, [(f"CVE-{year}-0001", f"{year}-02-01T00:00:00.000", "baseline")])
+        self.serve('modified', [])
+        self.serve('recent', [])
+
+    def serve(self, name, cves):
+        self.server.feeds[f"/feeds/nvdcve-2.0-{name}.json.zip"] = feed_zip(name, cves)
+
+    def sync(self, full=False):
+        self.server.requests.clear()
+        return sync_cve_feeds(full=full, base_url=self.server.url())
+
+    def test_initial_sync_loads_yearly_feeds(self):
+        results = self.sync()
+        self.assertEqual(CveItem.objects.count(), len(self.years))
+        self.assertTrue(all(status == 'updated' for status, _ in results.values()))
+        self.assertEqual(CveFeed.objects.exclude(sha256='').count(), len(self.years) + 2)
+
+    def test_next_sync_only_applies_delta_feeds(self):
+        self.sync()
+        results = self.sync()
+        self.assertEqual(set(results), {'modified', 'recent'})
+        self.assertEqual(results['modified'], ('unchanged', 0))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_delta_only_upserts_advanced_cves(self):
+        self.sync()
+        self.serve('modified', [
+            ("CVE-2024-0001", "2024-03-01T00:00:00.000", "updated"), # advanced
+            ("CVE-2023-0001", "2023-01-01T00:00:00.000", "stale"), # older than the stored version
+            ("CVE-2024-9999", "2024-03-02T00:00:00.000", "new"),
+        ])
+        results = self.sync()
+        self.assertEqual(results['modified'], ('updated', 2))
+        self.assertEqual(CveItem.objects.get(cve_id="CVE-2024-0001").descriptions, {'en': 'updated'})
+        self.assertEqual(CveItem.objects.get(cve_id="CVE-2023-0001").descriptions, {'en': 'baseline'})
+        self.assertTrue(CveItem.objects.filter(cve_id="CVE-2024-9999").exists())
+
+    def test_failed_feed_is_retried(self):
+        del self.server.feeds["/feeds/nvdcve-2.0-2010.json.zip"]
+        self.assertEqual(self.sync()['2010'], ('failed', 0))
+        self.serve('2010', [("CVE-2010-0001", "2010-02-01T00:00:00.000", "baseline")])
+        results = self.sync()
+        self.assertEqual(results['2010'], ('updated', 1))
+        self.assertNotIn('2011', results)
+
+    def test_full_sync_reloads_unchanged_feeds(self):
+        self.sync()
+        results = self.sync(full=True)
+        self.assertEqual(len(results), len(self.years) + 2)
+        self.assertEqual(results['2020'], ('updated', 1))
+
+    def test_download_and_extract_from_disk(self):
+        del self.server.feeds["/feeds/nvdcve-2.0-2003.json.zip"]
+        with tempfile.TemporaryDirectory() as directory:
+            download_and_extract_cve_zips(2002, 2005, directory, base_url=self.server.url(), workers=2)
+            self.assertEqual(sorted(path.name for path in Path(directory).iterdir()),
+                             ["nvdcve-2.0-2002.json", "nvdcve-2.0-2004.json", "nvdcve-2.0-2005.json"])
+
+class CveSearchTests(TestCase):
+    def setUp(self):
+        upsert_cve_records([cve_record({"cve": {"id": f"CVE-2024-{number:04d}", "sourceIdentifier": "cve@mitre.org", "vulnStatus": "Analyzed",
+                                                "descriptions": [{"lang": "en", "value": f"Overflow in parser {number}"}]}})
+                            for number in range(1, 13)])
+
+    def pages(self, query, sort):
+        cve_ids, after = [], None
+        for _ in range(10):
+            cves, after = search_cves(query, sort, after)
+            cve_ids += [cve.cve_id for cve in cves]
+            if after is None:
+                return cve_ids
+        self.fail("Pagination did not end")
+
+    def test_relevance_without_query_pages_newest_first(self):
+        expected = [f"CVE-2024-{number:04d}" for number in range(12, 0, -1)]
+        self.assertEqual(self.pages('', 'relevance'), expected)
+        self.assertEqual(self.pages('-', 'relevance'), expected) # No words for the full-text index, icontains matches every id
+
+    def test_relevance_pages_every_match_once(self):
+        cve_ids = self.pages('overflow', 'relevance')
+        self.assertEqual(sorted(cve_ids), [f"CVE-2024-{number:04d}" for number in range(1, 13)])
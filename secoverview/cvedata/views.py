@@ -1,31 +1,30 @@
 from django.shortcuts import render, redirect
 from django.http import HttpRequest
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Q
 from datetime import datetime
-from .cve_ops import get_load_all_cve_data
+from django.urls import reverse
+from jobs.jobops import enqueue_job
+from .search_ops import search_cves
 from .models import CveItem
 
 @login_required
 def cve_view(request):
     """Renders the about page."""
     assert isinstance(request, HttpRequest)
-    query = request.GET.get("search")
-    if query == None or query == "":
-        cves = CveItem.objects.order_by('-cve_id')
-    else:
-        cves = CveItem.objects.filter(Q(cve_id__icontains=query) | Q(source_identifier__icontains=query) | Q(vuln_status__icontains=query) | Q(descriptions__icontains=query) | Q(metrics__icontains=query) | Q(weaknesses__icontains=query) | Q(references__icontains=query)).order_by('-cve_id')
-    paginator = Paginator(cves, 5)
-    page_number = request.GET.get('page')  # Get the page number from the URL query parameter
-    page_obj = paginator.get_page(page_number)  # Get the appropriate page of blog posts
+    query = request.GET.get("search") or ""
+    sort = request.GET.get("sort")
+    cves, next_cursor = search_cves(query, sort, request.GET.get('after'))
     return render(
         request,
         'cve_view.html',
         {
             'title':'CVE',
             'year':datetime.now().year,
-            'cves':page_obj,
+            'cves':cves,
+            'search':query,
+            'sort':sort or ('relevance' if query else 'newest'),
+            'next_cursor':next_cursor,
+            'is_first_page':not request.GET.get('after'),
             'chatcontext':"Displays the all CVE's and allow searching them."
         }
     )
@@ -33,8 +32,8 @@ def cve_view(request):
 @login_required
 def get_cve_data(request):
     assert isinstance(request, HttpRequest)
-    get_load_all_cve_data()
-    return redirect('cve_view')
+    job = enqueue_job('cvedata.cve_ops.get_load_all_cve_data', 'Update CVE data', request.user, next_url=reverse('cve_view'))
+    return redirect('jobview', id=job.id)
 
 @login_required
 def cve_details(request, id):
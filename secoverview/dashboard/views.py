@@ -6,6 +6,7 @@ from nmapapp.models import Nmapscan
 from ransomwarelive.models import RansomwareliveVictim
 from rssapp.models import RSSFeed
 from yarascan.models import ScanResult
+from assets.assetsoperations import recent_asset_cves
 
 @login_required
 def dashboard(request):
@@ -15,6 +16,7 @@ def dashboard(request):
     victims = RansomwareliveVictim.objects.order_by('-id')[:5]
     feed_items = RSSFeed.objects.order_by('-pub_date')[:5]
     filescanresults = ScanResult.objects.exclude(matched_rules="").order_by('-id')[:5]
+    asset_cves = recent_asset_cves(days=7)[:5]
     return render(
         request,
         'dashboard.html',
@@ -25,6 +27,7 @@ def dashboard(request):
             'victims':victims,
             'feed_items':feed_items,
             'filescanresults':filescanresults,
-            'chatcontext':"This page is the dashboard conatining the latest nmap scans, ransomware victimes, yara scans and news."
+            'asset_cves':asset_cves,
+            'chatcontext':"This page is the dashboard conatining the latest nmap scans, ransomware victimes, yara scans, critical CVEs of the assets and news."
         }
     )
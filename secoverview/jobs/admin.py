@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import Job
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = [
+        'label',
+        'status',
+        'progress_current',
+        'progress_total',
+        'created_by',
+        'created',
+        'finished',
+    ]
+    search_fields = ['label', 'task']
+    list_filter = ['status', 'task']
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
+
+    def ready(self):
+        from .jobops import serves_requests, start_workers
+        if serves_requests(): # Jobs queued before a restart run without waiting for a request
+            start_workers()
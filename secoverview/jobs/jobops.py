@@ -0,0 +1,194 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+import hashlib
+import inspect
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+JOB_POLL_SECONDS = 5 # Idle workers look for jobs queued by other processes this often
+PROGRESS_INTERVAL = 1.0 # Seconds between progress writes of a job
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+# Sent with the job after fail_orphaned_jobs failed it, e.g. to clean up what the task left running
+job_orphaned = Signal()
+
+# --- Queueing ---
+def job_dedupe_key(task, kwargs):
+    return hashlib.sha256(f"{task}:{json.dumps(kwargs, sort_keys=True)}".encode()).hexdigest()
+
+def enqueue_job(task, label, user=None, next_url='', **kwargs):
+    """
+    Queues task (dotted path of a function) with JSON serializable kwargs and returns the Job.
+    If the same task with the same kwargs is already queued or running that job is returned instead.
+    next_url may contain {job_id}, e.g. for a results page that reads the job result.
+    """
+    key = job_dedupe_key(task, kwargs)
+    open_jobs = Job.objects.filter(dedupe_key=key, status__in=[Job.QUEUED, Job.RUNNING])
+    job = open_jobs.first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(task=task, kwargs=kwargs, dedupe_key=key, label=label,
+                                     created_by=user if user is not None and user.is_authenticated else None)
+    except IntegrityError:
+        # Queued by another request since the lookup (unique_open_job); if that job finished meanwhile, queue again
+        return enqueue_job(task, label, user=user, next_url=next_url, **kwargs)
+    if next_url:
+        job.next_url = next_url.format(job_id=job.id)
+        job.save(update_fields=['next_url'])
+    transaction.on_commit(wake_workers)
+    return job
+
+def wake_workers():
+    start_workers()
+    _wakeup.set()
+
+def job_status(job):
+    """Progress of a job as served by the status endpoints."""
+    return {
+        'id': job.id,
+        'label': job.label,
+        'status': job.status,
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'percent': job.percent(),
+        'message': job.message,
+        'result': job.result,
+        'error': job.error,
+        'next_url': job.next_url,
+        'created': job.created,
+        'started': job.started,
+        'finished': job.finished,
+    }
+
+# --- Execution ---
+def process_start_time(pid):
+    """Start of a process in clock ticks since boot (Linux), '' where /proc is not available or the process is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(')', 1)[1].split()[19] # Field 22, counted after the command name
+    except (OSError, IndexError):
+        return ''
+
+def worker_name():
+    # The start time tells a reused pid apart from the process that claimed the job
+    return f"{socket.gethostname()}:{os.getpid()}:{process_start_time(os.getpid())}:{threading.current_thread().name}"
+
+def job_progress(job_id):
+    """
+    Progress callback passed to tasks with a `progress` parameter: progress(current, total, message).
+    result (dict, always written) is kept as the job result until the task returns, e.g. ids of
+    records the task created that a job_orphaned receiver needs.
+    """
+    last_write = 0.0
+
+    def progress(current, total=0, message='', result=None):
+        nonlocal last_write
+        now = time.monotonic()
+        if now - last_write < PROGRESS_INTERVAL and current < total and result is None:
+            return
+        last_write = now
+        partial = {'result': result} if result is not None else {}
+        Job.objects.filter(id=job_id).update(progress_current=current, progress_total=total, message=str(message)[:255], **partial)
+    return progress
+
+def claim_job():
+    """Marks the oldest queued job as running for this worker. Returns it, or None if the queue is empty."""
+    for job_id in Job.objects.filter(status=Job.QUEUED).order_by('id').values_list('id', flat=True)[:10]:
+        # Conditional update: only one worker (thread or process) wins a job
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(status=Job.RUNNING, started=timezone.now(), worker=worker_name()):
+            return Job.objects.get(id=job_id)
+    return None
+
+def run_job(job):
+    """Runs a claimed job and stores its outcome."""
+    try:
+        function = import_string(job.task)
+        kwargs = dict(job.kwargs)
+        if 'progress' in inspect.signature(function).parameters:
+            kwargs['progress'] = job_progress(job.id)
+        result = function(**kwargs)
+        if not isinstance(result, dict):
+            result = None
+        Job.objects.filter(id=job.id).update(status=Job.SUCCEEDED, result=json.loads(json.dumps(result, default=str)), finished=timezone.now())
+    except Exception as e:
+        print(f"Job {job.id} ({job.label}) failed: {e}")
+        Job.objects.filter(id=job.id).update(status=Job.FAILED, error=traceback.format_exc()[-4000:], finished=timezone.now())
+
+def work(stop=None, poll_seconds=JOB_POLL_SECONDS, recover=False):
+    """Worker loop: runs queued jobs one at a time until stop is set. recover first fails orphaned jobs."""
+    while not apps.ready: # Started from JobsConfig.ready(): no queries while the other apps are still loading
+        time.sleep(0.1)
+    if recover:
+        try:
+            fail_orphaned_jobs()
+        except Exception as e:
+            print(f"Job worker could not fail orphaned jobs: {e}")
+    while stop is None or not stop.is_set():
+        close_old_connections()
+        try:
+            job = claim_job()
+        except Exception as e:
+            print(f"Job worker could not read the queue: {e}")
+            job = None
+        if job is not None:
+            run_job(job)
+            close_old_connections()
+            continue
+        _wakeup.wait(poll_seconds)
+        _wakeup.clear()
+
+def worker_alive(pid, started):
+    """Whether the process that claimed a job still runs: pid exists and, where known, started at the same time."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # Exists, owned by another user
+    return not started or started == process_start_time(pid)
+
+def fail_orphaned_jobs():
+    """Fails running jobs of dead worker processes on this host, e.g. after a restart during a job."""
+    host = socket.gethostname()
+    for job in Job.objects.filter(status=Job.RUNNING, worker__startswith=f"{host}:"):
+        _host, pid, started = job.worker.split(':')[:3]
+        if worker_alive(int(pid), started):
+            continue
+        if Job.objects.filter(id=job.id, status=Job.RUNNING).update(status=Job.FAILED, error="Worker stopped while the job was running.", finished=timezone.now()):
+            job_orphaned.send(sender=Job, job=job)
+
+def start_workers(count=None):
+    """Starts the in-process worker threads once per process (JOB_WORKERS, 0 = jobs only run in `manage.py run_jobs`)."""
+    count = settings.JOB_WORKERS if count is None else count
+    with _workers_lock:
+        _workers[:] = [thread for thread in _workers if thread.is_alive()] # Threads do not survive a fork (gunicorn --preload)
+        if _workers or count <= 0:
+            return
+        for number in range(count):
+            thread = threading.Thread(target=work, kwargs={'recover': number == 0}, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+def serves_requests():
+    """Whether this process is a web server: a WSGI/ASGI server, or the (reloaded) child of runserver.
+
+    Other management commands (migrate, test, run_jobs, ...) do not start workers.
+    """
+    if not sys.argv or os.path.basename(sys.argv[0]) not in ('manage.py', 'django-admin', '__main__.py'):
+        return True
+    return sys.argv[1:2] == ['runserver'] and (os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv)
@@ -0,0 +1,24 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from jobs.jobops import fail_orphaned_jobs, work
+
+class Command(BaseCommand):
+    help = "Runs background jobs in this process, e.g. as a separate service with JOB_WORKERS=0 for the web server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Jobs run at the same time. Default: 2")
+
+    def handle(self, *args, **options):
+        fail_orphaned_jobs()
+        stop = threading.Event()
+        threads = [threading.Thread(target=work, args=(stop,), name=f"job-worker-{number}", daemon=True) for number in range(max(1, options['workers']))]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Running jobs with {len(threads)} workers, stop with Ctrl+C.")
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            stop.set()
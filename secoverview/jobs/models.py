@@ -0,0 +1,45 @@
+from django.db import models
+from django.contrib.auth.models import User
+
+class Job(models.Model):
+    # Long running operation started from a view, executed by a background worker (jobops.py)
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=255) # Dotted path of the function, e.g. cvedata.cve_ops.get_load_all_cve_data
+    kwargs = models.JSONField(default=dict)
+    dedupe_key = models.CharField(max_length=64) # sha256 of task and kwargs, a queued or running job is not started twice (unique_open_job)
+    label = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    progress_current = models.IntegerField(default=0)
+    progress_total = models.IntegerField(default=0) # 0 = unknown
+    message = models.CharField(max_length=255, blank=True, default="")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    next_url = models.CharField(max_length=255, blank=True, default="") # Where to see the results
+    worker = models.CharField(max_length=255, blank=True, default="") # host:pid:process start:thread running the job
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+            models.Index(fields=['dedupe_key', 'status'], name='job_dedupe_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=models.Q(status__in=['queued', 'running']), name='unique_open_job'),
+        ]
+
+    def percent(self):
+        return int(100 * self.progress_current / self.progress_total) if self.progress_total else None
+
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    def __str__(self):
+        return f"{self.label}, status: {self.status}, progress: {self.progress_current}/{self.progress_total}"
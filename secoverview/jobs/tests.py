@@ -0,0 +1,130 @@
+import os
+import socket
+import subprocess
+import sys
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+
+from .jobops import claim_job, enqueue_job, fail_orphaned_jobs, job_dedupe_key, job_progress, process_start_time, run_job, serves_requests
+from .models import Job
+
+# Tasks run by the tests, queued by their dotted path like real tasks
+def add_numbers(a, b, progress=None):
+    progress(1, 2, "Adding")
+    return {'sum': a + b}
+
+def return_list():
+    return [1, 2]
+
+def fail(message):
+    raise RuntimeError(message)
+
+@override_settings(JOB_WORKERS=0)
+class JobQueueTests(TestCase):
+    def test_same_task_and_kwargs_return_the_open_job(self):
+        job = enqueue_job('jobs.tests.add_numbers', 'Add', a=1, b=2, next_url='/jobs/{job_id}')
+        self.assertEqual(job.next_url, f'/jobs/{job.id}')
+        self.assertEqual(enqueue_job('jobs.tests.add_numbers', 'Add again', b=2, a=1), job)
+        Job.objects.filter(id=job.id).update(status=Job.RUNNING)
+        self.assertEqual(enqueue_job('jobs.tests.add_numbers', 'Add again', a=1, b=2), job)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(task='jobs.tests.add_numbers', kwargs={'a': 1, 'b': 2}, dedupe_key=job.dedupe_key, label='Duplicate')
+        self.assertNotEqual(enqueue_job('jobs.tests.add_numbers', 'Other numbers', a=1, b=3), job)
+        Job.objects.filter(id=job.id).update(status=Job.SUCCEEDED)
+        self.assertNotEqual(enqueue_job('jobs.tests.add_numbers', 'Add again', a=1, b=2), job)
+
+    def test_job_queued_by_another_request_since_the_lookup_is_returned(self):
+        first, raced = QuerySet.first, []
+
+        def other_request_first(queryset):
+            if not raced: # Another request queues the same job between the lookup and the insert
+                raced.append(Job.objects.create(task='jobs.tests.add_numbers', kwargs={'a': 1, 'b': 2},
+                                                dedupe_key=job_dedupe_key('jobs.tests.add_numbers', {'a': 1, 'b': 2}), label='Other'))
+                return None
+            return first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', other_request_first):
+            job = enqueue_job('jobs.tests.add_numbers', 'Add', a=1, b=2)
+        self.assertEqual(job, raced[0])
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_claim_takes_the_oldest_queued_job(self):
+        first = enqueue_job('jobs.tests.add_numbers', 'First', a=1, b=1)
+        second = enqueue_job('jobs.tests.add_numbers', 'Second', a=2, b=2)
+        claimed = claim_job()
+        self.assertEqual((claimed.id, claimed.status), (first.id, Job.RUNNING))
+        self.assertEqual(claimed.worker.split(':')[:3], [socket.gethostname(), str(os.getpid()), process_start_time(os.getpid())])
+        self.assertEqual(claim_job().id, second.id)
+        self.assertIsNone(claim_job())
+
+    def test_claim_skips_a_job_taken_by_another_worker_meanwhile(self):
+        first = enqueue_job('jobs.tests.add_numbers', 'First', a=1, b=1)
+        second = enqueue_job('jobs.tests.add_numbers', 'Second', a=2, b=2)
+        update, raced = QuerySet.update, []
+
+        def other_worker_first(queryset, **kwargs):
+            if not raced: # Another worker claims the first job between the select and the conditional update
+                raced.append(update(Job.objects.filter(id=first.id), status=Job.RUNNING, worker='other:1:1:job-worker-0'))
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', other_worker_first):
+            claimed = claim_job()
+        self.assertEqual(claimed.id, second.id)
+        self.assertEqual(Job.objects.get(id=first.id).worker, 'other:1:1:job-worker-0')
+
+    def test_progress_writes_are_throttled(self):
+        job = enqueue_job('jobs.tests.add_numbers', 'Add', a=1, b=2)
+        progress = job_progress(job.id)
+        progress(1, 10, "first")
+        progress(2, 10, "throttled")
+        job.refresh_from_db()
+        self.assertEqual((job.progress_current, job.message), (1, "first"))
+        progress(10, 10, "done") # The final update is always written
+        job.refresh_from_db()
+        self.assertEqual((job.progress_current, job.progress_total, job.message), (10, 10, "done"))
+
+    def test_run_job_stores_the_result(self):
+        enqueue_job('jobs.tests.add_numbers', 'Add', a=1, b=2)
+        run_job(claim_job())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.result, job.progress_current, job.message), (Job.SUCCEEDED, {'sum': 3}, 1, "Adding"))
+        self.assertIsNotNone(job.finished)
+
+    def test_run_job_keeps_only_dict_results(self):
+        enqueue_job('jobs.tests.return_list', 'List')
+        run_job(claim_job())
+        self.assertEqual((Job.objects.get().status, Job.objects.get().result), (Job.SUCCEEDED, None))
+
+    def test_run_job_records_failures(self):
+        enqueue_job('jobs.tests.fail', 'Fail', message="feed unavailable")
+        run_job(claim_job())
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("RuntimeError: feed unavailable", job.error)
+        self.assertIsNotNone(job.finished)
+
+    def test_jobs_of_dead_workers_are_failed(self):
+        dead = subprocess.Popen([sys.executable, '-c', ''])
+        dead.wait()
+        host, pid, started = socket.gethostname(), os.getpid(), process_start_time(os.getpid())
+        workers = (('dead', f'{host}:{dead.pid}:1:job-worker-0'), ('alive', f'{host}:{pid}:{started}:job-worker-0'),
+                   ('pid reused', f'{host}:{pid}:{started}0:job-worker-0'), ('other host', f'{host}-other:1:1:job-worker-0'))
+        for label, worker in workers:
+            Job.objects.create(task='jobs.tests.add_numbers', label=label, dedupe_key=label, status=Job.RUNNING, worker=worker)
+        fail_orphaned_jobs()
+        expected = {'dead': Job.FAILED, 'alive': Job.RUNNING, 'pid reused': Job.FAILED if started else Job.RUNNING, 'other host': Job.RUNNING}
+        self.assertEqual(dict(Job.objects.values_list('label', 'status')), expected)
+        self.assertEqual(Job.objects.get(label='dead').error, "Worker stopped while the job was running.")
+
+    def test_workers_start_only_in_server_processes(self):
+        for argv, run_main, expected in ((['gunicorn', 'secoverview.wsgi'], None, True), (['manage.py', 'migrate'], None, False),
+                                         (['manage.py', 'runserver'], None, False), (['manage.py', 'runserver'], 'true', True),
+                                         (['manage.py', 'runserver', '--noreload'], None, True), (['manage.py', 'run_jobs'], 'true', False)):
+            environ = {'RUN_MAIN': run_main} if run_main else {}
+            with mock.patch.object(sys, 'argv', argv), mock.patch.dict(os.environ, environ):
+                if not run_main:
+                    os.environ.pop('RUN_MAIN', None)
+                self.assertEqual(serves_requests(), expected, argv)
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.jobsoverview, name='jobsoverview'),
+    path('<int:id>', views.jobview, name='jobview'),
+    path('<int:id>/status', views.jobstatus, name='jobstatus'),
+]
@@ -0,0 +1,49 @@
+from django.shortcuts import render, get_object_or_404
+from django.http import HttpRequest, JsonResponse
+from django.core.paginator import Paginator
+from django.contrib.auth.decorators import login_required
+from datetime import datetime
+from .models import Job
+from .jobops import job_status, start_workers
+
+@login_required
+def jobsoverview(request):
+    """Renders the paginated list of background jobs, newest first."""
+    assert isinstance(request, HttpRequest)
+    start_workers() # Picks up jobs queued before a restart
+    paginator = Paginator(Job.objects.order_by('-id'), 5)
+    page_number = request.GET.get('page')  # Get the page number from the URL query parameter
+    page_obj = paginator.get_page(page_number)  # Get the appropriate page of blog posts
+    return render(
+        request,
+        'jobsoverview.html',
+        {
+            'title':'Jobs',
+            'year':datetime.now().year,
+            'jobs':page_obj,
+            'chatcontext':"Shows the background jobs (CVE updates, NMAP scans, asset updates, ...) with their status and progress."
+        }
+    )
+
+@login_required
+def jobview(request, id):
+    """Renders the progress page of one job, which polls jobstatus until it finishes."""
+    assert isinstance(request, HttpRequest)
+    start_workers()
+    job = get_object_or_404(Job, id=id)
+    return render(
+        request,
+        'jobview.html',
+        {
+            'title':'Job',
+            'year':datetime.now().year,
+            'job':job,
+            'chatcontext':f"Shows the progress of the background job: {job}"
+        }
+    )
+
+@login_required
+def jobstatus(request, id):
+    """Progress of a job, polled by the job page."""
+    job = get_object_or_404(Job, id=id)
+    return JsonResponse(job_status(job))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import NetworkFlow, RfPrediction
+from .models import NetworkFlow, RfPrediction, FlowUpload, NetworkFlowRollup
 
 @admin.register(NetworkFlow)
 class ChartAdmin(admin.ModelAdmin):
@@ -25,5 +25,31 @@ class ChartAdmin(admin.ModelAdmin):
     search_fields = ['label']
     list_filter = ['label']
 
+@admin.register(FlowUpload)
+class ChartAdmin(admin.ModelAdmin):
+    list_display = [
+        'upload_id',
+        'total_chunks',
+        'rows_inserted',
+        'completed',
+        'updated',
+    ]
+    search_fields = ['upload_id']
+    list_filter = ['completed']
+
+@admin.register(NetworkFlowRollup)
+class ChartAdmin(admin.ModelAdmin):
+    list_display = [
+        'hour',
+        'host',
+        'flows',
+        'bytes',
+        'anomalies',
+        'detections',
+        'max_severity',
+    ]
+    search_fields = ['host']
+    list_filter = ['max_severity']
+
 
 # Register your models here.
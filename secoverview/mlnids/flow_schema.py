@@ -0,0 +1,20 @@
+import importlib.util
+import sys
+from django.conf import settings
+
+# The flow schema lives with the MLNIDS service (services/mlnids_service/flow_schema.py),
+# which produces the uploaded flows. Load it from there so both sides share one definition.
+_MODULE_NAME = "mlnids_service_flow_schema"
+
+def _load_flow_schema():
+    if _MODULE_NAME in sys.modules:
+        return sys.modules[_MODULE_NAME]
+    spec = importlib.util.spec_from_file_location(_MODULE_NAME, settings.MLNIDS_FLOW_SCHEMA_PATH)
+    if spec is None:
+        raise ImportError(f"MLNIDS flow schema not found at {settings.MLNIDS_FLOW_SCHEMA_PATH}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[_MODULE_NAME] = module
+    spec.loader.exec_module(module)
+    return module
+
+flow_schema = _load_flow_schema()
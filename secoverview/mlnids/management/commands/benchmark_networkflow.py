@@ -0,0 +1,129 @@
+import json
+import platform
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from mlnids.mlnidsops import insert_flow_frames
+from mlnids.models import NetworkFlow, RfPrediction
+
+BENCHMARK_KEY_PREFIX = "bench-" # flow_key prefix of generated rows, removed again unless --keep
+BENCHMARK_LABELS = ["Benign", "DoS", "PortScan", "Infiltration"]
+BENCHMARK_LABEL_WEIGHTS = [0.9, 0.05, 0.04, 0.01]
+BENCHMARK_HOSTS = 5000
+BENCHMARK_START_TS = 1700000000.0
+BENCHMARK_SPAN_SECONDS = 30 * 24 * 3600
+
+def generate_flows(rng, offset, n_rows):
+    """Synthetic flows with the columns the NetworkFlow queries filter on."""
+    hosts = rng.integers(1, BENCHMARK_HOSTS, size=(2, n_rows))
+    labels = rng.choice(BENCHMARK_LABELS, size=n_rows, p=BENCHMARK_LABEL_WEIGHTS)
+    return pd.DataFrame({
+        'flow_key': [f"{BENCHMARK_KEY_PREFIX}{offset + i}" for i in range(n_rows)],
+        'src_ip': [f"10.{h // 256}.{h % 256}.1" for h in hosts[0]],
+        'dst_ip': [f"10.{h // 256}.{h % 256}.2" for h in hosts[1]],
+        'dst_port': rng.integers(1, 65535, n_rows),
+        'protocol': rng.choice([6, 17], n_rows),
+        'flow_start_ts': np.sort(BENCHMARK_START_TS + rng.random(n_rows) * BENCHMARK_SPAN_SECONDS),
+        'tot_bytes': rng.integers(40, 1000000, n_rows),
+        'rf_prediction': labels,
+        'rf_confidence': rng.random(n_rows),
+        'if_anomaly_score': rng.normal(0, 1, n_rows),
+        'if_is_anomaly': rng.random(n_rows) < 0.02,
+    })
+
+def time_query(run, repeat):
+    """Runs a query repeat times and returns timing statistics in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 3), 'min_ms': round(min(timings), 3), 'max_ms': round(max(timings), 3)}
+
+class Command(BaseCommand):
+    help = "Fills NetworkFlow with synthetic flows and times the common flow queries (overview, per host, per label, anomalies, time ranges, upsert)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10000000, help="Synthetic flows to insert. Default: 10,000,000")
+        parser.add_argument("--batch-size", type=int, default=50000, help="Rows per insert batch. Default: 50,000")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query, the median is reported. Default: 5")
+        parser.add_argument("--output", default="networkflow_benchmark.json", help="Where to write the JSON report.")
+        parser.add_argument("--reuse", action='store_true', help="Reuse benchmark rows left by a previous --keep run instead of generating new ones.")
+        parser.add_argument("--keep", action='store_true', help="Keep the generated rows after the benchmark.")
+
+    def handle(self, *args, **options):
+        if options['rows'] <= 0 or options['batch_size'] <= 0 or options['repeat'] <= 0:
+            raise CommandError("rows, batch-size and repeat must be positive.")
+        benchmark_rows = NetworkFlow.objects.filter(flow_key__startswith=BENCHMARK_KEY_PREFIX)
+        if benchmark_rows.exists() and not options['reuse']:
+            raise CommandError(f"NetworkFlow already holds '{BENCHMARK_KEY_PREFIX}' rows, use --reuse or delete them first.")
+
+        report = {'parameters': {k: options[k] for k in ('rows', 'batch_size', 'repeat', 'reuse')}}
+        if not options['reuse']:
+            report['ingest'] = self.fill(options['rows'], options['batch_size'])
+        report['table_rows'] = NetworkFlow.objects.count()
+        report['queries'] = self.run_queries(options['repeat'])
+        report['environment'] = {'python': platform.python_version(), 'database': connection.vendor}
+
+        if not options['keep']:
+            self.stdout.write("Removing benchmark rows...")
+            benchmark_rows._raw_delete(benchmark_rows.db)
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        for name, result in report['queries'].items():
+            self.stdout.write(f"{name:<28} {result['median_ms']:>10.3f} ms median")
+        self.stdout.write(self.style.SUCCESS(f"Benchmark report written to {options['output']}"))
+
+    def fill(self, n_rows, batch_size):
+        """Inserts n_rows synthetic flows through the regular ingest path."""
+        rng = np.random.default_rng(42)
+        start = time.perf_counter()
+
+        def frames():
+            for offset in range(0, n_rows, batch_size):
+                yield generate_flows(rng, offset, min(batch_size, n_rows - offset))
+                self.stdout.write(f"Inserted {min(offset + batch_size, n_rows):,}/{n_rows:,} flows.")
+
+        with transaction.atomic():
+            inserted, _ = insert_flow_frames(frames())
+        seconds = time.perf_counter() - start
+        return {'rows': inserted, 'seconds': round(seconds, 2), 'rows_per_sec': round(inserted / seconds, 1)}
+
+    def run_queries(self, repeat):
+        """Times the queries issued by the mlnids views, the asset correlation and typical analyst filters."""
+        last_ts = BENCHMARK_START_TS + BENCHMARK_SPAN_SECONDS
+        label = RfPrediction.objects.filter(label="DoS").first()
+        flows = NetworkFlow.objects.all()
+        queries = {
+            'overview_first_page': lambda: list(flows.filter(false_positiv=False).order_by('id')[:5]),
+            'overview_deep_page': lambda: list(flows.filter(false_positiv=False).order_by('id')[100000:100005]),
+            'overview_count': lambda: flows.filter(false_positiv=False).count(),
+            'src_ip_latest': lambda: list(flows.filter(src_ip="10.1.1.1").order_by('-flow_start_ts')[:50]),
+            'dst_ip_day': lambda: flows.filter(dst_ip="10.2.2.2", flow_start_ts__gte=last_ts - 86400).count(),
+            'label_day': lambda: flows.filter(rf_prediction=label, flow_start_ts__gte=last_ts - 86400).count(),
+            'anomalies_latest_hour': lambda: list(flows.filter(if_is_anomaly=True, flow_start_ts__gte=last_ts - 3600)[:100]),
+            'time_range_hour': lambda: flows.filter(flow_start_ts__range=(last_ts - 7200, last_ts - 3600)).count(),
+        }
+        results = {}
+        for name, run in queries.items():
+            results[name] = time_query(run, repeat)
+        # Re-upload of 10,000 already stored flows: every row hits the natural key and is updated
+        rng = np.random.default_rng(7)
+        existing = list(NetworkFlow.objects.filter(flow_key__startswith=BENCHMARK_KEY_PREFIX).order_by('id').values_list('flow_key', 'flow_start_ts')[:10000])
+        frame = generate_flows(rng, 0, len(existing))
+        frame['flow_key'] = [key for key, _ in existing]
+        frame['flow_start_ts'] = [ts for _, ts in existing]
+
+        def upsert():
+            with transaction.atomic():
+                insert_flow_frames([frame.copy()])
+        results['upsert_10k_existing'] = time_query(upsert, repeat)
+        results['overview_first_page']['plan'] = flows.filter(false_positiv=False).order_by('id')[:5].explain()
+        results['src_ip_latest']['plan'] = flows.filter(src_ip="10.1.1.1").order_by('-flow_start_ts')[:50].explain()
+        return results
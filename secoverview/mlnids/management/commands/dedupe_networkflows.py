@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from mlnids.mlnidsops import deduplicate_network_flows
+
+class Command(BaseCommand):
+    help = "Merges NetworkFlow rows stored more than once under the same (flow_key, flow_start_ts). Run before migrating to the unique flow key."
+
+    def handle(self, *args, **options):
+        deleted = deduplicate_network_flows()
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} duplicate flows."))
@@ -0,0 +1,446 @@
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from .models import NetworkFlow, RfPrediction, FlowUpload, FlowUploadChunk, NetworkFlowRollup, FlowRollupWatermark
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .flow_schema import flow_schema
+import numpy as np
+import pandas as pd
+import hashlib
+import json
+import zlib
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+INGEST_BATCH_SIZE = 10000 # Rows per parsed chunk and per executemany
+DEFAULT_PREDICTION_LABEL = "Unknown"
+
+# Values used when an upload has no such column (matches the previous per-row ingest)
+UPLOAD_DEFAULTS = {
+    'rf_confidence': 0,
+    'if_anomaly_score': 0,
+    'if_is_anomaly': False,
+}
+
+# Columns read as text; numeric columns are parsed by pandas' C reader
+TEXT_DTYPES = ('str', 'ip', 'label', 'bool')
+
+# Natural key of a flow; re-uploaded flows update the stored row instead of duplicating it
+FLOW_KEY_FIELDS = ['flow_key', 'flow_start_ts']
+
+# Retention: hourly per host rollups of all flows, raw flows are deleted after MLNIDS_RETENTION_DAYS
+ROLLUP_WATERMARK = "hourly_host"
+ROLLUP_FIELDS = ['flows', 'bytes', 'anomalies', 'detections']
+ROLLUP_COLUMNS = ['id', 'src_ip', 'dst_ip', 'flow_start_ts', 'tot_bytes', 'rf_prediction__label', 'rf_confidence', 'if_anomaly_score', 'if_is_anomaly', 'false_positiv']
+ROLLUP_LOOKUP_SIZE = 500 # Ids or hosts per __in lookup, below SQLite's parameter limit
+
+# Chunked uploads: limit on a decompressed chunk (protects against compression bombs)
+MAX_CHUNK_DECOMPRESSED_BYTES = 256 * 1024 * 1024
+
+class PredictionLabelCache:
+    """Maps rf_prediction labels to RfPrediction ids, creating unknown labels once."""
+
+    def __init__(self):
+        self.ids = dict(RfPrediction.objects.values_list('label', 'id'))
+
+    def get(self, label):
+        label = label or DEFAULT_PREDICTION_LABEL
+        if label not in self.ids:
+            self.ids[label] = RfPrediction.objects.get_or_create(label=label)[0].id
+        return self.ids[label]
+
+# --- Type Casting (by flow schema dtype) ---
+def column_values(series, dtype):
+    """Casts one parsed column to database values. Returns (values, mask of rows that could not be cast or None)."""
+    if dtype in ('str', 'ip'):
+        if dtype == 'str':
+            series = series.str.slice(0, 255)
+        return series.astype(object).where(series.notna(), None).tolist(), None
+    if dtype == 'bool':
+        if pd.api.types.is_bool_dtype(series):
+            return series.tolist(), None
+        return series.isin(["True", "true", "1", True, 1]).tolist(), None
+
+    bad = None
+    if not pd.api.types.is_numeric_dtype(series): # Text in a numeric column, pandas could not parse it
+        numeric = pd.to_numeric(series, errors='coerce')
+        bad = (numeric.isna() & series.notna()).to_numpy()
+        series = numeric
+    if series.dtype.kind in 'iu':
+        return series.tolist(), bad
+    values = series.to_numpy(dtype=np.float64)
+    finite = np.isfinite(values)
+    if dtype in ('int', 'bigint'): # Float because of empty values or "6.0" (pandas output)
+        return [int(v) if ok else None for v, ok in zip(values.tolist(), finite)], bad
+    if finite.all():
+        return values.tolist(), bad
+    return [v if ok else None for v, ok in zip(values.tolist(), finite)], bad
+
+class FlowBatchParser:
+    """Turns parsed CSV chunks into value tuples for the NetworkFlow insert statement.
+
+    Upload columns are matched to the flow schema once; columns unknown to NetworkFlow
+    are ignored and empty values become NULL.
+    """
+
+    def __init__(self, header, labels):
+        model_fields = {f.name for f in NetworkFlow._meta.get_fields()}
+        self.labels = labels
+        self.columns = [(name, flow_schema.COLUMNS_BY_NAME[name].dtype) for name in header
+                        if name in flow_schema.COLUMNS_BY_NAME and name in model_fields and name != 'rf_prediction']
+        self.has_label = 'rf_prediction' in header
+        uploaded = [name for name, _ in self.columns]
+        self.defaults = {k: v for k, v in UPLOAD_DEFAULTS.items() if k not in uploaded}
+        self.defaults.update(false_positiv=False, rolled_up=False, rollup_pending=True)
+        self.field_names = uploaded + list(self.defaults) + ['rf_prediction']
+        # On re-upload only the uploaded values are refreshed; defaults and analyst marks (false_positiv) are kept,
+        # the flow is rolled up again with its new values
+        self.update_fields = [name for name in uploaded if name not in FLOW_KEY_FIELDS]
+        if self.has_label:
+            self.update_fields.append('rf_prediction')
+        self.update_fields.append('rollup_pending')
+
+    def parse(self, chunk):
+        """Returns (value tuples in field_names order, number of rows skipped because a value could not be cast)."""
+        columns, bad = [], np.zeros(len(chunk), dtype=bool)
+        for name, dtype in self.columns:
+            values, failed = column_values(chunk[name], dtype)
+            columns.append(values)
+            if failed is not None:
+                bad |= failed
+        columns.extend([value] * len(chunk) for value in self.defaults.values())
+        labels = chunk['rf_prediction'].tolist() if self.has_label else [None] * len(chunk)
+        columns.append([self.labels.get(label if isinstance(label, str) else None) for label in labels])
+        rows = list(zip(*columns))
+        if bad.any():
+            rows = [row for row, skip in zip(rows, bad) if not skip]
+        return rows, int(bad.sum())
+
+def insert_statement(field_names, update_fields=()):
+    """INSERT for the given NetworkFlow fields, prepared once and executed per batch.
+
+    A flow whose natural key (flow_key, flow_start_ts) already exists is updated with
+    update_fields instead of being inserted again.
+    """
+    quote = connection.ops.quote_name
+    fields = [NetworkFlow._meta.get_field(name) for name in field_names]
+    columns = ', '.join(quote(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(field_names))
+    sql = f"INSERT INTO {quote(NetworkFlow._meta.db_table)} ({columns}) VALUES ({placeholders})"
+    if not update_fields: # Nothing to refresh, rewrite the key so the statement stays a no-op update
+        update_fields = FLOW_KEY_FIELDS
+    upsert = connection.ops.on_conflict_suffix_sql(
+        fields, OnConflict.UPDATE,
+        [NetworkFlow._meta.get_field(name).column for name in update_fields],
+        [NetworkFlow._meta.get_field(name).column for name in FLOW_KEY_FIELDS])
+    return f"{sql} {upsert}" if upsert else sql
+
+def insert_flow_frames(frames):
+    """Inserts an iterable of flow DataFrames (same columns) inside the current transaction.
+
+    Values are cast a whole column at a time by the flow schema and every frame is inserted
+    with one prepared statement (executemany). Rows with values that cannot be cast are
+    skipped. bulk_create is not used because it compiles the SQL value by value, which
+    dominated the time for 60+ column flows. Flows already stored under the same
+    (flow_key, flow_start_ts) are updated in place (upsert).
+    Returns (inserted or updated rows, skipped rows).
+    """
+    inserted, skipped = 0, 0
+    parser, sql = None, None
+    with connection.cursor() as cursor:
+        for frame in frames:
+            frame.columns = frame.columns.str.strip()
+            if parser is None:
+                parser = FlowBatchParser(list(frame.columns), PredictionLabelCache())
+                sql = insert_statement(parser.field_names, parser.update_fields)
+            rows, failed = parser.parse(frame)
+            if failed:
+                print(f"Skipping {failed} flow rows with invalid values.")
+            skipped += failed
+            if rows:
+                cursor.executemany(sql, rows)
+                inserted += len(rows)
+    return inserted, skipped
+
+def ingest_flow_csv(uploaded_file, batch_size=INGEST_BATCH_SIZE):
+    """Streams a flow CSV (e.g. from analyse.py) into NetworkFlow.
+
+    The file is parsed incrementally in chunks by pandas' C reader and inserted inside a
+    single transaction, so a failed upload leaves no partial data.
+    Returns (inserted rows, skipped rows).
+    """
+    text_columns = {c.name: str for c in flow_schema.FLOW_COLUMNS + flow_schema.PREDICTION_COLUMNS if c.dtype in TEXT_DTYPES}
+    try:
+        reader = pd.read_csv(uploaded_file, chunksize=batch_size, dtype=text_columns, skipinitialspace=True)
+    except pd.errors.EmptyDataError:
+        return 0, 0
+
+    with reader, transaction.atomic():
+        return insert_flow_frames(reader)
+
+# --- Chunked Uploads ---
+def decompress_chunk(body, encoding):
+    """Decompresses a chunk body sent with Content-Encoding gzip, zstd or identity."""
+    encoding = (encoding or 'identity').lower()
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = decompressor.decompress(body, MAX_CHUNK_DECOMPRESSED_BYTES)
+        if decompressor.unconsumed_tail:
+            raise ValueError("Decompressed chunk exceeds the size limit.")
+        return data
+    if encoding == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd is not supported by this server (zstandard is not installed).")
+        return zstandard.ZstdDecompressor().decompress(body, max_output_size=MAX_CHUNK_DECOMPRESSED_BYTES)
+    if encoding == 'identity':
+        return body
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+def decode_flow_chunk(body, encoding):
+    """Decodes a columnar chunk ({"column": [values, ...], ...}) into a DataFrame."""
+    columns = json.loads(decompress_chunk(body, encoding))
+    if not isinstance(columns, dict) or not all(isinstance(v, list) for v in columns.values()):
+        raise ValueError("Chunk must be a JSON object mapping column names to value lists.")
+    if len({len(v) for v in columns.values()}) > 1:
+        raise ValueError("All columns of a chunk must have the same length.")
+    return pd.DataFrame(columns)
+
+def ingest_flow_chunk(upload_id, index, body, encoding=None, total_chunks=None):
+    """Ingests one chunk of a resumable upload exactly once.
+
+    The chunk is recorded and its flows inserted in the same transaction, so a chunk is
+    either fully stored or not at all, and resending an already received chunk is a no-op.
+    Returns (FlowUpload, inserted rows, skipped rows, duplicate).
+    """
+    known_total = FlowUpload.objects.filter(upload_id=upload_id).values_list('total_chunks', flat=True).first()
+    total = total_chunks or known_total
+    if total and not 0 <= index < total:
+        raise ValueError(f"Chunk index {index} is outside of the {total} chunks of upload {upload_id}.")
+    frame = decode_flow_chunk(body, encoding)
+    digest = hashlib.sha256(body).hexdigest()
+    upload, _ = FlowUpload.objects.get_or_create(upload_id=upload_id)
+    try:
+        with transaction.atomic():
+            chunk = FlowUploadChunk.objects.create(upload=upload, index=index, sha256=digest)
+            inserted, skipped = insert_flow_frames([frame])
+            chunk.rows = inserted
+            chunk.save(update_fields=['rows'])
+            totals = {'total_chunks': total_chunks} if total_chunks else {}
+            FlowUpload.objects.filter(pk=upload.pk).update(rows_inserted=F('rows_inserted') + inserted, **totals)
+    except IntegrityError:
+        existing = FlowUploadChunk.objects.filter(upload=upload, index=index).first()
+        if existing is None:
+            raise
+        if existing.sha256 != digest:
+            raise ValueError(f"Chunk {index} of upload {upload_id} was already received with different content.")
+        return upload, 0, 0, True
+
+    upload.refresh_from_db()
+    # Chunks received before the total was known may lie beyond it and do not count
+    if (upload.total_chunks and not upload.completed
+            and upload.chunks.filter(index__lt=upload.total_chunks).values('index').distinct().count() >= upload.total_chunks):
+        upload.completed = True
+        upload.save(update_fields=['completed', 'updated'])
+    return upload, inserted, skipped, False
+
+def flow_upload_status(upload_id):
+    """Progress of a chunked upload; unknown uploads report nothing received."""
+    upload = FlowUpload.objects.filter(upload_id=upload_id).first()
+    if upload is None:
+        return {'upload_id': upload_id, 'total_chunks': None, 'received': [], 'rows_inserted': 0, 'completed': False}
+    return {
+        'upload_id': upload.upload_id,
+        'total_chunks': upload.total_chunks,
+        'received': list(upload.chunks.order_by('index').values_list('index', flat=True)),
+        'rows_inserted': upload.rows_inserted,
+        'completed': upload.completed,
+    }
+
+# --- Maintenance ---
+def deduplicate_network_flows():
+    """Merges flows stored more than once under the same (flow_key, flow_start_ts).
+
+    Needed once before migrating a database that was filled before the natural key was
+    unique. The newest row of every group is kept; references from other models (e.g.
+    asset detections) are moved to it and a false positive mark on any copy is preserved.
+    Returns the number of deleted rows.
+    """
+    related = [(rel.related_model, rel.field.name) for rel in NetworkFlow._meta.related_objects]
+    groups = (NetworkFlow.objects.filter(flow_key__isnull=False, flow_start_ts__isnull=False)
+              .values('flow_key', 'flow_start_ts').annotate(copies=Count('id')).filter(copies__gt=1))
+    deleted = 0
+    with transaction.atomic():
+        for group in groups.iterator():
+            copies = list(NetworkFlow.objects.filter(flow_key=group['flow_key'], flow_start_ts=group['flow_start_ts'])
+                          .order_by('-id').values_list('id', 'false_positiv'))
+            keep, duplicates = copies[0][0], [pk for pk, _ in copies[1:]]
+            for model, field in related:
+                model.objects.filter(**{f"{field}__in": duplicates}).update(**{field: keep})
+            # Rolled up again: the rollups may still count the deleted copies
+            NetworkFlow.objects.filter(pk=keep).update(false_positiv=any(fp for _, fp in copies), rollup_pending=True)
+            deleted += NetworkFlow.objects.filter(pk__in=duplicates).delete()[0]
+    return deleted
+
+# --- Severity ---
+def flow_severity_levels(benign, rf_confidence, if_anomaly_score):
+    """Vectorized detection severity of flows (arrays), same scale as the asset detections.
+
+    The classifier confidence counts only for flows not predicted Benign and is averaged with
+    the Isolation Forest score (more negative = more anomalous), then mapped from 1..100 to 1..5.
+    """
+    rf_level = np.where(benign, 0, np.round(np.nan_to_num(np.asarray(rf_confidence, dtype=np.float64)) * 100))
+    if_level = np.round(np.nan_to_num(np.asarray(if_anomaly_score, dtype=np.float64)) * -100)
+    return np.round(((rf_level + if_level) / 2 - 1) * 4 / 99 + 1)
+
+# --- Retention ---
+def rollup_frame(rows):
+    """Aggregates flow rows (id, src_ip, dst_ip, flow_start_ts, tot_bytes, label, rf_confidence,
+    if_anomaly_score, if_is_anomaly, false_positiv) into per hour and host totals."""
+    flows = pd.DataFrame(rows, columns=['id', 'src_ip', 'dst_ip', 'flow_start_ts', 'tot_bytes', 'label',
+                                        'rf_confidence', 'if_anomaly_score', 'if_is_anomaly', 'false_positiv'])
+    flows = flows[flows['flow_start_ts'].notna()]
+    benign = flows['label'].isna() | (flows['label'] == "Benign")
+    detected = ~flows['false_positiv'].astype(bool) # False positives are counted as flows only
+    severity = np.clip(flow_severity_levels(benign.to_numpy(), flows['rf_confidence'], flows['if_anomaly_score']), 1, 5)
+    flows = flows.assign(
+        hour=(flows['flow_start_ts'] // 3600 * 3600).astype(np.int64),
+        bytes=flows['tot_bytes'].fillna(0).astype(np.int64),
+        anomalies=(flows['if_is_anomaly'].fillna(False).astype(bool) & detected).astype(np.int64),
+        detections=(~benign & detected).astype(np.int64),
+        severity=np.where(detected, severity, 1).astype(np.int64),
+        flows=1,
+    )
+    columns = ['hour', 'flows', 'bytes', 'anomalies', 'detections', 'severity']
+    # A flow counts for both of its hosts, once if source and destination are the same
+    per_host = pd.concat([
+        flows[flows['src_ip'].notna()][columns].assign(host=flows['src_ip']),
+        flows[flows['dst_ip'].notna() & (flows['dst_ip'] != flows['src_ip'])][columns].assign(host=flows['dst_ip']),
+    ])
+    return per_host.groupby(['hour', 'host'], sort=False).agg(
+        flows=('flows', 'sum'), bytes=('bytes', 'sum'), anomalies=('anomalies', 'sum'),
+        detections=('detections', 'sum'), max_severity=('severity', 'max')).reset_index()
+
+def merge_rollups(totals, replace=False):
+    """Adds aggregated totals to the stored rollups, or replaces them (bulk update of existing rows, bulk create of new ones)."""
+    if totals.empty:
+        return 0
+    hours = {ts: datetime.fromtimestamp(ts, tz=dt_timezone.utc) for ts in totals['hour'].unique().tolist()}
+    existing = {(r.hour, r.host): r for r in NetworkFlowRollup.objects.filter(hour__in=hours.values())}
+    created, updated = [], []
+    for row in totals.to_dict('records'):
+        key = (hours[row['hour']], row['host'])
+        rollup = existing.get(key)
+        if rollup is None:
+            created.append(NetworkFlowRollup(hour=key[0], host=row['host'], max_severity=int(row['max_severity']),
+                                             **{field: int(row[field]) for field in ROLLUP_FIELDS}))
+            continue
+        for field in ROLLUP_FIELDS:
+            setattr(rollup, field, int(row[field]) + (0 if replace else getattr(rollup, field)))
+        rollup.max_severity = int(row['max_severity']) if replace else max(rollup.max_severity, int(row['max_severity']))
+        updated.append(rollup)
+    NetworkFlowRollup.objects.bulk_create(created, batch_size=1000)
+    NetworkFlowRollup.objects.bulk_update(updated, ROLLUP_FIELDS + ['max_severity'], batch_size=1000)
+    return len(created) + len(updated)
+
+def recompute_rollups(rows):
+    """Replaces the rollups of the hours and hosts of the flow rows with totals of all their stored flows."""
+    cells = rollup_frame(rows)
+    totals = []
+    for hour, hosts in cells.groupby('hour')['host']:
+        hosts = hosts.unique().tolist()
+        for start in range(0, len(hosts), ROLLUP_LOOKUP_SIZE):
+            chunk = hosts[start:start + ROLLUP_LOOKUP_SIZE]
+            flows = NetworkFlow.objects.filter(Q(src_ip__in=chunk) | Q(dst_ip__in=chunk), flow_start_ts__gte=int(hour), flow_start_ts__lt=int(hour) + 3600)
+            hour_totals = rollup_frame(list(flows.values_list(*ROLLUP_COLUMNS)))
+            totals.append(hour_totals[hour_totals['host'].isin(chunk)]) # Other hosts of these flows may have more flows
+    return merge_rollups(pd.concat(totals), replace=True) if totals else 0
+
+def flows_by_id(ids):
+    for start in range(0, len(ids), ROLLUP_LOOKUP_SIZE):
+        yield NetworkFlow.objects.filter(id__in=ids[start:start + ROLLUP_LOOKUP_SIZE])
+
+def rollup_network_flows(batch_size=None):
+    """Brings the hourly per host rollups up to date with new and changed flows (rollup_pending).
+
+    Rollups are recomputed from the stored flows of their hour and host, so false positive
+    marks and re-uploaded flows correct the totals instead of being counted again. Hours
+    before the retention cutoff are final, their raw flows are deleted: flows arriving for
+    them later are added and deleted right away, changes to flows already counted there are
+    dropped. Every batch is one transaction. Returns the number of flows rolled up.
+    """
+    batch_size = batch_size or settings.MLNIDS_RETENTION_BATCH_SIZE
+    watermark, _ = FlowRollupWatermark.objects.get_or_create(name=ROLLUP_WATERMARK)
+    final_before = watermark.final_before.timestamp() if watermark.final_before else None
+    pending = NetworkFlow.objects.filter(rollup_pending=True).order_by('id')
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Locked on databases that support it, so a flow changed meanwhile stays pending
+            rows = list(pending.select_for_update(of=('self',)).values_list(*ROLLUP_COLUMNS, 'rolled_up')[:batch_size])
+            if not rows:
+                return total
+            final = [row for row in rows if final_before is not None and row[3] is not None and row[3] < final_before]
+            final_ids = {row[0] for row in final}
+            live = [row[:-1] for row in rows if row[0] not in final_ids]
+            new = [row[:-1] for row in final if not row[-1]]
+            if new:
+                merge_rollups(rollup_frame(new))
+            if live:
+                recompute_rollups(live)
+            for flows in flows_by_id([row[0] for row in final]):
+                delete_flows(flows)
+            for flows in flows_by_id([row[0] for row in live]):
+                flows.update(rolled_up=True, rollup_pending=False)
+        total += len(rows)
+
+def delete_flows(flows):
+    """Deletes a NetworkFlow queryset without loading the rows; references from other models are cleared (or deleted on CASCADE)."""
+    for relation in NetworkFlow._meta.related_objects:
+        related = relation.related_model._base_manager.filter(**{f"{relation.field.name}__in": flows.values('id')})
+        if relation.on_delete is models.CASCADE:
+            related.delete()
+        else:
+            related.update(**{relation.field.name: None})
+    return flows._raw_delete(flows.db)
+
+def apply_flow_retention(retention_days=None, batch_size=None):
+    """Rolls up new and changed flows, then deletes raw flows that started more than retention_days ago.
+
+    The cutoff is rounded down to the hour and only moves forward; the rollups of the hours
+    before it are final from then on (see rollup_network_flows). Only rolled up flows are
+    deleted; deletion runs in id ranges of about batch_size flows with one transaction each,
+    so the database is never locked for long.
+    Returns {'rolled_up': flows added to rollups, 'deleted': raw flows deleted}.
+    """
+    retention_days = settings.MLNIDS_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or settings.MLNIDS_RETENTION_BATCH_SIZE
+    rolled_up = rollup_network_flows(batch_size)
+    watermark = FlowRollupWatermark.objects.get(name=ROLLUP_WATERMARK)
+    cutoff = (timezone.now() - timedelta(days=retention_days)).replace(minute=0, second=0, microsecond=0)
+    if watermark.final_before is None or cutoff > watermark.final_before:
+        watermark.final_before = cutoff
+        watermark.save(update_fields=['final_before', 'updated'])
+    expired = NetworkFlow.objects.filter(rolled_up=True, rollup_pending=False, flow_start_ts__lt=watermark.final_before.timestamp()).order_by('id')
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return {'rolled_up': rolled_up, 'deleted': deleted}
+        with transaction.atomic():
+            deleted += delete_flows(expired.filter(id__gte=ids[0], id__lte=ids[-1]))
+
+def host_activity(since, host=None):
+    """Per host totals since a datetime, read from the rollups (covers flows already deleted by retention)."""
+    rollups = NetworkFlowRollup.objects.filter(hour__gte=since)
+    if host:
+        rollups = rollups.filter(host=host)
+    return (rollups.values('host')
+            .annotate(flows=Sum('flows'), bytes=Sum('bytes'), anomalies=Sum('anomalies'),
+                      detections=Sum('detections'), max_severity=Max('max_severity'))
+            .order_by('-max_severity', '-detections', '-flows', 'host'))
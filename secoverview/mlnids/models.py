@@ -1,4 +1,5 @@
 from django.db import models
+from .flow_schema import flow_schema
 
 class RfPrediction(models.Model):
     label = models.CharField(max_length=50, unique=True)  # e.g., "Benign", "Malicious"
@@ -7,71 +8,106 @@ class RfPrediction(models.Model):
     def __str__(self):
         return self.label
 
+# Model field per flow schema dtype ('label' is the rf_prediction foreign key below)
+SCHEMA_FIELD_TYPES = {
+    'str': (models.CharField, {'max_length': 255}),
+    'ip': (models.GenericIPAddressField, {}),
+    'int': (models.IntegerField, {}),
+    'bigint': (models.BigIntegerField, {}),
+    'float': (models.FloatField, {}),
+    'bool': (models.BooleanField, {}),
+}
+
+def schema_field(column):
+    """Builds the model field for a flow schema column. All columns stay nullable so partial uploads still ingest."""
+    field_class, kwargs = SCHEMA_FIELD_TYPES[column.dtype]
+    return field_class(null=True, blank=True, **kwargs)
+
 class NetworkFlow(models.Model):
-    flow_key = models.CharField(max_length=255, null=True, blank=True)
-    src_ip = models.GenericIPAddressField(null=True, blank=True)
-    dst_ip = models.GenericIPAddressField(null=True, blank=True)
-    src_port = models.IntegerField(null=True, blank=True)
-    dst_port = models.IntegerField(null=True, blank=True)
-    protocol = models.IntegerField(null=True, blank=True)
-    flow_start_ts = models.FloatField(null=True, blank=True)
-    flow_last_ts = models.FloatField(null=True, blank=True)
-    flow_duration = models.FloatField(null=True, blank=True)
-    fwd_pkts_tot = models.IntegerField(null=True, blank=True)
-    bwd_pkts_tot = models.IntegerField(null=True, blank=True)
-    tot_pkts = models.IntegerField(null=True, blank=True)
-    fwd_bytes_tot = models.BigIntegerField(null=True, blank=True)
-    bwd_bytes_tot = models.BigIntegerField(null=True, blank=True)
-    tot_bytes = models.BigIntegerField(null=True, blank=True)
-    fwd_pkt_len_min = models.FloatField(null=True, blank=True)
-    fwd_pkt_len_max = models.FloatField(null=True, blank=True)
-    fwd_pkt_len_mean = models.FloatField(null=True, blank=True)
-    fwd_pkt_len_std = models.FloatField(null=True, blank=True)
-    bwd_pkt_len_min = models.FloatField(null=True, blank=True)
-    bwd_pkt_len_max = models.FloatField(null=True, blank=True)
-    bwd_pkt_len_mean = models.FloatField(null=True, blank=True)
-    bwd_pkt_len_std = models.FloatField(null=True, blank=True)
-    flow_pkt_len_min = models.FloatField(null=True, blank=True)
-    flow_pkt_len_max = models.FloatField(null=True, blank=True)
-    flow_pkt_len_mean = models.FloatField(null=True, blank=True)
-    flow_pkt_len_std = models.FloatField(null=True, blank=True)
-    avg_pkt_size = models.FloatField(null=True, blank=True)
-    fwd_iat_min = models.FloatField(null=True, blank=True)
-    fwd_iat_max = models.FloatField(null=True, blank=True)
-    fwd_iat_mean = models.FloatField(null=True, blank=True)
-    fwd_iat_std = models.FloatField(null=True, blank=True)
-    bwd_iat_min = models.FloatField(null=True, blank=True)
-    bwd_iat_max = models.FloatField(null=True, blank=True)
-    bwd_iat_mean = models.FloatField(null=True, blank=True)
-    bwd_iat_std = models.FloatField(null=True, blank=True)
-    flow_iat_min = models.FloatField(null=True, blank=True)
-    flow_iat_max = models.FloatField(null=True, blank=True)
-    flow_iat_mean = models.FloatField(null=True, blank=True)
-    flow_iat_std = models.FloatField(null=True, blank=True)
-    fwd_header_len = models.BigIntegerField(null=True, blank=True)
-    bwd_header_len = models.BigIntegerField(null=True, blank=True)
-    fwd_seg_size_avg = models.FloatField(null=True, blank=True)
-    bwd_seg_size_avg = models.FloatField(null=True, blank=True)
-    pkts_per_sec = models.FloatField(null=True, blank=True)
-    bytes_per_sec = models.FloatField(null=True, blank=True)
-    fwd_PSH_flags = models.IntegerField(null=True, blank=True)
-    bwd_PSH_flags = models.IntegerField(null=True, blank=True)
-    fwd_URG_flags = models.IntegerField(null=True, blank=True)
-    bwd_URG_flags = models.IntegerField(null=True, blank=True)
-    SYN_flag_cnt = models.IntegerField(null=True, blank=True)
-    FIN_flag_cnt = models.IntegerField(null=True, blank=True)
-    RST_flag_cnt = models.IntegerField(null=True, blank=True)
-    ACK_flag_cnt = models.IntegerField(null=True, blank=True)
-    PSH_flag_cnt = models.IntegerField(null=True, blank=True)
-    URG_flag_cnt = models.IntegerField(null=True, blank=True)
-    down_up_ratio = models.FloatField(null=True, blank=True)
-    init_win_bytes_fwd = models.IntegerField(null=True, blank=True)
-    init_win_bytes_bwd = models.IntegerField(null=True, blank=True)
+    # Flow and prediction columns are added from the shared flow schema below
     rf_prediction = models.ForeignKey(RfPrediction, on_delete=models.SET_NULL, null=True)
-    rf_confidence = models.FloatField(null=True, blank=True)
-    if_anomaly_score = models.FloatField(null=True, blank=True)
-    if_is_anomaly = models.BooleanField(null=True, blank=True)
     false_positiv = models.BooleanField(default=False)
-    
+    # Rollup state (mlnidsops.rollup_network_flows): counted in the rollups, and new or changed since then
+    rolled_up = models.BooleanField(default=False)
+    rollup_pending = models.BooleanField(default=True)
+
+    class Meta:
+        # A flow is identified by its key and start time; ingest upserts on this key
+        constraints = [
+            models.UniqueConstraint(fields=['flow_key', 'flow_start_ts'], name='unique_network_flow'),
+        ]
+        # Composite indexes for the overview (false_positiv, id), per host lookups and time ranges
+        indexes = [
+            models.Index(fields=['false_positiv', 'id'], name='networkflow_fp_id_idx'),
+            models.Index(fields=['src_ip', 'flow_start_ts'], name='networkflow_src_ts_idx'),
+            models.Index(fields=['dst_ip', 'flow_start_ts'], name='networkflow_dst_ts_idx'),
+            models.Index(fields=['rf_prediction', 'flow_start_ts'], name='networkflow_rf_ts_idx'),
+            models.Index(fields=['if_is_anomaly', 'flow_start_ts'], name='networkflow_if_ts_idx'),
+            models.Index(fields=['flow_start_ts'], name='networkflow_ts_idx'),
+            models.Index(fields=['id'], condition=models.Q(rollup_pending=True), name='networkflow_pending_idx'),
+        ]
+
     def __str__(self):
         return f"{self.flow_key}, src_ip: {self.src_ip}, dst_ip: {self.dst_ip}, src_port: {self.src_port}, dst_port: {self.dst_port}, protocol: {self.protocol}, rf_confidence: {self.rf_confidence}, if_anomaly_score: {self.if_anomaly_score}, if_is_anomaly: {self.if_is_anomaly}, duration: {self.flow_duration}, total_packets: {self.tot_pkts}, total_bytes: {self.tot_bytes}"
+
+for column in flow_schema.FLOW_COLUMNS + flow_schema.PREDICTION_COLUMNS:
+    if column.dtype in SCHEMA_FIELD_TYPES:
+        NetworkFlow.add_to_class(column.name, schema_field(column))
+
+class NetworkFlowRollup(models.Model):
+    # Flows aggregated per hour (UTC, by flow start) and host; a flow counts for its source and destination host
+    hour = models.DateTimeField()
+    host = models.GenericIPAddressField()
+    flows = models.BigIntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+    anomalies = models.BigIntegerField(default=0) # Isolation Forest anomalies
+    detections = models.BigIntegerField(default=0) # Flows not predicted Benign by the classifier
+    max_severity = models.IntegerField(choices=[(1, 'Negligible'), (2, 'Low'), (3, 'Medium'), (4, 'High'), (5, 'Critical')], default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'host'], name='unique_network_flow_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['host', 'hour'], name='networkflowrollup_host_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00}, host: {self.host}, flows: {self.flows}, bytes: {self.bytes}, anomalies: {self.anomalies}, detections: {self.detections}, max severity: {self.max_severity}"
+
+class FlowRollupWatermark(models.Model):
+    # Rollup hours before final_before are final: retention deleted their raw flows, so they are no longer recomputed
+    name = models.CharField(max_length=50, unique=True)
+    final_before = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: final before {self.final_before or '-'}"
+
+class FlowUpload(models.Model):
+    # Chunked upload from the analyser, identified by a client chosen idempotency key
+    upload_id = models.CharField(max_length=128, unique=True)
+    total_chunks = models.IntegerField(null=True, blank=True)
+    rows_inserted = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.upload_id}, chunks: {self.chunks.count()}/{self.total_chunks}, rows: {self.rows_inserted}, completed: {self.completed}"
+
+class FlowUploadChunk(models.Model):
+    # One received (and ingested) chunk; the unique key makes resending a chunk a no-op
+    upload = models.ForeignKey(FlowUpload, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    rows = models.IntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    received = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'index'], name='unique_flow_upload_chunk'),
+        ]
+
+    def __str__(self):
+        return f"{self.upload.upload_id} #{self.index}, rows: {self.rows}"
@@ -1,3 +1,88 @@
+import io
+import json
+from datetime import timedelta
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .mlnidsops import apply_flow_retention, ingest_flow_csv, rollup_network_flows
+from .models import FlowUpload, NetworkFlow, NetworkFlowRollup
+
+FLOW_HEADER = "flow_key,src_ip,dst_ip,flow_start_ts,tot_bytes,rf_prediction,rf_confidence,if_anomaly_score,if_is_anomaly\n"
+
+def upload(*flows):
+    """Ingests flows given as (flow key, start datetime, bytes, label) from 10.0.0.1 to 10.0.0.2."""
+    rows = ''.join(f"{key},10.0.0.1,10.0.0.2,{start.timestamp()},{size},{label},0.9,0,False\n" for key, start, size, label in flows)
+    return ingest_flow_csv(io.BytesIO((FLOW_HEADER + rows).encode()))
+
+class FlowRollupTests(TestCase):
+    def setUp(self):
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        self.expired = self.hour - timedelta(days=40)
+
+    def rollup(self, hour=None):
+        rollup = NetworkFlowRollup.objects.get(hour=hour or self.hour, host='10.0.0.1')
+        return rollup.flows, rollup.bytes, rollup.detections, rollup.max_severity
+
+    def test_flows_count_for_both_hosts(self):
+        upload(("a", self.hour, 100, "Malicious"), ("b", self.hour + timedelta(minutes=5), 50, "Benign"))
+        self.assertEqual(rollup_network_flows(), 2)
+        self.assertEqual(self.rollup(), (2, 150, 1, 3))
+        self.assertEqual(NetworkFlowRollup.objects.get(hour=self.hour, host='10.0.0.2').flows, 2)
+        self.assertEqual(rollup_network_flows(), 0)
+
+    def test_false_positive_mark_corrects_the_rollup(self):
+        upload(("a", self.hour, 100, "Malicious"), ("b", self.hour, 50, "Benign"))
+        rollup_network_flows()
+        self.client.force_login(User.objects.create_user('analyst'))
+        flow = NetworkFlow.objects.get(flow_key="a")
+        self.client.post(reverse('mlnidsdetection', args=[flow.id]), {'id': flow.id, 'falsepositiv': True})
+        self.assertEqual(rollup_network_flows(), 1)
+        self.assertEqual(self.rollup(), (2, 150, 0, 1))
+
+    def test_reuploaded_flow_replaces_its_counts(self):
+        upload(("a", self.hour, 100, "Malicious"))
+        rollup_network_flows()
+        upload(("a", self.hour, 500, "Benign"))
+        self.assertEqual(rollup_network_flows(), 1)
+        self.assertEqual(self.rollup(), (1, 500, 0, 1))
+
+    def test_retention_keeps_corrected_rollups_of_deleted_flows(self):
+        upload(("a", self.expired, 100, "Malicious"), ("b", self.hour, 10, "Benign"))
+        rollup_network_flows()
+        upload(("a", self.expired, 300, "Benign")) # Corrected before retention
+        self.assertEqual(apply_flow_retention(retention_days=30), {'rolled_up': 1, 'deleted': 1})
+        self.assertEqual(list(NetworkFlow.objects.values_list('flow_key', flat=True)), ["b"])
+        self.assertEqual(self.rollup(self.expired), (1, 300, 0, 1))
+
+        # A flow arriving for a final hour is added and deleted
+        upload(("c", self.expired, 5, "Malicious"))
+        self.assertEqual(apply_flow_retention(retention_days=30), {'rolled_up': 1, 'deleted': 0})
+        self.assertEqual(self.rollup(self.expired), (2, 305, 1, 3))
+        self.assertFalse(NetworkFlow.objects.filter(flow_key="c").exists())
+
+class FlowUploadChunkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('sensor'))
+        self.start = timezone.now().timestamp()
+
+    def put_chunk(self, index, total_chunks=None):
+        body = json.dumps({'flow_key': [f"chunk-{index}"], 'src_ip': ["10.0.0.1"], 'dst_ip': ["10.0.0.2"], 'flow_start_ts': [self.start]})
+        headers = {'HTTP_X_TOTAL_CHUNKS': str(total_chunks)} if total_chunks else {}
+        return self.client.put(reverse('mlnids_upload_chunk', args=['u1', index]), body, content_type='application/json', **headers)
+
+    def test_index_beyond_the_total_is_rejected(self):
+        self.assertEqual(self.put_chunk(2, total_chunks=2).status_code, 400)
+        self.assertEqual(self.put_chunk(0, total_chunks=2).status_code, 201)
+        self.assertEqual(self.put_chunk(5).status_code, 400) # Total known from the first chunk
+        self.assertEqual(list(FlowUpload.objects.get().chunks.values_list('index', flat=True)), [0])
 
-# Create your tests here.
+    def test_chunks_received_before_the_total_do_not_complete_the_upload(self):
+        self.put_chunk(7)
+        self.put_chunk(0, total_chunks=2)
+        self.assertFalse(FlowUpload.objects.get().completed)
+        self.assertTrue(self.put_chunk(1).json()['completed'])
@@ -3,5 +3,6 @@ from . import views
 
 urlpatterns = [
     path('overview', views.mlnidsoverview, name='mlnidsoverview'),
+    path('history', views.mlnidshistory, name='mlnidshistory'),
     path('detection/<int:pk>', views.mlnidsdetection, name='mlnidsdetection'),
 ]
\ No newline at end of file
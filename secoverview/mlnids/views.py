@@ -3,8 +3,10 @@ from django.http import HttpRequest
 from django.core.paginator import Paginator
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
-from datetime import datetime
+from django.utils import timezone
+from datetime import datetime, timedelta
 from .models import NetworkFlow
+from .mlnidsops import host_activity
 
 @login_required
 def mlnidsoverview(request):
@@ -32,7 +34,7 @@ def mlnidsdetection(request, pk):
     if request.method == 'POST':
         falsepositiv = request.POST.get('falsepositiv')
         id = request.POST.get('id')
-        NetworkFlow.objects.filter(pk=id).update(false_positiv=falsepositiv)
+        NetworkFlow.objects.filter(pk=id).update(false_positiv=falsepositiv, rollup_pending=True) # The rollups are recomputed with the mark
         return redirect('mlnidsoverview')
     flowdata = NetworkFlow.objects.get(pk=pk)
     return render(
@@ -45,3 +47,30 @@ def mlnidsdetection(request, pk):
             'chatcontext':f"Shows ML analysed detections. IF = Isolated Forest, RF = Random Forest. Value: {flowdata}" 
         }
     )
+
+@login_required
+def mlnidshistory(request):
+    """Renders the network activity per host over the last `days` days, optionally for one `host`."""
+    assert isinstance(request, HttpRequest)
+    # Long time ranges are answered from the hourly rollups, raw flows are only kept for MLNIDS_RETENTION_DAYS
+    try:
+        days = max(1, int(request.GET.get('days', 90)))
+    except ValueError:
+        days = 90
+    host = request.GET.get('host') or None
+    hosts = host_activity(timezone.now() - timedelta(days=days), host=host)
+    paginator = Paginator(hosts, 5)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+    return render(
+        request,
+        'mlnidshistory.html',
+        {
+            'title':'ML NIDS',
+            'year':datetime.now().year,
+            'hosts':page_obj,
+            'days':days,
+            'host':host or "",
+            'chatcontext':f"Shows ML analysed network activity per host over the last {days} days (flows, bytes, anomalies, detections, max severity)."
+        }
+    )
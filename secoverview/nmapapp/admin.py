@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Nmapscan, NmapAssets, AssetsNmapscan
+from .models import Nmapscan, NmapAssets, AssetsNmapscan, NmapService
 
 @admin.register(Nmapscan)
 class NmapscanAdmin(admin.ModelAdmin):
@@ -7,10 +7,13 @@ class NmapscanAdmin(admin.ModelAdmin):
         'data', 
         'ip',
         'parameters', 
-        'created_at'
+        'created_at',
+        'status',
+        'shards_done',
+        'shards_total'
     ]
     search_fields = ['ip']
-    list_filter = ['ip']
+    list_filter = ['ip', 'status']
 
 @admin.register(NmapAssets)
 class NmapAssetsAdmin(admin.ModelAdmin):
@@ -28,4 +31,21 @@ class AssetsNmapscanAdmin(admin.ModelAdmin):
         'nmapscan'
     ]
     search_fields = ['assets']
-    list_filter = ['assets']
\ No newline at end of file
+    list_filter = ['assets']
+
+@admin.register(NmapService)
+class NmapServiceAdmin(admin.ModelAdmin):
+    list_display = [
+        'ip_address',
+        'port',
+        'protocol',
+        'state',
+        'service',
+        'product',
+        'version',
+        'first_seen',
+        'last_seen',
+        'missing_since'
+    ]
+    search_fields = ['ip_address', 'service', 'product']
+    list_filter = ['protocol', 'state']
@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class NmapappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'nmapapp'
+
+    def ready(self):
+        from jobs.jobops import job_orphaned
+        from .nmapops import fail_orphaned_scan
+        from .search_ops import create_search_index
+        post_migrate.connect(create_search_index, sender=self)
+        job_orphaned.connect(fail_orphaned_scan)
@@ -0,0 +1,92 @@
+import ipaddress
+import json
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum, TextField
+from django.db.models.functions import Cast, Length
+
+from nmapapp.models import AssetsNmapscan, NmapAssets, Nmapscan
+from nmapapp.nmapops import import_nmap_xml, nmap_host_result, parse_nmap_xml
+
+BENCHMARK_SCAN_IP = "benchmark-import" # Nmapscan.ip of the benchmark scans, removed afterwards unless --keep
+BENCHMARK_FIRST_HOST = ipaddress.ip_address("100.64.0.1") # Shared address space, not used by real scans
+SERVICES = [("ssh", "OpenSSH", "8.9p1", "cpe:/a:openbsd:openssh:8.9p1"), ("http", "nginx", "1.24.0", "cpe:/a:nginx:nginx:1.24.0"),
+            ("https", "Apache httpd", "2.4.58", "cpe:/a:apache:http_server:2.4.58"), ("mysql", "MySQL", "8.0.36", "cpe:/a:mysql:mysql:8.0.36")]
+
+def write_report(f, hosts, ports):
+    """Writes an nmap -sV XML report with the given number of hosts and open ports per host."""
+    f.write(b'<?xml version="1.0"?>\n<nmaprun scanner="nmap" args="nmap -sV">\n')
+    for i in range(hosts):
+        ip = BENCHMARK_FIRST_HOST + i
+        port_elements = ''.join(
+            f'<port protocol="tcp" portid="{1000 + p}"><state state="open" reason="syn-ack"/><service name="{name}" product="{product}" version="{version}" conf="10"><cpe>{cpe}</cpe></service></port>'
+            for p, (name, product, version, cpe) in ((p, SERVICES[(i + p) % len(SERVICES)]) for p in range(ports)))
+        f.write(f'<host><status state="up" reason="syn-ack"/><address addr="{ip}" addrtype="ipv4"/><hostnames><hostname name="host-{i}.example.org" type="PTR"/></hostnames><ports>{port_elements}</ports></host>\n'.encode())
+    f.write(f'<runstats><finished timestr="" elapsed="1"/><hosts up="{hosts}" down="0" total="{hosts}"/></runstats></nmaprun>\n'.encode())
+
+def store_previous(report):
+    """The persistence before streaming: whole report parsed at once, the result stored indented in three places, update_or_create per host."""
+    result = [nmap_host_result(host) for host in ET.parse(report).getroot().findall('host')]
+    with transaction.atomic():
+        scanconfig = Nmapscan.objects.create(data=json.dumps(result, indent=4), ip=BENCHMARK_SCAN_IP, parameters="previous")
+        for data_obj in result:
+            ip_address = data_obj.get("addresses", {}).get("ipv4")
+            hostname = data_obj["hostnames"][0]["name"]
+            asset = NmapAssets.objects.update_or_create(hostname=hostname, ip_address=ip_address, defaults={"added_by_scan": scanconfig, "json_data": json.dumps(data_obj, indent=4)})
+            AssetsNmapscan.objects.create(assets=asset[0], assets_json_data=data_obj, nmapscan=scanconfig)
+    return scanconfig
+
+def json_bytes(queryset, field):
+    return queryset.aggregate(size=Sum(Length(Cast(field, TextField()))))["size"] or 0
+
+def stored_bytes(scan):
+    """Bytes of JSON stored for a scan: scan data, the nmap assets it last updated and its per-host results."""
+    return (json_bytes(Nmapscan.objects.filter(id=scan.id), "data") + json_bytes(NmapAssets.objects.filter(added_by_scan=scan), "json_data")
+            + json_bytes(AssetsNmapscan.objects.filter(nmapscan=scan), "assets_json_data"))
+
+class Command(BaseCommand):
+    help = "Times storing a synthetic nmap XML report (default 10,000 hosts x 10 ports) the previous way and with the streaming bulk import, with stored JSON size and parser memory. Use a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hosts", type=int, default=10000, help="Hosts in the report. Default: 10,000")
+        parser.add_argument("--ports", type=int, default=10, help="Open ports per host. Default: 10")
+        parser.add_argument("--keep", action='store_true', help="Keep the benchmark scans and their nmap assets.")
+
+    def handle(self, *args, **options):
+        if options['hosts'] <= 0 or options['ports'] < 0:
+            raise CommandError("hosts must be positive and ports non-negative.")
+        if Nmapscan.objects.filter(ip=BENCHMARK_SCAN_IP).exists():
+            raise CommandError("Benchmark scans already exist, delete them first.")
+
+        with tempfile.NamedTemporaryFile(suffix='.xml') as report:
+            write_report(report, options['hosts'], options['ports'])
+            report.flush()
+            self.stdout.write(f"Report: {options['hosts']:,} hosts, {report.tell() / 1024 / 1024:.1f} MB")
+
+            tracemalloc.start()
+            ET.parse(report.name).getroot().findall('host')
+            whole_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            for _ in parse_nmap_xml(report.name):
+                pass
+            streaming_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(f"Parser peak memory: whole document {whole_peak / 1024 / 1024:.1f} MB, streaming {streaming_peak / 1024 / 1024:.1f} MB")
+
+            scans = []
+            for name, run in (("previous", lambda: store_previous(report.name)), ("streaming", lambda: import_nmap_xml(report.name, ip=BENCHMARK_SCAN_IP, parameters="streaming")),
+                              ("rescan", lambda: import_nmap_xml(report.name, ip=BENCHMARK_SCAN_IP, parameters="rescan"))):
+                start = time.perf_counter()
+                scans.append(run())
+                seconds = time.perf_counter() - start
+                self.stdout.write(f"{name:<10} {seconds:>7.2f}s ({options['hosts'] / seconds:,.0f} hosts/s), stored JSON {stored_bytes(scans[-1]) / 1024 / 1024:.1f} MB")
+                if name == "previous":
+                    NmapAssets.objects.filter(added_by_scan=scans[-1]).delete() # The streaming run starts without existing hosts, like the previous one
+
+        if not options['keep']:
+            Nmapscan.objects.filter(ip=BENCHMARK_SCAN_IP).delete()
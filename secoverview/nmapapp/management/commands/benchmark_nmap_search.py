@@ -0,0 +1,95 @@
+import ipaddress
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+from nmapapp.models import NmapAssets, Nmapscan
+from nmapapp.nmapops import save_scan_hosts
+from nmapapp.search_ops import search_assets, search_available, search_scans
+
+BENCHMARK_PARAMETERS = "-sV benchmark-search" # Nmapscan.parameters of the generated scans, removed unless --keep
+BENCHMARK_FIRST_HOST = ipaddress.ip_address("100.64.0.0") # Shared address space, not used by real scans
+SERVICES = [(22, "ssh", "OpenSSH", "8.9p1"), (80, "http", "nginx", "1.24.0"), (443, "https", "Apache httpd", "2.4.58"), (3306, "mysql", "MySQL", "8.0.36"), (5432, "postgresql", "PostgreSQL", "16.2")]
+DEFAULT_QUERIES = ["100.64.40.17", "100.64.40.0/24", "web01234", "PostgreSQL", "8.9p1"]
+
+def host_result(ip, number):
+    """Nmap host result (python-nmap layout) with two or three services."""
+    services = [SERVICES[(number + i) % len(SERVICES)] for i in range(2 + number % 2)]
+    return {"hostnames": [{"name": f"web{number:05d}.example.org", "type": "PTR"}], "addresses": {"ipv4": str(ip)}, "vendor": {},
+            "status": {"state": "up", "reason": "syn-ack"},
+            "tcp": {str(port): {"state": "open", "reason": "syn-ack", "name": name, "product": product, "version": version, "extrainfo": "", "conf": "10", "cpe": ""}
+                    for port, name, product, version in services}}
+
+def icontains_scans(query, page):
+    """The scan search before the index: icontains over the scan JSON, Paginator with COUNT."""
+    scans = Nmapscan.objects.filter(Q(data__icontains=query) | Q(ip__icontains=query) | Q(parameters__icontains=query) | Q(created_at__icontains=query)).order_by('-id')
+    return list(Paginator(scans, 5).get_page(page))
+
+def icontains_assets(query, page):
+    assets = NmapAssets.objects.filter(Q(hostname__icontains=query) | Q(ip_address__icontains=query)).order_by('-id')
+    return list(Paginator(assets, 5).get_page(page))
+
+def page_cursor(search, query, page):
+    """Keyset cursor of the given page (None for the first page), found by following the pages before it."""
+    after = None
+    for _ in range(page - 1):
+        _, after = search(query, after)
+        if after is None:
+            break
+    return after
+
+def median_ms(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+class Command(BaseCommand):
+    help = "Times the nmap scan and asset search: the old icontains queries against the index, first and a later page, on synthetic scans (default 20,000 scans x 4 hosts). Use a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("queries", nargs='*', default=DEFAULT_QUERIES, help="Search terms to time.")
+        parser.add_argument("--scans", type=int, default=20000, help="Synthetic scans. Default: 20,000")
+        parser.add_argument("--hosts", type=int, default=4, help="Hosts per scan. Default: 4")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query, the median is reported. Default: 5")
+        parser.add_argument("--page", type=int, default=5, help="Later page to time. Default: 5")
+        parser.add_argument("--keep", action='store_true', help="Keep the generated scans and their nmap assets.")
+
+    def handle(self, *args, **options):
+        if options['scans'] <= 0 or options['hosts'] <= 0 or options['repeat'] <= 0 or options['page'] <= 1:
+            raise CommandError("scans, hosts and repeat must be positive and page larger than 1.")
+        if not search_available():
+            raise CommandError("No full-text index on this database, run migrate (and rebuild_nmap_search) first.")
+        if Nmapscan.objects.filter(parameters=BENCHMARK_PARAMETERS).exists():
+            raise CommandError("Benchmark scans already exist, delete them first.")
+
+        start = time.perf_counter()
+        for number in range(options['scans']):
+            first = BENCHMARK_FIRST_HOST + number * options['hosts']
+            hosts = [host_result(first + i, number * options['hosts'] + i) for i in range(options['hosts'])]
+            # data as stored before host results were kept once, so the icontains search reads what it used to
+            scanconfig = Nmapscan.objects.create(ip=f"{first}-{first + options['hosts'] - 1}", parameters=BENCHMARK_PARAMETERS, data=json.dumps(hosts, indent=4))
+            save_scan_hosts(scanconfig, hosts)
+        self.stdout.write(f"Generated {options['scans']:,} scans with {options['scans'] * options['hosts']:,} hosts in {time.perf_counter() - start:.1f}s.")
+
+        repeat, page = options['repeat'], options['page']
+        self.stdout.write(f"{'query':<18} {'':<7} {'icontains p1':>13} {'icontains p' + str(page):>13} {'index p1':>9} {'index p' + str(page):>9}")
+        for query in options['queries']:
+            for name, search, icontains in (("scans", search_scans, icontains_scans), ("assets", search_assets, icontains_assets)):
+                cursor = page_cursor(search, query, page)
+                results = [
+                    median_ms(lambda: icontains(query, 1), repeat),
+                    median_ms(lambda: icontains(query, page), repeat),
+                    median_ms(lambda: search(query), repeat),
+                    median_ms(lambda: search(query, cursor), repeat),
+                ]
+                self.stdout.write(f"{query:<18} {name:<7} " + ' '.join(f"{ms:>{width}.1f}" for ms, width in zip(results, (13, 13, 9, 9))) + "  (ms)")
+
+        if not options['keep']:
+            Nmapscan.objects.filter(parameters=BENCHMARK_PARAMETERS).delete()
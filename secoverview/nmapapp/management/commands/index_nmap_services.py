@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from nmapapp.nmapops import index_all_scan_services
+
+class Command(BaseCommand):
+    help = "Builds the nmap port history (NmapService) from all stored scans. New scans update it while they are stored, run this once for older scans."
+
+    def handle(self, *args, **options):
+        rows = index_all_scan_services()
+        self.stdout.write(f"Indexed {rows:,} port observations.")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from nmapapp.search_ops import rebuild_search_index, search_available
+
+class Command(BaseCommand):
+    help = "Indexes all stored nmap scans and host results for the scan and asset search (once after upgrading, or to repair the index)."
+
+    def handle(self, *args, **options):
+        total = rebuild_search_index()
+        if not search_available():
+            raise CommandError("This database has no full-text search, the nmap search falls back to icontains.")
+        self.stdout.write(f"Indexed {total:,} scans and host results.")
@@ -1,23 +1,63 @@
 from django.db import models
+import json
 
 class Nmapscan(models.Model):
-    data = models.JSONField()  # Stores JSON data
+    # Sharded scans (nmapops.execute_nmap_scan_db) store the hosts of every shard as it finishes
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(RUNNING, 'Running'), (COMPLETED, 'Completed'), (FAILED, 'Failed')]
+
+    data = models.JSONField(blank=True, null=True)  # Host results of older scans, newer scans keep them in AssetsNmapscan
     ip = models.CharField(max_length=45, null=True)  # Supports both single IP and IP range
     parameters = models.JSONField(blank=True, null=True)  # Additional parameters (optional)
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp when record is created
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=COMPLETED)
+    shards_total = models.IntegerField(default=0)
+    shards_done = models.IntegerField(default=0) # Finished shards, including failed ones
+    shards_failed = models.IntegerField(default=0)
+    hosts_up = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="") # nmap errors of failed shards
+    finished_at = models.DateTimeField(null=True, blank=True)
+    scanned_ports = models.JSONField(blank=True, null=True) # Protocol -> port ranges nmap scanned (<scaninfo services>), e.g. {"tcp": "1-1000"}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ip'], name='nmapscan_ip_idx'),
+            models.Index(fields=['created_at'], name='nmapscan_created_idx'),
+        ]
 
     def __str__(self):
         return f"Record {self.id} - IP: {self.ip or 'N/A'}"
-    
+
+    def percent(self):
+        return int(100 * self.shards_done / self.shards_total) if self.shards_total else None
+
 class NmapAssets(models.Model):
     hostname = models.CharField(max_length=255, blank=True, null=True)
     ip_address = models.GenericIPAddressField()
-    json_data = models.JSONField(blank=True, null=True)
+    json_data = models.JSONField(blank=True, null=True) # Host result of older scans, newer rows reference it (result)
     added_by_scan = models.ForeignKey(Nmapscan, on_delete=models.CASCADE, related_name='scan')
+    result = models.ForeignKey('AssetsNmapscan', on_delete=models.SET_NULL, blank=True, null=True, related_name='+') # Latest host result
+    ip_key = models.CharField(max_length=33, blank=True, default="") # Sortable IP for range searches (search_ops.ip_key)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ip_address', 'hostname'], name='nmapassets_host_idx'),
+            models.Index(fields=['ip_key'], name='nmapassets_ip_key_idx'),
+        ]
 
     def __str__(self):
         return self.ip_address
 
+    def host_data(self):
+        """Latest nmap host result of this asset."""
+        if self.result_id:
+            return self.result.assets_json_data
+        if isinstance(self.json_data, str): # Stored JSON encoded by older versions
+            return json.loads(self.json_data)
+        return self.json_data or {}
+
 class AssetsNmapscan(models.Model):
     assets = models.ForeignKey(NmapAssets, on_delete=models.CASCADE)
     assets_json_data = models.JSONField(blank=True, null=True)
@@ -25,4 +65,35 @@ class AssetsNmapscan(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=True)
 
     def __str__(self):
-        return f"Record {self.id} - IP: {self.assets or 'N/A'}"
\ No newline at end of file
+        return f"Record {self.id} - IP: {self.assets or 'N/A'}"
+class NmapService(models.Model):
+    # Port history of a host, one row per (ip, port, protocol), updated from every scan (nmapops.index_scan_services)
+    ip_address = models.GenericIPAddressField()
+    port = models.IntegerField()
+    protocol = models.CharField(max_length=8) # tcp, udp, sctp or ip
+    state = models.CharField(max_length=32, blank=True, default="")
+    service = models.CharField(max_length=255, blank=True, default="")
+    product = models.CharField(max_length=255, blank=True, default="")
+    version = models.CharField(max_length=255, blank=True, default="")
+    extrainfo = models.CharField(max_length=255, blank=True, default="")
+    cpe = models.CharField(max_length=255, blank=True, default="")
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    changed_at = models.DateTimeField() # Last change of state or service detection, first_seen for new ports
+    previous = models.JSONField(blank=True, null=True) # Values before the last change
+    missing_since = models.DateTimeField(blank=True, null=True) # A later scan of the host did not report the port
+    first_scan = models.ForeignKey(Nmapscan, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    last_scan = models.ForeignKey(Nmapscan, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ip_address', 'port', 'protocol'], name='nmapservice_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['first_seen'], name='nmapservice_first_seen_idx'),
+            models.Index(fields=['changed_at'], name='nmapservice_changed_idx'),
+            models.Index(fields=['missing_since'], name='nmapservice_missing_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ip_address}:{self.port}/{self.protocol}"
@@ -1,6 +1,19 @@
-from .models import NmapAssets, Nmapscan, AssetsNmapscan
-import nmap
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from datetime import timedelta
+from .models import NmapAssets, Nmapscan, AssetsNmapscan, NmapService
+from .search_ops import index_result_search, index_scan_search, ip_key
+import ipaddress
+import itertools
 import json
+import re
+import shlex
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
 
 def parse_cpe_info(cpe_str):
     if cpe_str == None:
@@ -20,26 +33,387 @@ def parse_cpe_info(cpe_str):
 
     return cpe_type, parts[1] if len(parts) > 1 else None, parts[2] if len(parts) > 2 else None, parts[3] if len(parts) > 3 else None,parts[4] if len(parts) > 4 else None, parts[5] if len(parts) > 5 else None, parts[6] if len(parts) > 6 else None
 
-def execute_nmap_scan(ip, parameters):
-    scanner = nmap.PortScanner()
-    # Scan the subnet with service detection
-    scanner.scan(hosts=ip, arguments=parameters)
-    combined = []
-    for host in scanner.all_hosts():
-        combined.append(scanner[host])
-    return combined
-    
-def execute_nmap_scan_db(ip, parameters):
-    result = execute_nmap_scan(ip, parameters)
-    json_data_dump = json.dumps(result, indent=4)
-    scanconfig = Nmapscan.objects.create(data=json_data_dump, ip=ip, parameters=parameters)
-
-    for data_obj in result:
-        ip_address = data_obj.get("addresses", {}).get("ipv4")
-        hostnames = data_obj.get("hostnames", [])
-        hostname = hostnames[0].get("name") if hostnames else ""
-
-        asset = NmapAssets.objects.update_or_create(hostname=hostname, ip_address=ip_address, defaults={"added_by_scan": scanconfig, "json_data": json.dumps(data_obj, indent=4)})
-        AssetsNmapscan.objects.create(assets=asset[0], assets_json_data=data_obj, nmapscan=scanconfig)
-    
+# --- XML Parsing ---
+# nmap's XML output (-oX) is parsed host by host while it is read, into the host result
+# layout of python-nmap (PortScanner()[host]) that the stored scans and asset gathering use.
+HOST_BATCH_SIZE = 500 # Hosts per bulk query, below SQLite's parameter limit
+
+class NmapScanError(Exception):
+    pass
+
+def nmap_host_result(host):
+    """Host result dict of a <host> element, as python-nmap builds it (port numbers as strings, like stored JSON)."""
+    addresses, vendor = {}, {}
+    for address in host.findall('address'):
+        addresses[address.get('addrtype')] = address.get('addr')
+        if address.get('addrtype') == 'mac' and address.get('vendor') is not None:
+            vendor[address.get('addr')] = address.get('vendor')
+    hostnames = [{'name': name.get('name'), 'type': name.get('type')} for name in host.findall('hostnames/hostname')]
+    data = {'hostnames': hostnames or [{'name': '', 'type': ''}], 'addresses': addresses, 'vendor': vendor}
+    for status in host.findall('status'):
+        data['status'] = {'state': status.get('state'), 'reason': status.get('reason')}
+    for uptime in host.findall('uptime'):
+        data['uptime'] = {'seconds': uptime.get('seconds'), 'lastboot': uptime.get('lastboot')}
+
+    for port in host.findall('ports/port'):
+        state = port.find('state')
+        service = port.find('service')
+        service = service if service is not None else ET.Element('service')
+        cpes = service.findall('cpe')
+        record = {
+            'state': state.get('state') if state is not None else '',
+            'reason': state.get('reason') if state is not None else '',
+            'name': service.get('name', ''),
+            'product': service.get('product', ''),
+            'version': service.get('version', ''),
+            'extrainfo': service.get('extrainfo', ''),
+            'conf': service.get('conf', ''),
+            'cpe': cpes[-1].text if cpes else '',
+        }
+        scripts = {script.get('id'): script.get('output') for script in port.findall('script')}
+        if scripts:
+            record['script'] = scripts
+        data.setdefault(port.get('protocol'), {})[port.get('portid')] = record
+
+    hostscripts = [{'id': script.get('id'), 'output': script.get('output')} for script in host.findall('hostscript/script')]
+    if hostscripts:
+        data['hostscript'] = hostscripts
+    for os_element in host.findall('os'):
+        data['portused'] = [{'state': used.get('state'), 'proto': used.get('proto'), 'portid': used.get('portid')} for used in os_element.findall('portused')]
+        data['osmatch'] = [{
+            'name': match.get('name'), 'accuracy': match.get('accuracy'), 'line': match.get('line'),
+            'osclass': [{'type': osclass.get('type'), 'vendor': osclass.get('vendor'), 'osfamily': osclass.get('osfamily'),
+                         'osgen': osclass.get('osgen'), 'accuracy': osclass.get('accuracy'), 'cpe': [cpe.text for cpe in osclass.findall('cpe')]}
+                        for osclass in match.findall('osclass')],
+        } for match in os_element.findall('osmatch')]
+    for fingerprint in host.findall('osfingerprint'):
+        data['fingerprint'] = fingerprint.get('fingerprint')
+    return data
+
+def parse_nmap_xml(source, scanned_ports=None):
+    """
+    Yields the host results of nmap XML output (path, file or pipe) while it is read. Parsed hosts are dropped from the tree.
+    scanned_ports, a dict, is filled with protocol -> scanned port ranges of the <scaninfo> elements, which precede the hosts.
+    """
+    root = None
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+        if root is None:
+            root = element
+        elif event == 'end' and element.tag == 'host':
+            yield nmap_host_result(element)
+            root.clear()
+        elif event == 'end' and element.tag == 'scaninfo' and scanned_ports is not None and element.get('protocol'):
+            protocol = element.get('protocol')
+            scanned_ports[protocol] = ','.join(filter(None, [scanned_ports.get(protocol), element.get('services')]))
+
+# --- Sharded Scans ---
+# A scan is split into shards (CIDR ranges into /24 subnets, other targets in groups) which
+# run as separate nmap processes in a thread pool. The calling thread stores the hosts of
+# each shard as soon as it finishes, so results and progress show up while the scan runs.
+MAX_SHARDS = 65536 # A /8 in /24 shards
+SHARD_TARGETS = 256 # Single IPs, hostnames and nmap ranges per shard
+# Allowed nmap options. nmap parses them with getopt_long_only, which also accepts single dash
+# and abbreviated long options (-datadir, --datad), so anything not listed exactly is rejected.
+# Options that read or write files (-oX, -iL, --excludefile, --script, --resume, ...) are not listed.
+SCAN_FLAGS = {
+    '-sS', '-sT', '-sA', '-sW', '-sM', '-sU', '-sN', '-sF', '-sX', '-sY', '-sZ', '-sO', '-sn', '-sL', '-sV', '-sC',
+    '-Pn', '-PE', '-PP', '-PM', '-n', '-R', '-F', '-r', '-O', '-A', '-6', '-v', '-vv', '-d', '-dd',
+    '--open', '--reason', '--traceroute', '--osscan-limit', '--osscan-guess', '--version-light', '--version-all',
+    '--system-dns', '--disable-arp-ping', '--randomize-hosts', '--defeat-rst-ratelimit',
+}
+SCAN_FLAG_PATTERN = re.compile(r'-T[0-5]|-p[\w,\-:]+|-P[SAUY][\d,\-]*|-v[0-9]|-d[0-9]') # Short options with their value attached
+SCAN_VALUE = r'[\w.,:/\-]+'
+SCAN_OPTIONS = { # Options followed by a value (-p 22 or --top-ports=100), with the allowed values
+    '-p': SCAN_VALUE, '--exclude-ports': SCAN_VALUE, '--exclude': SCAN_VALUE, '--top-ports': r'\d+', '--port-ratio': r'[\d.]+',
+    '--version-intensity': r'\d', '--max-retries': r'\d+', '--host-timeout': r'\d+[smh]?', '--scan-delay': r'\d+(ms|[smh])?',
+    '--max-scan-delay': r'\d+(ms|[smh])?', '--min-rate': r'[\d.]+', '--max-rate': r'[\d.]+', '--min-hostgroup': r'\d+',
+    '--max-hostgroup': r'\d+', '--min-parallelism': r'\d+', '--max-parallelism': r'\d+', '--min-rtt-timeout': r'\d+(ms|[smh])?',
+    '--max-rtt-timeout': r'\d+(ms|[smh])?', '--initial-rtt-timeout': r'\d+(ms|[smh])?', '--max-os-tries': r'\d+',
+}
+RUNNING_SCAN_TIMEOUT = timedelta(days=1) # Scans still running after this are treated as dead by last_complete_scan_id
+
+def check_scan_arguments(parameters):
+    """Rejects everything but the allowed scan options, output is always XML on stdout."""
+    arguments = iter(shlex.split(parameters or ''))
+    for argument in arguments:
+        if argument in SCAN_FLAGS or SCAN_FLAG_PATTERN.fullmatch(argument):
+            continue
+        option, equals, value = argument.partition('=')
+        if option not in SCAN_OPTIONS or (equals and not option.startswith('--')):
+            raise ValueError(f"nmap option {argument} is not allowed.")
+        if not equals:
+            value = next(arguments, '')
+        if value.startswith('-') or not re.fullmatch(SCAN_OPTIONS[option], value):
+            raise ValueError(f"Invalid value for nmap option {option}: {value or 'missing'}")
+
+def shard_targets(ip, shard_prefix=None):
+    """
+    Splits an nmap target specification (whitespace or comma separated) into lists of targets
+    that are scanned by one nmap process each. Networks larger than shard_prefix are split
+    into subnets, everything else is grouped into chunks of SHARD_TARGETS.
+    """
+    shard_prefix = settings.NMAP_SHARD_PREFIX if shard_prefix is None else shard_prefix
+    shards, others = [], []
+    for target in (ip or '').replace(',', ' ').split():
+        if target.startswith('-'): # Would be passed to nmap as an option
+            raise ValueError(f"Invalid target {target}.")
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError:
+            others.append(target) # Hostname or nmap range such as 10.0.0-3.1-254
+            continue
+        new_prefix = shard_prefix if network.version == 4 else shard_prefix + 96
+        if network.prefixlen >= new_prefix:
+            others.append(target)
+            continue
+        if 2 ** (new_prefix - network.prefixlen) + len(shards) > MAX_SHARDS:
+            raise ValueError(f"{target} is too large to scan, split it into smaller ranges.")
+        shards.extend([str(subnet)] for subnet in network.subnets(new_prefix=new_prefix))
+    shards.extend(others[start:start + SHARD_TARGETS] for start in range(0, len(others), SHARD_TARGETS))
+    return shards
+
+def scan_shard(targets, parameters):
+    """Runs one nmap process over the targets and returns its host results, parsed while nmap writes them, and the scanned ports."""
+    scanned_ports = {}
+    with tempfile.TemporaryFile() as stderr: # A file instead of a pipe, nmap must never block on a full stderr pipe
+        process = subprocess.Popen([settings.NMAP_PATH, '-oX', '-', *shlex.split(parameters), '--', *targets], stdout=subprocess.PIPE, stderr=stderr) # -- ends nmap's options
+        try:
+            hosts = list(parse_nmap_xml(process.stdout, scanned_ports))
+        except ET.ParseError: # No (or truncated) XML, e.g. invalid arguments
+            hosts = None
+        finally:
+            process.stdout.close()
+            process.wait()
+        if hosts is None or (process.returncode != 0 and not hosts):
+            stderr.seek(0)
+            raise NmapScanError(stderr.read().decode(errors='replace').strip() or f"nmap exited with {process.returncode}")
+    return hosts, scanned_ports
+
+def save_scanned_ports(scanconfig, scanned_ports):
+    """Stores the scanned port ranges of a scan once, before its hosts (index_scan_services reads them)."""
+    if scanned_ports and not scanconfig.scanned_ports:
+        scanconfig.scanned_ports = dict(scanned_ports)
+        Nmapscan.objects.filter(id=scanconfig.id).update(scanned_ports=scanconfig.scanned_ports)
+
+def host_key(data_obj):
+    """(IP, first hostname) of a host result, the key of NmapAssets."""
+    addresses = data_obj.get("addresses", {})
+    hostnames = data_obj.get("hostnames", [])
+    return addresses.get("ipv4") or addresses.get("ipv6"), hostnames[0].get("name") if hostnames else ""
+
+def save_scan_hosts(scanconfig, hosts):
+    """
+    Stores the host results of a shard with a few bulk queries: every result once in
+    AssetsNmapscan (the scan history), NmapAssets (one per IP and hostname) reference
+    their latest result, the port history in NmapService and the search index.
+    """
+    hosts_by_key = {host_key(data_obj): data_obj for data_obj in hosts}
+    keys = list(hosts_by_key)
+
+    with transaction.atomic():
+        assets = {}
+        for start in range(0, len(keys), HOST_BATCH_SIZE):
+            ips = {ip_address for ip_address, _ in keys[start:start + HOST_BATCH_SIZE]}
+            for asset in NmapAssets.objects.filter(ip_address__in=ips).order_by('-id').only('id', 'ip_address', 'hostname'):
+                assets[(asset.ip_address, asset.hostname)] = asset # Lowest id wins for hosts stored more than once
+        new_assets = [NmapAssets(ip_address=ip_address, hostname=hostname, added_by_scan=scanconfig, ip_key=ip_key(ip_address)) for ip_address, hostname in keys if (ip_address, hostname) not in assets]
+        NmapAssets.objects.bulk_create(new_assets, batch_size=HOST_BATCH_SIZE)
+        assets.update({(asset.ip_address, asset.hostname): asset for asset in new_assets})
+
+        results = [AssetsNmapscan(assets=assets[key], assets_json_data=hosts_by_key[key], nmapscan=scanconfig) for key in keys]
+        AssetsNmapscan.objects.bulk_create(results, batch_size=HOST_BATCH_SIZE)
+        # One prepared UPDATE for all hosts, bulk_update's CASE expressions took most of the time
+        meta, quote = NmapAssets._meta, connection.ops.quote_name
+        columns = [quote(meta.get_field(name).column) for name in ('added_by_scan', 'result', 'json_data')]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"UPDATE {quote(meta.db_table)} SET {columns[0]} = %s, {columns[1]} = %s, {columns[2]} = NULL WHERE id = %s",
+                               [(scanconfig.id, result.id, assets[key].id) for key, result in zip(keys, results)])
+        index_scan_services(scanconfig, hosts_by_key.values())
+        index_result_search(results)
+    return len(keys)
+
+def execute_nmap_scan_db(ip, parameters, progress=None, parallelism=None, shard_prefix=None):
+    """
+    Scans ip (nmap targets) with the nmap parameters in shards, up to parallelism nmap
+    processes at once (default NMAP_SCAN_PARALLELISM). Hosts are stored per finished shard,
+    the Nmapscan counts finished shards. Failed shards are recorded and the scan continues.
+    Returns the host results.
+    """
+    parameters = parameters or ''
+    check_scan_arguments(parameters)
+    shards = shard_targets(ip, shard_prefix)
+    parallelism = max(1, parallelism or settings.NMAP_SCAN_PARALLELISM)
+    scanconfig = Nmapscan.objects.create(ip=ip, parameters=parameters, status=Nmapscan.RUNNING, shards_total=len(shards))
+    index_scan_search([scanconfig])
+    result, errors = [], []
+    if progress: # The scan id lets fail_orphaned_scan fail the scan if the worker dies
+        progress(0, len(shards), f"Scanning {len(shards)} shards", result={'scan_id': scanconfig.id})
+
+    executor = ThreadPoolExecutor(max_workers=min(parallelism, len(shards) or 1), thread_name_prefix=f"nmap-{scanconfig.id}")
+    try:
+        futures = {executor.submit(scan_shard, shard, parameters): shard for shard in shards}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                hosts, scanned_ports = future.result()
+            except Exception as e:
+                message = f"{' '.join(futures[future])}: {e}"
+                print(f"nmap shard {message}")
+                errors.append(message)
+                hosts, scanned_ports = [], {}
+            save_scanned_ports(scanconfig, scanned_ports)
+            save_scan_hosts(scanconfig, hosts)
+            result.extend(hosts)
+            Nmapscan.objects.filter(id=scanconfig.id).update(shards_done=done, shards_failed=len(errors), hosts_up=len(result), error='\n'.join(errors))
+            if progress:
+                progress(done, len(shards), f"{done}/{len(shards)} shards, {len(result)} hosts")
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        Nmapscan.objects.filter(id=scanconfig.id).update(status=Nmapscan.FAILED, finished_at=timezone.now())
+        raise
+    executor.shutdown()
+
+    status = Nmapscan.FAILED if shards and len(errors) == len(shards) else Nmapscan.COMPLETED
+    Nmapscan.objects.filter(id=scanconfig.id).update(status=status, finished_at=timezone.now())
     return result
+
+def fail_orphaned_scan(sender, job, **kwargs):
+    """job_orphaned receiver: fails the scan of a scan job whose worker died, so last_complete_scan_id does not wait for RUNNING_SCAN_TIMEOUT."""
+    if job.task == 'nmapapp.nmapops.execute_nmap_scan_db' and (job.result or {}).get('scan_id'):
+        Nmapscan.objects.filter(id=job.result['scan_id'], status=Nmapscan.RUNNING).update(status=Nmapscan.FAILED, finished_at=timezone.now())
+
+def import_nmap_xml(file, ip='', parameters=''):
+    """Stores the hosts of an nmap XML report (path or binary file) as a scan, in batches while parsing. Returns the Nmapscan."""
+    scanconfig = Nmapscan.objects.create(ip=ip, parameters=parameters, status=Nmapscan.RUNNING)
+    index_scan_search([scanconfig])
+    try:
+        hosts, scanned_ports = 0, {}
+        results = parse_nmap_xml(file, scanned_ports)
+        while batch := list(itertools.islice(results, HOST_BATCH_SIZE)):
+            save_scanned_ports(scanconfig, scanned_ports)
+            hosts += save_scan_hosts(scanconfig, batch)
+            Nmapscan.objects.filter(id=scanconfig.id).update(hosts_up=hosts)
+    except BaseException:
+        Nmapscan.objects.filter(id=scanconfig.id).update(status=Nmapscan.FAILED, finished_at=timezone.now())
+        raise
+    Nmapscan.objects.filter(id=scanconfig.id).update(status=Nmapscan.COMPLETED, finished_at=timezone.now())
+    scanconfig.refresh_from_db()
+    return scanconfig
+
+def scan_hosts(scanconfig):
+    """Host results of a scan: from AssetsNmapscan, or the data column of scans stored before."""
+    if scanconfig.data:
+        return json.loads(scanconfig.data) if isinstance(scanconfig.data, str) else scanconfig.data
+    return list(AssetsNmapscan.objects.filter(nmapscan=scanconfig).order_by('id').values_list('assets_json_data', flat=True))
+
+# --- Service History ---
+# NmapService keeps one row per (ip, port, protocol) with first and last sighting, so
+# "what changed" is an indexed query instead of diffing stored host results.
+SERVICE_PROTOCOLS = ('tcp', 'udp', 'sctp', 'ip')
+SERVICE_FIELDS = ['state', 'service', 'product', 'version', 'extrainfo', 'cpe']
+CHANGES_LIMIT = 500 # Rows per change list
+
+def host_services(data_obj):
+    """(port, protocol) -> NmapService values of the ports in a host result."""
+    services = {}
+    for protocol in SERVICE_PROTOCOLS:
+        for port, info in (data_obj.get(protocol) or {}).items():
+            services[(int(port), protocol)] = {
+                'state': info.get('state') or '',
+                'service': info.get('name') or '',
+                'product': info.get('product') or '',
+                'version': info.get('version') or '',
+                'extrainfo': info.get('extrainfo') or '',
+                'cpe': info.get('cpe') or '',
+            }
+    return services
+
+def port_ranges(services):
+    """[(first, last)] of an nmap port list such as 1-1000 or 22,80,8000-8100."""
+    ranges = []
+    for part in (services or '').split(','):
+        first, _, last = part.partition('-')
+        if first.isdigit() and (last or first).isdigit():
+            ranges.append((int(first), int(last or first)))
+    return ranges
+
+def index_scan_services(scanconfig, hosts):
+    """
+    Updates the port history with the host results of a scan, seen at the scan start.
+    Ports inside the scanned port ranges that the host no longer reports get missing_since,
+    also when it reports no ports at all; without scanned ranges (older scans, ping scans)
+    no port is marked missing. Scans can be indexed in any order, an older scan only moves
+    first_seen back.
+    """
+    seen_at = scanconfig.created_at
+    scanned = {protocol: port_ranges(services) for protocol, services in (scanconfig.scanned_ports or {}).items()}
+    reported = {}
+    for data_obj in hosts:
+        ip_address, _ = host_key(data_obj)
+        reported.setdefault(ip_address, {}).update(host_services(data_obj))
+    ips = list(reported)
+    existing = {}
+    for start in range(0, len(ips), HOST_BATCH_SIZE):
+        for service in NmapService.objects.filter(ip_address__in=ips[start:start + HOST_BATCH_SIZE]):
+            existing.setdefault(service.ip_address, {})[(service.port, service.protocol)] = service
+
+    rows = []
+    for ip_address, services in reported.items():
+        known = existing.get(ip_address, {})
+        for (port, protocol), values in services.items():
+            row = known.get((port, protocol))
+            if row is None:
+                row = NmapService(ip_address=ip_address, port=port, protocol=protocol, first_seen=seen_at, last_seen=seen_at, changed_at=seen_at, first_scan=scanconfig, last_scan=scanconfig, **values)
+            elif seen_at < row.first_seen:
+                row.first_seen, row.first_scan = seen_at, scanconfig
+            elif seen_at > row.last_seen:
+                previous = {field: getattr(row, field) for field in SERVICE_FIELDS if getattr(row, field) != values[field]}
+                if row.missing_since:
+                    previous['missing_since'] = row.missing_since.isoformat()
+                if previous:
+                    row.previous, row.changed_at = previous, seen_at
+                for field, value in values.items():
+                    setattr(row, field, value)
+                row.last_seen, row.last_scan, row.missing_since = seen_at, scanconfig, None
+            else:
+                continue
+            rows.append(row)
+        for (port, protocol), row in known.items():
+            if (port, protocol) in services or row.missing_since is not None or row.last_seen >= seen_at:
+                continue
+            if any(first <= port <= last for first, last in scanned.get(protocol, ())):
+                row.missing_since = seen_at
+                rows.append(row)
+
+    # Upsert on (ip, port, protocol), rows are copied without id so existing ones take the conflict path
+    fields = [field.name for field in NmapService._meta.concrete_fields if field.name != 'id']
+    NmapService.objects.bulk_create([NmapService(**{field: getattr(row, field) for field in fields}) for row in rows], batch_size=HOST_BATCH_SIZE,
+                                    update_conflicts=True, unique_fields=['ip_address', 'port', 'protocol'], update_fields=[field for field in fields if field not in ('ip_address', 'port', 'protocol')])
+    return len(rows)
+
+def index_all_scan_services():
+    """Builds the port history from every stored scan, e.g. for scans stored before it existed."""
+    rows = 0
+    for scanconfig in Nmapscan.objects.order_by('id').iterator(chunk_size=20):
+        with transaction.atomic():
+            rows += index_scan_services(scanconfig, scan_hosts(scanconfig))
+    return rows
+
+def service_changes(since, ip=None, limit=CHANGES_LIMIT):
+    """Ports opened (first seen), changed (state or service detection) and missing (no longer reported) since the given time."""
+    services = NmapService.objects.all()
+    if ip:
+        services = services.filter(ip_address=ip)
+    return {
+        'opened': services.filter(first_seen__gte=since).order_by('-first_seen', 'ip_address', 'port')[:limit],
+        'changed': services.filter(changed_at__gte=since, first_seen__lt=since).order_by('-changed_at', 'ip_address', 'port')[:limit],
+        'missing': services.filter(missing_since__gte=since).order_by('-missing_since', 'ip_address', 'port')[:limit],
+    }
+
+def last_complete_scan_id():
+    """
+    Highest Nmapscan id below every running scan. Running scans store hosts shard by shard,
+    incremental readers (asset gathering) must not move their watermark past them.
+    """
+    running = Nmapscan.objects.filter(status=Nmapscan.RUNNING, created_at__gt=timezone.now() - RUNNING_SCAN_TIMEOUT).aggregate(first=Min("id"))["first"]
+    scans = Nmapscan.objects.filter(id__lt=running) if running else Nmapscan.objects.all()
+    return scans.aggregate(last=Max("id"))["last"] or 0
@@ -0,0 +1,177 @@
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import datetime, time, timedelta
+from .models import AssetsNmapscan, NmapAssets, Nmapscan
+import ipaddress
+import re
+
+RESULT_SEARCH_TABLE = 'nmapapp_resultsearch' # Host results (AssetsNmapscan): hostnames, addresses, ports, services, products, CPEs, OS
+SCAN_SEARCH_TABLE = 'nmapapp_scansearch' # Scans: targets and parameters
+SEARCH_PROTOCOLS = ('tcp', 'udp', 'sctp', 'ip')
+SEARCH_INDEX_BATCH_SIZE = 1000 # Rows per transaction when rebuilding the index
+PAGE_SIZE = 5
+
+# --- Index Tables ---
+# Not models, like the CVE search: SQLite keeps the documents in FTS5 virtual tables with the
+# AssetsNmapscan / Nmapscan id as rowid, Postgres in tsvector columns with a GIN index.
+# Created after migrate (see apps.py), other databases fall back to icontains.
+def create_search_index(using='default', **kwargs):
+    """Creates the full-text tables if the database supports it. Connected to post_migrate."""
+    db = connections[using]
+    with db.cursor() as cursor:
+        for table in (RESULT_SEARCH_TABLE, SCAN_SEARCH_TABLE):
+            if db.vendor == 'sqlite':
+                try:
+                    cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(document, tokenize='unicode61')")
+                except Exception as e:
+                    print(f"SQLite without FTS5, nmap search falls back to icontains: {e}")
+                    return
+            elif db.vendor == 'postgresql':
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (id bigint PRIMARY KEY, document tsvector NOT NULL)")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_document_idx ON {table} USING GIN (document)")
+
+_search_available = set() # Aliases of databases known to have the full-text tables
+
+def search_available():
+    """Whether the full-text tables exist on the default database."""
+    if connection.alias in _search_available:
+        return True
+    if connection.vendor in ('sqlite', 'postgresql') and {RESULT_SEARCH_TABLE, SCAN_SEARCH_TABLE} <= set(connection.introspection.table_names()):
+        _search_available.add(connection.alias)
+        return True
+    return False
+
+def ip_key(ip):
+    """Sortable key of an IP: version and the address as 32 hex digits (IPv6 does not fit an integer column)."""
+    address = ipaddress.ip_address(ip)
+    return f"{address.version}{int(address):032x}"
+
+def result_search_document(data_obj):
+    """Searchable text of a host result: hostnames, addresses, MAC vendors, ports with their service detection and OS matches."""
+    words = [hostname.get('name') or '' for hostname in data_obj.get('hostnames') or []]
+    words += [*(data_obj.get('addresses') or {}).values(), *(data_obj.get('vendor') or {}).values()]
+    for protocol in SEARCH_PROTOCOLS:
+        for port, info in (data_obj.get(protocol) or {}).items():
+            words += [str(port), info.get('name') or '', info.get('product') or '', info.get('version') or '', info.get('extrainfo') or '', info.get('cpe') or '']
+    words += [match.get('name') or '' for match in data_obj.get('osmatch') or []]
+    return ' '.join(word for word in words if word)
+
+def scan_search_document(scanconfig):
+    return f"{scanconfig.ip or ''} {scanconfig.parameters or ''}"
+
+def index_documents(table, rows):
+    """Replaces the full-text documents of (id, document) rows. Call inside the transaction storing them."""
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(f"INSERT INTO {table} (rowid, document) VALUES (%s, %s)", rows)
+        else:
+            cursor.executemany(f"INSERT INTO {table} (id, document) VALUES (%s, to_tsvector('simple', %s)) "
+                               "ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document", rows)
+    return len(rows)
+
+def index_result_search(results):
+    """Indexes stored AssetsNmapscan host results."""
+    return index_documents(RESULT_SEARCH_TABLE, [(result.id, result_search_document(result.assets_json_data or {})) for result in results])
+
+def index_scan_search(scans):
+    return index_documents(SCAN_SEARCH_TABLE, [(scanconfig.id, scan_search_document(scanconfig)) for scanconfig in scans])
+
+# --- Search ---
+# IPs and CIDR ranges are ip_key range lookups, dates the scan day, everything else a
+# prefix match on the words of the documents (web01 finds web01.example.org, "10.1.2" 10.1.2.0/24).
+def ip_range(query):
+    """(first, last) ip_key of an IP or CIDR query, None for other queries."""
+    try:
+        network = ipaddress.ip_network(query, strict=False)
+    except ValueError:
+        return None
+    return ip_key(network.network_address), ip_key(network.broadcast_address)
+
+def query_date(query):
+    try:
+        return parse_date(query)
+    except ValueError:
+        return None
+
+def matches_sql(table, query):
+    """SQL and params selecting the ids whose document has every word of the query (as prefix), None without words."""
+    words = [' '.join(re.findall(r'\w+', word)) for word in query.split()]
+    words = [word for word in words if word]
+    if not words:
+        return None
+    if connection.vendor == 'sqlite':
+        return f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [' '.join(f'"{word}"*' for word in words)]
+    return f"SELECT id FROM {table} WHERE document @@ to_tsquery('simple', %s)", [' & '.join(f"{token}:*" for word in words for token in word.split())]
+
+def scans_filter(query):
+    ips, day = ip_range(query), query_date(query)
+    if ips:
+        return Q(ip=query) | Q(id__in=AssetsNmapscan.objects.filter(assets__ip_key__range=ips).values('nmapscan_id'))
+    if day:
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        return Q(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+    results, scans = matches_sql(RESULT_SEARCH_TABLE, query), matches_sql(SCAN_SEARCH_TABLE, query)
+    if not search_available() or results is None:
+        return Q(data__icontains=query) | Q(id__in=AssetsNmapscan.objects.filter(assets_json_data__icontains=query).values('nmapscan_id')) | Q(ip__icontains=query) | Q(parameters__icontains=query)
+    return Q(id__in=RawSQL(scans[0], scans[1])) | Q(id__in=RawSQL(f"SELECT nmapscan_id FROM {AssetsNmapscan._meta.db_table} WHERE id IN ({results[0]})", results[1]))
+
+def assets_filter(query):
+    ips = ip_range(query)
+    if ips:
+        return Q(ip_key__range=ips)
+    results = matches_sql(RESULT_SEARCH_TABLE, query)
+    if not search_available() or results is None:
+        return Q(hostname__icontains=query) | Q(ip_address__icontains=query)
+    return Q(id__in=RawSQL(f"SELECT assets_id FROM {AssetsNmapscan._meta.db_table} WHERE id IN ({results[0]})", results[1]))
+
+def keyset_page(queryset, filter, after, limit):
+    """
+    Newest first page of the queryset, filtered, after the id cursor. Returns (rows, cursor of
+    the next page or None). The page ids are selected first: sorting the matches with all
+    their columns read the large JSON columns of every match.
+    """
+    ids = queryset.filter(filter) if filter else queryset
+    if after and after.isdigit():
+        ids = ids.filter(id__lt=int(after))
+    ids = list(ids.order_by('-id').values_list('id', flat=True)[:limit])
+    rows = queryset.in_bulk(ids)
+    return [rows[id] for id in ids], str(ids[-1]) if len(ids) == limit else None
+
+def search_scans(query='', after=None, limit=PAGE_SIZE):
+    """
+    One page of scans, newest first, with a host in the IP / CIDR range, from the day
+    (YYYY-MM-DD) or with the words in a host result, target or parameters.
+    Returns (Nmapscans, cursor of the next page or None).
+    """
+    query = (query or '').strip()
+    return keyset_page(Nmapscan.objects.defer('data'), scans_filter(query) if query else None, after, limit)
+
+def search_assets(query='', after=None, limit=PAGE_SIZE):
+    """One page of nmap assets, newest first, in the IP / CIDR range or with the words in a host result. Returns (NmapAssets, next cursor)."""
+    query = (query or '').strip()
+    return keyset_page(NmapAssets.objects.defer('json_data'), assets_filter(query) if query else None, after, limit)
+
+# --- Rebuild ---
+def rebuild_search_index(batch_size=SEARCH_INDEX_BATCH_SIZE):
+    """Sets missing IP keys and indexes every stored host result and scan (once after upgrading, or to repair the index)."""
+    create_search_index()
+    meta, quote = NmapAssets._meta, connection.ops.quote_name
+    missing = NmapAssets.objects.filter(ip_key='').values_list('id', 'ip_address')
+    while batch := list(missing[:batch_size]):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(f"UPDATE {quote(meta.db_table)} SET {quote(meta.get_field('ip_key').column)} = %s WHERE id = %s", [(ip_key(ip), id) for id, ip in batch])
+
+    total = 0
+    for queryset, index in ((AssetsNmapscan.objects.only('id', 'assets_json_data'), index_result_search), (Nmapscan.objects.only('id', 'ip', 'parameters'), index_scan_search)):
+        last_id = 0
+        while batch := list(queryset.filter(id__gt=last_id).order_by('id')[:batch_size]):
+            with transaction.atomic():
+                total += index(batch)
+            last_id = batch[-1].id
+    return total
@@ -1,3 +1,299 @@
-from django.test import TestCase
+import io
+import ipaddress
+import json
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
-# Create your tests here.
+import nmap
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from jobs.jobops import fail_orphaned_jobs, job_progress
+from jobs.models import Job
+from .models import AssetsNmapscan, NmapAssets, Nmapscan, NmapService
+from .search_ops import RESULT_SEARCH_TABLE, rebuild_search_index, search_assets, search_available, search_scans
+from .nmapops import (check_scan_arguments, execute_nmap_scan_db, import_nmap_xml, index_all_scan_services, last_complete_scan_id,
+                      parse_nmap_xml, save_scan_hosts, scan_hosts, service_changes, shard_targets)
+
+# Stand-in for the nmap binary: reports two hosts (.1 and .2) with an open ssh port per
+# target network (the arguments after --), single IP targets as one host. Targets in 10.99.0.0/16
+# fail like an unresolvable target. Start and end of every run are logged for the concurrency checks.
+STUB_NMAP = '''#!{python}
+import ipaddress, sys, time
+targets = sys.argv[sys.argv.index('--') + 1:]
+with open({log!r}, 'a') as log:
+    log.write(f'start {{time.monotonic()}}\\n')
+time.sleep({delay})
+if any(target.startswith('10.99.') for target in targets):
+    sys.stderr.write('Failed to resolve ' + ' '.join(targets) + '\\n')
+    sys.exit(1)
+hosts = []
+for target in targets:
+    network = ipaddress.ip_network(target, strict=False)
+    hosts += [network[1], network[2]] if network.num_addresses > 2 else [network[0]]
+print('<?xml version="1.0"?><nmaprun scanner="nmap" args="nmap"><scaninfo type="syn" protocol="tcp" numservices="1" services="22"/>')
+for host in hosts:
+    print(f'<host><status state="up" reason="syn-ack"/><address addr="{{host}}" addrtype="ipv4"/>'
+          f'<hostnames><hostname name="host-{{str(host).replace(".", "-")}}" type="PTR"/></hostnames><ports>'
+          '<port protocol="tcp" portid="22"><state state="open" reason="syn-ack"/>'
+          '<service name="ssh" product="OpenSSH" version="9.6"><cpe>cpe:/a:openbsd:openssh:9.6</cpe></service></port>'
+          '</ports></host>')
+print(f'<runstats><finished timestr="" elapsed="0.1"/><hosts up="{{len(hosts)}}" down="0" total="{{len(hosts)}}"/></runstats></nmaprun>')
+with open({log!r}, 'a') as log:
+    log.write(f'end {{time.monotonic()}}\\n')
+'''
+
+REPORT = b'''<?xml version="1.0"?>
+<nmaprun scanner="nmap" args="nmap -sV -O 192.0.2.0/30">
+<scaninfo type="syn" protocol="tcp" numservices="1000" services="1-1000"/>
+<host><status state="up" reason="arp-response"/>
+<address addr="192.0.2.1" addrtype="ipv4"/><address addr="00:11:22:33:44:55" addrtype="mac" vendor="Acme"/>
+<hostnames><hostname name="gw.example.org" type="PTR"/></hostnames>
+<ports><extraports state="closed" count="998"/>
+<port protocol="tcp" portid="22"><state state="open" reason="syn-ack"/><service name="ssh" product="OpenSSH" version="9.6p1" extrainfo="Ubuntu" conf="10"><cpe>cpe:/a:openbsd:openssh:9.6p1</cpe><cpe>cpe:/o:linux:linux_kernel</cpe></service>
+<script id="ssh-hostkey" output="256 aa:bb (ED25519)"/></port>
+<port protocol="udp" portid="53"><state state="open|filtered" reason="no-response"/></port>
+</ports>
+<os><portused state="open" proto="tcp" portid="22"/><osmatch name="Linux 5.X" accuracy="98" line="1"><osclass type="general purpose" vendor="Linux" osfamily="Linux" osgen="5.X" accuracy="98"><cpe>cpe:/o:linux:linux_kernel:5</cpe></osclass></osmatch></os>
+<uptime seconds="3600" lastboot="Mon Oct 19 10:00:00 2026"/>
+<hostscript><script id="smb-os-discovery" output="Windows"/></hostscript>
+</host>
+<host><status state="up" reason="echo-reply"/><address addr="192.0.2.2" addrtype="ipv4"/><hostnames/></host>
+<runstats><finished time="0" timestr="" elapsed="1.0"/><hosts up="2" down="2" total="4"/></runstats>
+</nmaprun>'''
+
+class NmapXmlTests(TestCase):
+    def test_hosts_match_python_nmap(self):
+        scanner = object.__new__(nmap.PortScanner) # Without the constructor, it looks for the nmap binary
+        expected = scanner.analyse_nmap_xml_scan(nmap_xml_output=REPORT.decode())['scan']
+        hosts = list(parse_nmap_xml(io.BytesIO(REPORT)))
+        self.assertEqual(hosts, json.loads(json.dumps([expected['192.0.2.1'], expected['192.0.2.2']])))
+
+    def test_report_import_stores_each_result_once(self):
+        scan = import_nmap_xml(io.BytesIO(REPORT), ip='192.0.2.0/30', parameters='-sV -O')
+        self.assertEqual((scan.status, scan.hosts_up, scan.data), (Nmapscan.COMPLETED, 2, None))
+        asset = NmapAssets.objects.get(ip_address='192.0.2.1')
+        self.assertIsNone(asset.json_data)
+        self.assertEqual(asset.host_data()['tcp']['22']['product'], 'OpenSSH')
+        self.assertEqual([host['addresses']['ipv4'] for host in scan_hosts(scan)], ['192.0.2.1', '192.0.2.2'])
+
+        rescan = import_nmap_xml(io.BytesIO(REPORT))
+        asset.refresh_from_db()
+        self.assertEqual(NmapAssets.objects.count(), 2)
+        self.assertEqual(AssetsNmapscan.objects.count(), 4)
+        self.assertEqual((asset.added_by_scan_id, asset.result.nmapscan_id), (rescan.id, rescan.id))
+
+    def test_older_rows_keep_their_json_data(self):
+        scan = Nmapscan.objects.create(data=json.dumps([{"addresses": {"ipv4": "192.0.2.9"}}], indent=4), ip='192.0.2.9')
+        asset = NmapAssets.objects.create(ip_address='192.0.2.9', hostname='', added_by_scan=scan, json_data=json.dumps({"tcp": {}}, indent=4))
+        self.assertEqual(asset.host_data(), {"tcp": {}})
+        self.assertEqual(scan_hosts(scan), [{"addresses": {"ipv4": "192.0.2.9"}}])
+
+def host(ip, *ports):
+    """Host result with open TCP ports given as (port, service, product, version)."""
+    return {"addresses": {"ipv4": ip}, "hostnames": [{"name": "", "type": ""}], "status": {"state": "up", "reason": "syn-ack"},
+            "tcp": {str(port): {"state": "open", "name": name, "product": product, "version": version, "extrainfo": "", "cpe": ""} for port, name, product, version in ports}}
+
+class ServiceHistoryTests(TestCase):
+    DAY1 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+    def scan(self, day, *hosts, ports='1-1000'):
+        scan = Nmapscan.objects.create(ip='192.0.2.0/24', parameters=f'-sV -p {ports}', scanned_ports={'tcp': ports})
+        Nmapscan.objects.filter(id=scan.id).update(created_at=self.DAY1 + timedelta(days=day))
+        scan.refresh_from_db()
+        save_scan_hosts(scan, hosts)
+        return scan
+
+    def changes(self, day):
+        return {name: [(service.ip_address, service.port) for service in services] for name, services in service_changes(self.DAY1 + timedelta(days=day)).items()}
+
+    def test_changes_between_scans(self):
+        self.scan(0, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.6'), (80, 'http', 'nginx', '1.24')), host('192.0.2.2', (25, 'smtp', 'Postfix', '')))
+        self.scan(1, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.7'), (443, 'https', 'nginx', '1.24')))
+        self.assertEqual(self.changes(1), {'opened': [('192.0.2.1', 443)], 'changed': [('192.0.2.1', 22)], 'missing': [('192.0.2.1', 80)]})
+        self.assertEqual(NmapService.objects.get(port=22).previous, {'version': '9.6'})
+        self.assertIsNone(NmapService.objects.get(port=25).missing_since) # Host not scanned again
+
+        self.scan(2, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.7'), (80, 'http', 'nginx', '1.24'), (443, 'https', 'nginx', '1.24')))
+        self.assertEqual(self.changes(2), {'opened': [], 'changed': [('192.0.2.1', 80)], 'missing': []})
+        self.assertEqual(NmapService.objects.get(port=80).first_seen, self.DAY1)
+
+    def test_ports_outside_the_scanned_ranges_are_not_missing(self):
+        self.scan(0, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.6'), (80, 'http', 'nginx', '1.24')))
+        self.scan(1, host('192.0.2.1', (80, 'http', 'nginx', '1.24')), ports='80')
+        self.assertEqual(self.changes(1)['missing'], [])
+        self.scan(2, host('192.0.2.1'), ports='21-23,443')
+        self.assertEqual(self.changes(2)['missing'], [('192.0.2.1', 22)])
+
+    def test_host_without_ports_marks_scanned_ports_missing(self):
+        self.scan(0, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.6'), (80, 'http', 'nginx', '1.24')))
+        self.scan(1, host('192.0.2.1'))
+        self.assertEqual(sorted(self.changes(1)['missing']), [('192.0.2.1', 22), ('192.0.2.1', 80)])
+
+    def test_scans_without_port_ranges_mark_nothing_missing(self):
+        self.scan(0, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.6')))
+        scan = Nmapscan.objects.create(ip='192.0.2.1', parameters='-sn')
+        save_scan_hosts(scan, [host('192.0.2.1')])
+        self.assertIsNone(NmapService.objects.get().missing_since)
+
+    def test_scanned_ports_of_imported_reports(self):
+        scan = import_nmap_xml(io.BytesIO(REPORT))
+        self.assertEqual(scan.scanned_ports, {'tcp': '1-1000'})
+
+    def test_older_scans_only_move_first_seen(self):
+        self.scan(5, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.7')))
+        self.scan(1, host('192.0.2.1', (22, 'ssh', 'OpenSSH', '9.6')))
+        service = NmapService.objects.get()
+        self.assertEqual((service.version, service.first_seen, service.last_seen), ('9.7', self.DAY1 + timedelta(days=1), self.DAY1 + timedelta(days=5)))
+
+    def test_history_of_stored_scans(self):
+        scan = Nmapscan.objects.create(data=json.dumps([host('192.0.2.7', (3306, 'mysql', 'MySQL', '8.0'))], indent=4), ip='192.0.2.7')
+        self.assertEqual(index_all_scan_services(), 1)
+        self.assertEqual(index_all_scan_services(), 0)
+        self.assertEqual(NmapService.objects.get().last_scan_id, scan.id)
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.scan = import_nmap_xml(io.BytesIO(REPORT), ip='192.0.2.0/30', parameters='-sV -O')
+
+    def assets(self, query):
+        return sorted(asset.ip_address for asset in search_assets(query)[0])
+
+    def test_search_index_exists(self):
+        self.assertTrue(search_available())
+
+    def test_ip_and_cidr_queries(self):
+        self.assertEqual(self.assets('192.0.2.0/30'), ['192.0.2.1', '192.0.2.2'])
+        self.assertEqual(self.assets('192.0.2.2'), ['192.0.2.2'])
+        self.assertEqual(self.assets('192.0.3.0/24'), [])
+        self.assertEqual(search_scans('192.0.2.1')[0], [self.scan])
+
+    def test_word_queries(self):
+        self.assertEqual(self.assets('gw'), ['192.0.2.1']) # Prefix of gw.example.org
+        self.assertEqual(self.assets('openssh 9.6p1'), ['192.0.2.1'])
+        self.assertEqual(self.assets('Acme'), ['192.0.2.1'])
+        self.assertEqual(self.assets('nginx'), [])
+        self.assertEqual(search_scans('ssh')[0], [self.scan])
+        self.assertEqual(search_scans(self.scan.created_at.date().isoformat())[0], [self.scan])
+        self.assertEqual(search_scans('mysql')[0], [])
+
+    def test_keyset_pages(self):
+        scans = [self.scan] + [import_nmap_xml(io.BytesIO(REPORT)) for _ in range(6)]
+        first, cursor = search_scans('ssh')
+        second, last = search_scans('ssh', cursor)
+        self.assertEqual(first + second, scans[::-1])
+        self.assertIsNone(last)
+
+    def test_rebuild(self):
+        NmapAssets.objects.update(ip_key='')
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {RESULT_SEARCH_TABLE}")
+        self.assertEqual(self.assets('gw'), [])
+        rebuild_search_index()
+        self.assertEqual(self.assets('gw'), ['192.0.2.1'])
+        self.assertEqual(self.assets('192.0.2.0/30'), ['192.0.2.1', '192.0.2.2'])
+
+class ShardTargetsTests(TestCase):
+    def test_networks_are_split_into_subnets(self):
+        self.assertEqual(shard_targets('10.0.0.0/22', 24), [['10.0.0.0/24'], ['10.0.1.0/24'], ['10.0.2.0/24'], ['10.0.3.0/24']])
+
+    def test_small_targets_are_grouped(self):
+        self.assertEqual(shard_targets('10.0.0.5, 10.0.1.0/28 scanme.example.org', 24), [['10.0.0.5', '10.0.1.0/28', 'scanme.example.org']])
+        self.assertEqual(len(shard_targets(' '.join(f'10.1.{i // 256}.{i % 256}' for i in range(600)), 24)), 3)
+
+    def test_huge_networks_are_rejected(self):
+        with self.assertRaises(ValueError):
+            shard_targets('2001:db8::/64', 24)
+
+    def test_option_targets_are_rejected(self):
+        for ip in ('-iL /etc/passwd', '10.0.0.1,-oN/tmp/out', '--resume /tmp/scan'):
+            with self.assertRaises(ValueError):
+                shard_targets(ip, 24)
+
+    def test_allowed_options(self):
+        for parameters in ('-sV -T4 -p 22,80', '-sV -n -R -p 1-1024', '-sS -Pn -p- --top-ports=100 -O', '-sU -p U:53,T:22 --max-retries 2 -v'):
+            check_scan_arguments(parameters)
+
+    def test_file_options_are_rejected(self):
+        for parameters in ('-sV -oN /tmp/out', '-oX-', '-iL /etc/passwd', '--datadir=/tmp', '--excludefile /etc/passwd',
+                           '--script=http-title', '--resume /tmp/scan', '-sV --stylesheet http://example.org/x.xsl'):
+            with self.assertRaises(ValueError):
+                check_scan_arguments(parameters)
+
+    def test_single_dash_and_abbreviated_long_options_are_rejected(self):
+        # nmap's getopt_long_only takes these as --datadir, --stylesheet and --resume
+        for parameters in ('-datadir /tmp', '-stylesheet /tmp/x.xsl', '--datad=/tmp', '-resume /tmp/scan', '--excl=/etc/passwd'):
+            with self.assertRaises(ValueError):
+                check_scan_arguments(parameters)
+
+    def test_option_values_are_checked(self):
+        for parameters in ('-p', '-p -iL', '--top-ports=all', '--exclude /etc/passwd;id', '-sV=1'):
+            with self.assertRaises(ValueError):
+                check_scan_arguments(parameters)
+
+class ShardedScanTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = Path(directory.name) / 'runs.log'
+        self.nmap = Path(directory.name) / 'nmap'
+        self.nmap.write_text(STUB_NMAP.format(python=sys.executable, log=str(self.log), delay=0.3))
+        self.nmap.chmod(self.nmap.stat().st_mode | stat.S_IEXEC)
+        settings = override_settings(NMAP_PATH=str(self.nmap))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def max_concurrent_runs(self):
+        events = sorted((float(time), kind) for kind, time in (line.split() for line in self.log.read_text().splitlines()))
+        running = peak = 0
+        for _, kind in events:
+            running += 1 if kind == 'start' else -1
+            peak = max(peak, running)
+        return peak
+
+    def test_shards_are_stored_as_they_finish(self):
+        updates = []
+        result = execute_nmap_scan_db('10.0.0.0/22', '-sV', progress=lambda current, total, message, result=None: updates.append((current, total)), parallelism=2, shard_prefix=24)
+        scan = Nmapscan.objects.get()
+        self.assertEqual(len(result), 8)
+        self.assertEqual((scan.status, scan.shards_total, scan.shards_done, scan.shards_failed, scan.hosts_up), (Nmapscan.COMPLETED, 4, 4, 0, 8))
+        self.assertEqual(updates, [(0, 4), (1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual(NmapAssets.objects.filter(added_by_scan=scan).count(), 8)
+        self.assertEqual(AssetsNmapscan.objects.filter(nmapscan=scan).count(), 8)
+        self.assertEqual(NmapAssets.objects.get(ip_address='10.0.2.1').hostname, 'host-10-0-2-1')
+        self.assertEqual(scan.scanned_ports, {'tcp': '22'})
+        self.assertEqual(self.max_concurrent_runs(), 2)
+
+    def test_failed_shard_does_not_stop_the_scan(self):
+        execute_nmap_scan_db('10.99.0.0/24 10.0.0.0/23', '-sV', parallelism=3, shard_prefix=24)
+        scan = Nmapscan.objects.get()
+        self.assertEqual((scan.status, scan.shards_done, scan.shards_failed, scan.hosts_up), (Nmapscan.COMPLETED, 3, 1, 4))
+        self.assertIn('10.99.0.0/24', scan.error)
+        self.assertEqual(sorted(ipaddress.ip_address(ip) for ip in NmapAssets.objects.values_list('ip_address', flat=True)),
+                         [ipaddress.ip_address(ip) for ip in ('10.0.0.1', '10.0.0.2', '10.0.1.1', '10.0.1.2')])
+
+    def test_scan_of_an_orphaned_job_is_failed(self):
+        dead = subprocess.Popen([sys.executable, '-c', ''])
+        dead.wait()
+        job = Job.objects.create(task='nmapapp.nmapops.execute_nmap_scan_db', kwargs={'ip': '10.0.0.0/22', 'parameters': '-sV'},
+                                 dedupe_key='scan', label='NMAP scan', status=Job.RUNNING, worker=f'{socket.gethostname()}:{dead.pid}:1:job-worker-0')
+        finished = Nmapscan.objects.create(data='[]', ip='10.0.0.1')
+        job_progress(job.id)(0, 4, "Scanning 4 shards", result={'scan_id': Nmapscan.objects.create(ip='10.0.0.0/22', status=Nmapscan.RUNNING).id})
+        later = Nmapscan.objects.create(data='[]', ip='10.0.0.2')
+        self.assertEqual(last_complete_scan_id(), finished.id)
+        fail_orphaned_jobs()
+        self.assertEqual(Nmapscan.objects.get(ip='10.0.0.0/22').status, Nmapscan.FAILED)
+        self.assertEqual(last_complete_scan_id(), later.id)
+
+    def test_running_scans_hold_back_the_watermark(self):
+        finished = Nmapscan.objects.create(data='[]', ip='10.0.0.1')
+        running = Nmapscan.objects.create(data='[]', ip='10.0.0.0/16', status=Nmapscan.RUNNING)
+        Nmapscan.objects.create(data='[]', ip='10.0.0.2')
+        self.assertEqual(last_complete_scan_id(), finished.id)
+        Nmapscan.objects.filter(id=running.id).update(status=Nmapscan.COMPLETED)
+        self.assertEqual(last_complete_scan_id(), Nmapscan.objects.order_by('-id').first().id)
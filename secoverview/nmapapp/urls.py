@@ -6,6 +6,7 @@ urlpatterns = [
     path('scan', views.scan, name='nmapscan'),
     path('scans', views.scansoverview, name='scansoverview'),
     path('scans/<int:id>', views.scanview, name='scanview'),
+    path('changes', views.changes, name='nmapchanges'),
     path('assets', views.nmapassetsoverview, name='nmapassetsoverview'),
     path('assets/<int:id>', views.nmapassetview, name='nmapassetview'),
 ]
\ No newline at end of file
@@ -1,14 +1,19 @@
 from django.shortcuts import render, redirect
 from django.http import HttpRequest
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from datetime import datetime
-from django.db.models import Q
+from datetime import datetime, timedelta
+from django.utils import timezone
 from django.conf import settings
-from .models import Nmapscan, NmapAssets
-from .nmapops import execute_nmap_scan_db
+from .models import Nmapscan, NmapAssets, NmapService
+from django.urls import reverse
+from django.contrib import messages
+from jobs.jobops import enqueue_job
+from .nmapops import check_scan_arguments, scan_hosts, service_changes, shard_targets
+from .search_ops import search_assets, search_scans
 import json
 
+CHANGE_PERIODS = ('1', '7', '30') # Days selectable on the changes page
+
 @login_required
 def overview(request):
     """Renders the about page."""
@@ -32,23 +37,15 @@ def scan(request):
     if request.method == 'POST':
         ip = request.POST.get('ip')
         parameters = request.POST.get('parameters')
+        try:
+            check_scan_arguments(parameters)
+            shard_targets(ip)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('nmapscan')
 
-        execute_nmap_scan_db(ip, parameters)
-
-        assets = NmapAssets.objects.order_by('-id')[:5]
-        scans = Nmapscan.objects.order_by('-id')[:5]
-
-        return render(
-            request,
-            'overview.html',
-            {
-                'title':'NMAP Overview',
-                'year':datetime.now().year,
-                'assets':assets,
-                'scans':scans,
-                'chatcontext':"Shows Assets form the NMAP scans aswell as the nmap scans witch where run." 
-            }
-        )
+        job = enqueue_job('nmapapp.nmapops.execute_nmap_scan_db', f"NMAP scan {ip}", request.user, next_url=reverse('nmapoverview'), ip=ip, parameters=parameters)
+        return redirect('jobview', id=job.id)
 
     else:
         """Renders the about page."""
@@ -69,21 +66,18 @@ def scan(request):
 def scansoverview(request):
     """Renders the about page."""
     assert isinstance(request, HttpRequest)
-    query = request.GET.get("search")
-    if query == None or query == "":
-        scans = Nmapscan.objects.order_by('-id')
-    else:
-        scans = Nmapscan.objects.filter(Q(data__icontains=query) | Q(ip__icontains=query) | Q(parameters__icontains=query) | Q(created_at__icontains=query)).order_by('-id')
-    paginator = Paginator(scans, 5)
-    page_number = request.GET.get('page')  # Get the page number from the URL query parameter
-    page_obj = paginator.get_page(page_number)  # Get the appropriate page of blog posts
+    query = request.GET.get("search") or ""
+    scans, next_cursor = search_scans(query, request.GET.get('after'))
     return render(
         request,
         'scansoverview.html',
         {
             'title':'NMAP Scans Overview',
             'year':datetime.now().year,
-            'scans':page_obj
+            'scans':scans,
+            'search':query,
+            'next_cursor':next_cursor,
+            'is_first_page':not request.GET.get('after')
         }
     )
 
@@ -93,6 +87,7 @@ def scanview(request, id):
     """Renders the about page."""
     assert isinstance(request, HttpRequest)
     scans = Nmapscan.objects.get(id=id)
+    hosts = json.dumps(scan_hosts(scans), indent=4)
     return render(
         request,
         'scanview.html',
@@ -100,7 +95,8 @@ def scanview(request, id):
             'title':'NMAP Scans View',
             'year':datetime.now().year,
             'scans':scans,
-            'chatcontext':"Report about a NMAP Scan. Displayed Scan-Date, Target(-Range) and Scan-Parameters." + "The following scan arameters where used: " + scans.parameters + ". The NMAP Scan Result is: " + scans.data
+            'hosts':hosts,
+            'chatcontext':"Report about a NMAP Scan. Displayed Scan-Date, Target(-Range) and Scan-Parameters." + "The following scan arameters where used: " + (scans.parameters or "") + ". The NMAP Scan Result is: " + hosts
         }
     )
 
@@ -109,22 +105,18 @@ def scanview(request, id):
 def nmapassetsoverview(request):
     """Renders the about page."""
     assert isinstance(request, HttpRequest)
-    query = request.GET.get("search")
-    if query == None or query == "":
-        assets = NmapAssets.objects.order_by('-id')
-    else:
-        assets = NmapAssets.objects.filter(Q(hostname__icontains=query) | Q(ip_address__icontains=query)).order_by('-id')
-
-    paginator = Paginator(assets, 5)
-    page_number = request.GET.get('page')  # Get the page number from the URL query parameter
-    page_obj = paginator.get_page(page_number)  # Get the appropriate page of blog posts
+    query = request.GET.get("search") or ""
+    assets, next_cursor = search_assets(query, request.GET.get('after'))
     return render(
         request,
         'nmapassetsoverview.html',
         {
             'title':'NMAP Assets Overview',
             'year':datetime.now().year,
-            'assets':page_obj
+            'assets':assets,
+            'search':query,
+            'next_cursor':next_cursor,
+            'is_first_page':not request.GET.get('after')
         }
     )
 
@@ -133,6 +125,8 @@ def nmapassetview(request, id):
     """Renders the about page."""
     assert isinstance(request, HttpRequest)
     assets = NmapAssets.objects.get(id=id)
+    host_json = json.dumps(assets.host_data(), indent=4)
+    services = NmapService.objects.filter(ip_address=assets.ip_address).order_by('protocol', 'port')
     return render(
         request,
         'nmapassetview.html',
@@ -140,6 +134,28 @@ def nmapassetview(request, id):
             'title':'NMAP Scans View',
             'year':datetime.now().year,
             'assets':assets,
-            'chatcontext':f"Report about a Asset from a NMAP Scan. The Asset data is: {assets.json_data}."
+            'services':services,
+            'host_json':host_json,
+            'chatcontext':f"Report about a Asset from a NMAP Scan. The Asset data is: {host_json}."
+        }
+    )
+
+@login_required
+def changes(request):
+    """Renders the ports that opened, changed or disappeared between the NMAP scans of the last `days` days."""
+    assert isinstance(request, HttpRequest)
+    days = request.GET.get('days', '1')
+    days = int(days) if days in CHANGE_PERIODS else 1
+    changes = service_changes(timezone.now() - timedelta(days=days))
+    return render(
+        request,
+        'changes.html',
+        {
+            'title':'NMAP Changes',
+            'year':datetime.now().year,
+            'days':days,
+            'periods':CHANGE_PERIODS,
+            'changes':changes,
+            'chatcontext':f"Shows the ports found by the NMAP scans of the last {days} days which opened, changed (state or detected service) or were no longer reported."
         }
-    )
\ No newline at end of file
+    )
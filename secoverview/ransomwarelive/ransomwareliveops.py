@@ -27,4 +27,13 @@ def fetch_ransomwarelive_groups():
         return True
     except Exception as e:
         print(f"Error fetching ransomware live groups: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def update_ransomwarelive(progress=None):
+    """Fetches the groups and victims (background job of the update button)."""
+    if progress:
+        progress(0, 2, 'Fetching groups')
+    fetch_ransomwarelive_groups()
+    if progress:
+        progress(1, 2, 'Fetching victims')
+    fetch_ransomwarelive_victims()
@@ -5,7 +5,8 @@ from django.conf import settings
 from datetime import datetime
 from django.contrib.auth.decorators import login_required
 from .models import RansomwareliveGroupsGroup, RansomwareliveVictim
-from .ransomwareliveops import fetch_ransomwarelive_groups, fetch_ransomwarelive_victims
+from django.urls import reverse
+from jobs.jobops import enqueue_job
 from django.db.models import Q
 
 @login_required
@@ -30,9 +31,8 @@ def ransomwarelive(request):
 def ransomwareliveupdate(request):
     """Renders the about page."""
     assert isinstance(request, HttpRequest)
-    fetch_ransomwarelive_groups()
-    fetch_ransomwarelive_victims()
-    return redirect(ransomwarelive)
+    job = enqueue_job('ransomwarelive.ransomwareliveops.update_ransomwarelive', 'Update Ransomwarelive data', request.user, next_url=reverse('ransomwarelive'))
+    return redirect('jobview', id=job.id)
 
 @login_required
 def victimsoverview(request):
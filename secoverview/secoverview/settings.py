@@ -41,6 +41,22 @@ MISP_SERVER = os.getenv('MISP_SERVER')
 MISP_API_KEY = os.getenv('MISP_API_KEY')
 DNS_WORDLIST_DEFAULT = os.getenv('DNS_WORDLIST_DEFAULT', "")
 
+# Shared flow schema of the MLNIDS service, defines the NetworkFlow fields
+MLNIDS_FLOW_SCHEMA_PATH = os.getenv('MLNIDS_FLOW_SCHEMA_PATH', os.path.join(BASE_DIR.parent, 'services', 'mlnids_service', 'flow_schema.py'))
+MLNIDS_UPLOAD_MAX_CHUNK_BYTES = int(os.getenv('MLNIDS_UPLOAD_MAX_CHUNK_BYTES', 64 * 1024 * 1024))
+# Raw flows older than this are deleted after being rolled up into hourly per host totals
+MLNIDS_RETENTION_DAYS = int(os.getenv('MLNIDS_RETENTION_DAYS', 30))
+MLNIDS_RETENTION_BATCH_SIZE = int(os.getenv('MLNIDS_RETENTION_BATCH_SIZE', 10000))
+# Background job worker threads per web server process (0 = jobs only run in `manage.py run_jobs`)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+# NVD JSON 2.0 data feeds (nvdcve-2.0-<year|modified|recent>.json.zip)
+NVD_FEED_URL = os.getenv('NVD_FEED_URL', 'https://nvd.nist.gov/feeds/json/cve/2.0')
+# nmap scans: CIDR ranges are split into shards of this prefix length (IPv4, IPv6 shards are /120)
+# and up to NMAP_SCAN_PARALLELISM nmap processes run at once per scan
+NMAP_PATH = os.getenv('NMAP_PATH', 'nmap')
+NMAP_SCAN_PARALLELISM = int(os.getenv('NMAP_SCAN_PARALLELISM', 4))
+NMAP_SHARD_PREFIX = int(os.getenv('NMAP_SHARD_PREFIX', 24))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -66,6 +82,7 @@ INSTALLED_APPS = [
     'dashboard',
     'dnsops',
     'ipcheck',
+    'jobs',
     'main',
     'mlnids',
     'nmapapp',
@@ -32,6 +32,7 @@ urlpatterns = [
     path('cve/', include('cvedata.urls')),
     path('dashboard/', include('dashboard.urls')),
     path('dns/', include('dnsops.urls')),
+    path('jobs/', include('jobs.urls')),
     path('mlnids/', include('mlnids.urls')),
     path('nmap/', include('nmapapp.urls')),
     path('ransomwarelive/', include('ransomwarelive.urls')),
@@ -1,11 +1,11 @@
-from django.shortcuts import render
+from django.shortcuts import render, redirect
 from django.http import HttpRequest
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from datetime import datetime
-from .webops.web_headers import check_security_headers
-from .webops.crt_sh_ops import query_crtsh
-from .webops.web_tech_fingerprinting import analyze_technologies
-from .models import CRTSHResult, WebTechFingerprinting_Results
+from .models import CRTSHResult, WebHeaderCheck, WebTechFingerprinting_Results
+from jobs.jobops import enqueue_job
+from jobs.models import Job
 
 @login_required
 def web_overview(request):
@@ -13,9 +13,16 @@ def web_overview(request):
     assert isinstance(request, HttpRequest)
     if request.method == 'POST':
         domain = request.POST.get('domain')
-        headers = check_security_headers(domain)
-        crt_result = CRTSHResult.objects.filter(domain=query_crtsh(domain))
-        webtechfingerprint = WebTechFingerprinting_Results.objects.filter(domain=analyze_technologies(domain))
+        job = enqueue_job('webops.webops.web_checks.run_web_checks', f"Web checks {domain}", request.user, next_url=f"{reverse('web_overview')}?job={{job_id}}", domain=domain)
+        return redirect('jobview', id=job.id)
+    job_id = request.GET.get('job', '')
+    job = Job.objects.filter(id=job_id, task='webops.webops.web_checks.run_web_checks', status=Job.SUCCEEDED).first() if job_id.isdigit() else None
+    if job is not None:
+        # Results of a finished check job
+        domain = job.result['domain']
+        headers = WebHeaderCheck.objects.filter(id=job.result['webheaders']).first()
+        crt_result = CRTSHResult.objects.filter(domain_id=job.result['crt_scan'])
+        webtechfingerprint = WebTechFingerprinting_Results.objects.filter(domain_id=job.result['webtechfingerprint'])
         return render(
             request, 
             "web_overview.html", 
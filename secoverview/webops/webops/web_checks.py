@@ -0,0 +1,18 @@
+from .web_headers import check_security_headers
+from .crt_sh_ops import query_crtsh
+from .web_tech_fingerprinting import analyze_technologies
+
+def run_web_checks(domain, progress=None):
+    """Security headers, crt.sh subdomains and technology fingerprint of a domain (background job of the web overview)."""
+    steps = [
+        ('webheaders', 'Checking security headers', check_security_headers),
+        ('crt_scan', 'Querying crt.sh', query_crtsh),
+        ('webtechfingerprint', 'Fingerprinting technologies', analyze_technologies),
+    ]
+    results = {'domain': domain}
+    for number, (key, message, check) in enumerate(steps):
+        if progress:
+            progress(number, len(steps), message)
+        # The checks return their scan object, or None / the empty findings when the domain is unreachable
+        results[key] = getattr(check(domain), 'id', None)
+    return results
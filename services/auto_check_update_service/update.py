@@ -71,6 +71,21 @@ def update_assets(last_update_assets, update_cycle_assets, headers):
         return last_update_assets
 
 
+def update_mlnids_retention(last_update_mlnids_retention, update_cycle_mlnids_retention, headers):
+    # Roll up new flows and delete raw flows past the retention period
+    if last_update_mlnids_retention is None or (datetime.now() - last_update_mlnids_retention) > timedelta(minutes=update_cycle_mlnids_retention):
+        url = BASE_URI + "/api/mlnids/retention"
+        response = requests.get(url, headers=headers)
+        if response.status_code == 200:
+            logging.info(f"MLNIDS: {response.json().get('message')}")
+            last_update_mlnids_retention = datetime.now()
+            return last_update_mlnids_retention
+        else:
+            logging.info(f"MLNIDS: Failed to apply flow retention. Response code: {response.status_code}")
+            return last_update_mlnids_retention
+    else:
+        return last_update_mlnids_retention
+
 def update_ransomware(last_update_ransomware, update_cycle_ransomwarelive, headers):
     # Gather ransomwarelive data
     if last_update_ransomware is None or (datetime.now() - last_update_ransomware) > timedelta(days=update_cycle_ransomwarelive):
@@ -131,10 +146,12 @@ if __name__ == '__main__':
     last_update_ransomware = None
     last_update_rss_feed = None
     last_update_cve_data = None
+    last_update_mlnids_retention = None
     update_cycle_assets = int(os.getenv('UPDATE_CYCLE_ASSETS'))
     update_cycle_ransomwarelive = int(os.getenv('UPDATE_CYCLE_RANSOMWARELIVE'))
     update_cycle_rss_feed = int(os.getenv('UPDATE_CYCLE_RSS_FEED'))
     update_cycle_cve_data = int(os.getenv('UPDATE_CYCLE_CVE_DATA'))
+    update_cycle_mlnids_retention = int(os.getenv('UPDATE_CYCLE_MLNIDS_RETENTION', 60))
     
     while True:
         access_token, refresh_token_val, token_set = token_management(token_set=token_set, last_update=last_update, refresh_token_val_in=refresh_token_val, access_token_in=access_token)
@@ -144,5 +161,6 @@ if __name__ == '__main__':
             last_update_ransomware = update_ransomware(last_update_ransomware=last_update_ransomware, update_cycle_ransomwarelive=update_cycle_ransomwarelive, headers=headers)
             last_update_rss_feed = update_rss_feed(last_update_rss_feed=last_update_rss_feed, update_cycle_rss_feed=update_cycle_rss_feed, headers=headers)
             last_update_cve_data = update_cve_data(last_update_cve_data=last_update_cve_data, update_cycle_cve_data=update_cycle_cve_data, headers=headers)
+            last_update_mlnids_retention = update_mlnids_retention(last_update_mlnids_retention=last_update_mlnids_retention, update_cycle_mlnids_retention=update_cycle_mlnids_retention, headers=headers)
             
 
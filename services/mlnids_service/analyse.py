@@ -7,8 +7,22 @@ import datetime
 import logging
 import random
 import requests
+import base64
+import gzip
+import hashlib
+import json
+import math
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+# --- Optional zstd Compression (falls back to gzip) ---
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -26,6 +40,9 @@ PCAP_DONE = "analyse/pcap/done/"
 PCAP_TODO = "analyse/pcap/todo"
 IF_DATASET = "datasets/if_training.csv"
 IF_ANOMALY_SCORE = -0.75
+UPLOAD_CHUNK_ROWS = 5000 # Flows per chunk of a resumable upload
+UPLOAD_TIMEOUT = 120 # Seconds per request
+TOKEN_EXPIRY_MARGIN = 60 # Renew the access token this many seconds before it expires
 
 # --- Helper Functions ---
 def run_script(script_name, args_list):
@@ -47,6 +64,118 @@ def run_script(script_name, args_list):
         return False
 
 
+# --- SecOverview API Client ---
+def jwt_expiry(token):
+    """Returns the 'exp' claim of a JWT (not verified, only used to decide when to renew)."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp', 0)
+    except (IndexError, ValueError, AttributeError):
+        return 0
+
+def encode_flow_chunk(df):
+    """Encodes flows as a compressed columnar JSON chunk. Returns (body, content encoding)."""
+    columns = {c: df[c].astype(object).where(df[c].notna(), None).tolist() for c in df.columns}
+    raw = json.dumps(columns, separators=(',', ':')).encode('utf-8')
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=3).compress(raw), 'zstd'
+    return gzip.compress(raw, compresslevel=6), 'gzip'
+
+class SecOverviewClient:
+    """Talks to the SecOverview API over one pooled, retrying session with a cached JWT."""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.credentials = {"username": username, "password": password}
+        self.access_token = None
+        self.refresh_token = None
+        self.session = requests.Session()
+        # Chunk PUTs are idempotent on the server, so they are retried like GETs
+        retries = Retry(total=5, backoff_factor=1, status_forcelist=(502, 503, 504),
+                        allowed_methods=frozenset({'GET', 'PUT', 'POST'}))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def authenticate(self, force=False):
+        """Keeps a valid access token: reuses it until shortly before expiry, then refreshes, then logs in again."""
+        if not force and self.access_token and jwt_expiry(self.access_token) - TOKEN_EXPIRY_MARGIN > time.time():
+            return True
+        if self.refresh_token and jwt_expiry(self.refresh_token) - TOKEN_EXPIRY_MARGIN > time.time():
+            response = self.session.post(f"{self.base_url}/api/token/refresh", json={'refresh': self.refresh_token}, timeout=UPLOAD_TIMEOUT)
+            if response.status_code == 200:
+                tokens = response.json()
+                self.access_token = tokens.get('access')
+                self.refresh_token = tokens.get('refresh', self.refresh_token) # Rotated refresh tokens
+                return True
+        response = self.session.post(f"{self.base_url}/api/token", json=self.credentials, timeout=UPLOAD_TIMEOUT)
+        if response.status_code != 200:
+            logging.error(f"Authentication against {self.base_url} failed: {response.status_code} {response.text}")
+            self.access_token = self.refresh_token = None
+            return False
+        tokens = response.json()
+        self.access_token, self.refresh_token = tokens.get('access'), tokens.get('refresh')
+        return True
+
+    def request(self, method, path, **kwargs):
+        """Authenticated request; re-authenticates once if the token was rejected."""
+        kwargs.setdefault('timeout', UPLOAD_TIMEOUT)
+        headers = kwargs.pop('headers', {})
+        for attempt in range(2):
+            if not self.authenticate(force=attempt > 0):
+                return None
+            response = self.session.request(method, f"{self.base_url}{path}",
+                                            headers={**headers, "Authorization": f"Bearer {self.access_token}"}, **kwargs)
+            if response.status_code != 401:
+                return response
+        return response
+
+    def upload_flows(self, df, upload_id, chunk_rows=UPLOAD_CHUNK_ROWS):
+        """Uploads flows as compressed columnar chunks, skipping chunks the server already has.
+
+        upload_id is the idempotency key: calling this again after a partial failure only
+        sends the missing chunks. Returns True once every chunk is stored.
+        """
+        total_chunks = max(1, math.ceil(len(df) / chunk_rows))
+        status = self.request('GET', f"/api/mlnids/upload/{upload_id}")
+        if status is None or status.status_code != 200:
+            logging.error(f"Could not get upload status for {upload_id}.")
+            return False
+        received = set(status.json().get('received', []))
+        if received:
+            logging.info(f"Resuming upload {upload_id}: {len(received)}/{total_chunks} chunks already received.")
+
+        for index in range(total_chunks):
+            if index in received:
+                continue
+            body, encoding = encode_flow_chunk(df.iloc[index * chunk_rows:(index + 1) * chunk_rows])
+            response = self.request('PUT', f"/api/mlnids/upload/{upload_id}/{index}", data=body, headers={
+                'Content-Type': 'application/json',
+                'Content-Encoding': encoding,
+                'X-Total-Chunks': str(total_chunks),
+            })
+            if response is None or response.status_code not in (200, 201):
+                logging.error(f"Upload {upload_id} chunk {index} failed: {response.status_code if response is not None else 'no response'} {response.text if response is not None else ''}")
+                return False
+        logging.info(f"Upload {upload_id} complete: {len(df)} flows in {total_chunks} chunks.")
+        return True
+
+def upload_pending_suspicious(client):
+    """Uploads every suspicious CSV still waiting in CSV_SUSPICIOUS_TODO; files move to done only after a complete upload."""
+    for file in sorted(os.listdir(CSV_SUSPICIOUS_TODO)):
+        file_path = os.path.join(CSV_SUSPICIOUS_TODO, file)
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, 'rb') as f:
+            upload_id = hashlib.sha256(f.read()).hexdigest()[:32] # Same file, same key: retries resume
+        try:
+            uploaded = client.upload_flows(pd.read_csv(file_path), upload_id)
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"Upload of {file_path} failed: {e}")
+            uploaded = False
+        if uploaded:
+            os.rename(file_path, os.path.join(CSV_SUSPICIOUS_DONE, file))
 
 # --- Main Simulation Loop ---
 if __name__ == "__main__":
@@ -54,6 +183,9 @@ if __name__ == "__main__":
     os.makedirs(PCAP_DONE, exist_ok=True)
     os.makedirs(PCAP_TODO, exist_ok=True)
     os.makedirs("models", exist_ok=True) # Ensure models dir exists
+    os.makedirs(CSV_SUSPICIOUS_TODO, exist_ok=True)
+    os.makedirs(CSV_SUSPICIOUS_DONE, exist_ok=True)
+    client = SecOverviewClient(os.getenv('APISERVERURL'), os.getenv('CREDENTIALSUSERNAME'), os.getenv('CREDENTIALSPASSWORD'))
     logging.info(f"Analyser started.")
     while True:
         if os.listdir(PCAP_TODO):
@@ -96,28 +228,6 @@ if __name__ == "__main__":
                 anomaly_df = pd.DataFrame(anomaly_data)
                 anomaly_df.to_csv(CSV_SUSPICIOUS_TODO + name + ".csv", index=False)
 
-                CREDENTIALS = {
-                    "username": os.getenv('CREDENTIALSUSERNAME'),
-                    "password": os.getenv('CREDENTIALSPASSWORD')
-                }
-                token_url = os.getenv('APISERVERURL') + "/api/token"
-                response = requests.post(token_url, json=CREDENTIALS)
-                access_token = response.json().get("access")
-                headers = {"Authorization": f"Bearer {access_token}"}
-    
-                file_path = CSV_SUSPICIOUS_TODO + name + ".csv"
-    
-                url = os.getenv('APISERVERURL') + "/api/mlnids/upload"
-                with open(file_path, 'rb') as f:
-                    files = {'file': (file_path, f, 'text/csv')}
-                    response = requests.post(url, files=files, headers=headers)
-    
-                source_file_suspicious = file_path
-                target_file_suspicious  = os.path.join(CSV_SUSPICIOUS_DONE, name + ".csv")
-    
-                if os.path.isfile(source_file_suspicious):
-                    os.rename(source_file_suspicious, target_file_suspicious)
-
             benign_df = pd.DataFrame(benign_data)
 
             final_df = pd.concat([final_df, benign_df], ignore_index=True)
@@ -133,6 +243,9 @@ if __name__ == "__main__":
             run_script(TRAIN_SCRIPT, [f"--train-if", f"--if-data={IF_DATASET}"])
         #else:
         #    logging.info(f"No data files found in {CSV_TODO}")
+
+        # Uploads new and previously failed suspicious batches (resumes partial uploads)
+        upload_pending_suspicious(client)
         
         time.sleep(1 * 60)
 
@@ -0,0 +1,198 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import flow_schema
+import train
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Defaults ---
+DEFAULT_ROWS = 1000000
+DEFAULT_LABELS = "Benign:0.8,DoS:0.1,PortScan:0.07,Infiltration:0.03"
+DEFAULT_WORKDIR = "benchmark"
+DEFAULT_OUTPUT = "train_benchmark.json"
+DEFAULT_CLASSIFIERS = "rf"
+DEFAULT_INFERENCE_ROWS = 100000
+GENERATE_CHUNK_ROWS = 250000
+MODEL_PATHS = {'rf': train.RF_MODEL_PATH, 'hgb': train.HGB_MODEL_PATH}
+
+# --- Synthetic Data ---
+def parse_labels(spec):
+    """Parses 'Benign:0.8,DoS:0.2' into (labels, probabilities)."""
+    labels, weights = [], []
+    for item in spec.split(','):
+        name, _, weight = item.partition(':')
+        labels.append(name.strip())
+        weights.append(float(weight) if weight else 1.0)
+    weights = np.array(weights) / sum(weights)
+    return labels, weights
+
+def generate_chunk(rng, n_rows, labels, weights, offset):
+    """Builds n_rows synthetic flows following the flow schema.
+
+    Each label shifts the numeric distributions by its own factor so the classifier has real signal to learn.
+    """
+    label_idx = rng.choice(len(labels), size=n_rows, p=weights)
+    scale = 1.0 + label_idx # Per-label shift of every numeric feature
+    data = {}
+    for column in flow_schema.FLOW_COLUMNS:
+        if column.dtype in ('int', 'bigint'):
+            data[column.name] = (rng.poisson(20, n_rows) * scale).astype(np.int64)
+        elif column.dtype == 'float':
+            data[column.name] = np.round(rng.exponential(10.0, n_rows) * scale, 6)
+        elif column.dtype == 'ip':
+            hosts = rng.integers(1, 65025, n_rows)
+            data[column.name] = [f"10.{h // 255}.{h % 255}.1" for h in hosts]
+        else:
+            data[column.name] = [f"flow-{offset + i}" for i in range(n_rows)]
+    data[train.LABEL_COLUMN] = np.array(labels)[label_idx]
+    return pd.DataFrame(data)
+
+def generate_dataset(path, n_rows, labels, weights, random_state=42):
+    """Writes a labelled flow CSV of n_rows in bounded-memory chunks."""
+    rng = np.random.default_rng(random_state)
+    written = 0
+    while written < n_rows:
+        n = min(GENERATE_CHUNK_ROWS, n_rows - written)
+        generate_chunk(rng, n, labels, weights, written).to_csv(path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += n
+        logging.info(f"Generated {written:,}/{n_rows:,} rows.")
+    return os.path.getsize(path)
+
+# --- Benchmark ---
+def file_size(path):
+    return os.path.getsize(path) if os.path.isfile(path) else None
+
+def measure_inference(classifier, holdout_path):
+    """Predicts the holdout file the way process.py does and returns rows/sec (cleaning + transform + predict) and accuracy."""
+    loaded_object = joblib.load(train.PREPROCESSOR_OBJECT_PATH)
+    preprocessor, features = loaded_object['preprocessor'], loaded_object['features']
+    model = joblib.load(MODEL_PATHS[classifier])
+    df = flow_schema.read_flow_csv(holdout_path)
+    y_true = df[train.LABEL_COLUMN].to_numpy()
+
+    start = time.perf_counter()
+    df = train.clean_data_chunk(df, features['num'], features['cat'], chunk_num="Inference")
+    X = df[features['all']]
+    predictions = model.predict(X if classifier == 'hgb' else preprocessor.transform(X))
+    seconds = time.perf_counter() - start
+    return {
+        'rows': len(df),
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(len(df) / seconds, 1) if seconds > 0 else None,
+        'accuracy': round(float((predictions == y_true).mean()), 4),
+    }
+
+def run_classifier(args, classifier, data_path, holdout_path):
+    """Runs the full selective path (preprocessor fit + supervised training) for one classifier with profiling."""
+    # Always measure the full path: preprocessor fit + model training
+    for path in (train.PREPROCESSOR_OBJECT_PATH, MODEL_PATHS[classifier]):
+        if os.path.exists(path):
+            os.remove(path)
+    train.PROFILER.enabled = True
+    train.PROFILER.phases = {}
+    with train.PROFILER.phase('total'):
+        train.train_models_selective(
+            rf_data_path=data_path,
+            if_data_path=None,
+            train_rf_model=True,
+            train_if_model=False,
+            target_sample_size=args.target_sample_size,
+            chunk_size=args.chunk_size,
+            n_estimators=args.n_estimators,
+            max_depth=args.max_depth,
+            n_jobs=args.n_jobs,
+            sampling=args.sampling,
+            ingest_workers=args.ingest_workers,
+            classifier=classifier,
+            compact=args.compact)
+    report = train.PROFILER.report({
+        'models': {
+            'preprocessor_bytes': file_size(train.PREPROCESSOR_OBJECT_PATH),
+            'model_bytes': file_size(MODEL_PATHS[classifier]),
+        },
+    })
+    if os.path.exists(MODEL_PATHS[classifier]):
+        report['inference'] = measure_inference(classifier, holdout_path)
+    if args.compact and classifier == 'rf' and os.path.exists(train.RF_COMPACTION_REPORT_PATH):
+        with open(train.RF_COMPACTION_REPORT_PATH) as f:
+            report['compaction'] = json.load(f)
+    return report
+
+def run_benchmark(args):
+    """Generates (or reuses) the datasets, trains every requested classifier with profiling and returns the report."""
+    os.makedirs(args.workdir, exist_ok=True)
+    data_path = os.path.abspath(os.path.join(args.workdir, f"synthetic_{args.rows}.csv"))
+    holdout_path = os.path.abspath(os.path.join(args.workdir, f"synthetic_holdout_{args.inference_rows}.csv"))
+    labels, weights = parse_labels(args.labels)
+
+    for path, n_rows, seed in ((data_path, args.rows, 42), (holdout_path, args.inference_rows, 7)):
+        if args.regenerate or not os.path.isfile(path):
+            logging.info(f"Generating {n_rows:,} synthetic flows into {path}...")
+            start = time.perf_counter()
+            generate_dataset(path, n_rows, labels, weights, random_state=seed)
+            logging.info(f"Dataset generated in {time.perf_counter() - start:.1f}s.")
+
+    # train.py works with paths relative to its working directory (models/...)
+    cwd = os.getcwd()
+    os.chdir(args.workdir)
+    try:
+        results = {classifier: run_classifier(args, classifier, data_path, holdout_path) for classifier in args.classifiers}
+    finally:
+        os.chdir(cwd)
+
+    return {
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'dataset': {'path': data_path, 'rows': args.rows, 'bytes': os.path.getsize(data_path), 'labels': dict(zip(labels, weights.round(4).tolist()))},
+        'classifiers': results,
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__, 'cpu_count': os.cpu_count()},
+    }
+
+# --- Main ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark train.py on synthetic labelled flow data and report per-phase time and peak memory.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help=f"Rows of synthetic flow data. Default: {DEFAULT_ROWS:,}")
+    parser.add_argument("--labels", default=DEFAULT_LABELS, help=f"Label distribution as name:weight pairs. Default: {DEFAULT_LABELS}")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help=f"Directory for the generated CSV and the trained models. Default: {DEFAULT_WORKDIR}")
+    parser.add_argument("--regenerate", action='store_true', help="Regenerate the dataset even if it already exists.")
+    parser.add_argument("--classifiers", default=DEFAULT_CLASSIFIERS,
+                        help=f"Comma separated supervised models to train and compare (rf, hgb). Default: {DEFAULT_CLASSIFIERS}")
+    parser.add_argument("--compact", action='store_true', help="Compact the RF after training (train.py --compact) and include the before/after report.")
+    parser.add_argument("--inference-rows", type=int, default=DEFAULT_INFERENCE_ROWS,
+                        help=f"Rows of a separate synthetic holdout file used to measure inference rows/sec. Default: {DEFAULT_INFERENCE_ROWS:,}")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help=f"Where to write the JSON report. Default: {DEFAULT_OUTPUT}")
+    parser.add_argument("--target-sample-size", type=int, default=train.DEFAULT_TARGET_SAMPLE_SIZE)
+    parser.add_argument("--sampling", choices=['stratified', 'uniform'], default='stratified')
+    parser.add_argument("--ingest-workers", type=int, default=train.DEFAULT_INGEST_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=train.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--n-estimators", type=int, default=train.DEFAULT_N_ESTIMATORS)
+    parser.add_argument("--max-depth", type=int, default=train.DEFAULT_MAX_DEPTH)
+    parser.add_argument("--n-jobs", type=int, default=train.DEFAULT_N_JOBS)
+    args = parser.parse_args()
+
+    if args.rows <= 0 or args.inference_rows <= 0:
+        parser.error("rows and inference_rows must be positive.")
+    args.classifiers = [c.strip() for c in args.classifiers.split(',') if c.strip()]
+    unknown = [c for c in args.classifiers if c not in MODEL_PATHS]
+    if unknown or not args.classifiers:
+        parser.error(f"Unknown classifiers: {unknown}. Choose from {list(MODEL_PATHS)}.")
+
+    report = run_benchmark(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for classifier, result in report['classifiers'].items():
+        for name, entry in result['phases'].items():
+            logging.info(f"[{classifier}] {name:<22} {entry['wall_seconds']:>9.2f}s wall {entry['peak_rss_mb']:>9.1f} MB peak")
+        inference = result.get('inference', {})
+        logging.info(f"[{classifier}] model {result['models']['model_bytes']} bytes, "
+                     f"{inference.get('rows_per_sec')} rows/sec inference, holdout accuracy {inference.get('accuracy')}")
+    logging.info(f"Benchmark report written to {args.output}")
@@ -10,6 +10,7 @@ import tempfile
 from multiprocessing import Pool, current_process, Lock
 import pandas as pd # Still used for structure definition convenience
 import numpy as np
+import flow_schema
 
 # --- Scapy Import ---
 try:
@@ -247,29 +248,9 @@ def calculate_flow_features(flow_data, flow_key):
 
 
 # --- Feature Definitions (Used for header row) ---
-# Define the column order based on the calculate_flow_features function output keys
-# Ensure this list matches the keys returned by calculate_flow_features
-FEATURE_COLUMNS = [
-    'flow_key', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'protocol',
-    'flow_start_ts', 'flow_last_ts', 'flow_duration',
-    'fwd_pkts_tot', 'bwd_pkts_tot', 'tot_pkts',
-    'fwd_bytes_tot', 'bwd_bytes_tot', 'tot_bytes',
-    'fwd_pkt_len_min', 'fwd_pkt_len_max', 'fwd_pkt_len_mean', 'fwd_pkt_len_std',
-    'bwd_pkt_len_min', 'bwd_pkt_len_max', 'bwd_pkt_len_mean', 'bwd_pkt_len_std',
-    'flow_pkt_len_min', 'flow_pkt_len_max', 'flow_pkt_len_mean', 'flow_pkt_len_std',
-    'avg_pkt_size',
-    'fwd_iat_min', 'fwd_iat_max', 'fwd_iat_mean', 'fwd_iat_std',
-    'bwd_iat_min', 'bwd_iat_max', 'bwd_iat_mean', 'bwd_iat_std',
-    'flow_iat_min', 'flow_iat_max', 'flow_iat_mean', 'flow_iat_std',
-    'fwd_header_len', 'bwd_header_len',
-    'fwd_seg_size_avg', 'bwd_seg_size_avg',
-    'pkts_per_sec', 'bytes_per_sec',
-    'fwd_PSH_flags', 'bwd_PSH_flags', 'fwd_URG_flags', 'bwd_URG_flags',
-    'SYN_flag_cnt', 'FIN_flag_cnt', 'RST_flag_cnt', 'ACK_flag_cnt',
-    'PSH_flag_cnt', 'URG_flag_cnt',
-    'down_up_ratio',
-    'init_win_bytes_fwd', 'init_win_bytes_bwd'
-]
+# Column order comes from the shared flow schema (flow_schema.py)
+# Ensure the keys returned by calculate_flow_features match the schema's FLOW_COLUMNS
+FEATURE_COLUMNS = flow_schema.FEATURE_COLUMNS
 
 
 # --- PCAP Processing Function (Worker - Writes to Temp File) ---
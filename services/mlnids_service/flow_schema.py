@@ -0,0 +1,166 @@
+import hashlib
+from collections import namedtuple
+
+# --- Flow Schema ---
+# Single source of truth for the flow record layout. Consumed by:
+#   - convert_pcap_to_csv.py (CSV header / column order)
+#   - train.py and process.py (model features, typed CSV reads, compatibility check)
+#   - secoverview/mlnids/models.py (NetworkFlow fields)
+# Bump SCHEMA_VERSION whenever a column is added, removed, renamed or changes dtype.
+SCHEMA_VERSION = 1
+
+# dtype: 'str' | 'ip' | 'int' | 'bigint' | 'float' | 'bool' | 'label'
+# nullable: whether the column may be empty in a flow CSV
+# role: 'meta' (identification only), 'num' / 'cat' (model input), 'prediction' (model output)
+FlowColumn = namedtuple('FlowColumn', ['name', 'dtype', 'nullable', 'role'])
+
+FLOW_COLUMNS = [
+    FlowColumn('flow_key', 'str', False, 'meta'),
+    FlowColumn('src_ip', 'ip', False, 'meta'),
+    FlowColumn('dst_ip', 'ip', False, 'meta'),
+    FlowColumn('src_port', 'int', False, 'meta'),
+    FlowColumn('dst_port', 'int', False, 'num'),
+    FlowColumn('protocol', 'int', False, 'num'),
+    FlowColumn('flow_start_ts', 'float', False, 'meta'),
+    FlowColumn('flow_last_ts', 'float', False, 'meta'),
+    FlowColumn('flow_duration', 'float', False, 'num'),
+    FlowColumn('fwd_pkts_tot', 'int', False, 'num'),
+    FlowColumn('bwd_pkts_tot', 'int', False, 'num'),
+    FlowColumn('tot_pkts', 'int', False, 'meta'),
+    FlowColumn('fwd_bytes_tot', 'bigint', False, 'num'),
+    FlowColumn('bwd_bytes_tot', 'bigint', False, 'num'),
+    FlowColumn('tot_bytes', 'bigint', False, 'meta'),
+    FlowColumn('fwd_pkt_len_min', 'float', False, 'num'),
+    FlowColumn('fwd_pkt_len_max', 'float', False, 'num'),
+    FlowColumn('fwd_pkt_len_mean', 'float', False, 'num'),
+    FlowColumn('fwd_pkt_len_std', 'float', False, 'num'),
+    FlowColumn('bwd_pkt_len_min', 'float', False, 'num'),
+    FlowColumn('bwd_pkt_len_max', 'float', False, 'num'),
+    FlowColumn('bwd_pkt_len_mean', 'float', False, 'num'),
+    FlowColumn('bwd_pkt_len_std', 'float', False, 'num'),
+    FlowColumn('flow_pkt_len_min', 'float', False, 'num'),
+    FlowColumn('flow_pkt_len_max', 'float', False, 'num'),
+    FlowColumn('flow_pkt_len_mean', 'float', False, 'num'),
+    FlowColumn('flow_pkt_len_std', 'float', False, 'num'),
+    FlowColumn('avg_pkt_size', 'float', False, 'num'),
+    FlowColumn('fwd_iat_min', 'float', False, 'num'),
+    FlowColumn('fwd_iat_max', 'float', False, 'num'),
+    FlowColumn('fwd_iat_mean', 'float', False, 'num'),
+    FlowColumn('fwd_iat_std', 'float', False, 'num'),
+    FlowColumn('bwd_iat_min', 'float', False, 'num'),
+    FlowColumn('bwd_iat_max', 'float', False, 'num'),
+    FlowColumn('bwd_iat_mean', 'float', False, 'num'),
+    FlowColumn('bwd_iat_std', 'float', False, 'num'),
+    FlowColumn('flow_iat_min', 'float', False, 'num'),
+    FlowColumn('flow_iat_max', 'float', False, 'num'),
+    FlowColumn('flow_iat_mean', 'float', False, 'num'),
+    FlowColumn('flow_iat_std', 'float', False, 'num'),
+    FlowColumn('fwd_header_len', 'bigint', False, 'num'),
+    FlowColumn('bwd_header_len', 'bigint', False, 'num'),
+    FlowColumn('fwd_seg_size_avg', 'float', False, 'num'),
+    FlowColumn('bwd_seg_size_avg', 'float', False, 'num'),
+    FlowColumn('pkts_per_sec', 'float', False, 'num'),
+    FlowColumn('bytes_per_sec', 'float', False, 'num'),
+    FlowColumn('fwd_PSH_flags', 'int', False, 'num'),
+    FlowColumn('bwd_PSH_flags', 'int', False, 'num'),
+    FlowColumn('fwd_URG_flags', 'int', False, 'num'),
+    FlowColumn('bwd_URG_flags', 'int', False, 'num'),
+    FlowColumn('SYN_flag_cnt', 'int', False, 'num'),
+    FlowColumn('FIN_flag_cnt', 'int', False, 'num'),
+    FlowColumn('RST_flag_cnt', 'int', False, 'num'),
+    FlowColumn('ACK_flag_cnt', 'int', False, 'num'),
+    FlowColumn('PSH_flag_cnt', 'int', False, 'num'),
+    FlowColumn('URG_flag_cnt', 'int', False, 'num'),
+    FlowColumn('down_up_ratio', 'float', False, 'num'),
+    FlowColumn('init_win_bytes_fwd', 'int', False, 'num'),
+    FlowColumn('init_win_bytes_bwd', 'int', False, 'num'),
+]
+
+# Columns appended by process.py and uploaded to the SecOverview API
+PREDICTION_COLUMNS = [
+    FlowColumn('rf_prediction', 'label', True, 'prediction'),
+    FlowColumn('rf_confidence', 'float', True, 'prediction'),
+    FlowColumn('if_anomaly_score', 'float', True, 'prediction'),
+    FlowColumn('if_is_anomaly', 'bool', True, 'prediction'),
+]
+
+COLUMNS_BY_NAME = {c.name: c for c in FLOW_COLUMNS + PREDICTION_COLUMNS}
+
+# Column order of the CSV written by convert_pcap_to_csv.py
+FEATURE_COLUMNS = [c.name for c in FLOW_COLUMNS]
+NUMERICAL_FEATURES = [c.name for c in FLOW_COLUMNS if c.role == 'num']
+CATEGORICAL_FEATURES = [c.name for c in FLOW_COLUMNS if c.role == 'cat']
+
+# --- Typed Reads ---
+_PANDAS_DTYPES = {
+    'str': 'str',
+    'ip': 'str',
+    'label': 'str',
+    'int': 'int64',
+    'bigint': 'int64',
+    'float': 'float64',
+    'bool': 'boolean',
+}
+
+def pandas_dtypes(names=None):
+    """Returns a read_csv dtype mapping so schema columns are parsed straight into their final types.
+
+    Nullable integer columns are read as float64 so missing values become NaN instead of failing the read.
+    """
+    columns = FLOW_COLUMNS + PREDICTION_COLUMNS if names is None else [COLUMNS_BY_NAME[n] for n in names if n in COLUMNS_BY_NAME]
+    dtypes = {}
+    for column in columns:
+        dtype = _PANDAS_DTYPES[column.dtype]
+        if column.nullable and dtype == 'int64':
+            dtype = 'float64'
+        dtypes[column.name] = dtype
+    return dtypes
+
+def read_flow_csv(data_path, **kwargs):
+    """Reads a flow CSV with the schema dtypes applied at parse time.
+
+    Falls back to an untyped read (cleaned afterwards by clean_data_chunk) when the file
+    does not follow the schema, e.g. third-party datasets with text values in numeric columns.
+    """
+    import pandas as pd
+    try:
+        return pd.read_csv(data_path, dtype=pandas_dtypes(), **kwargs)
+    except (ValueError, TypeError):
+        return pd.read_csv(data_path, low_memory=False, **kwargs)
+
+# --- Versioning / Compatibility ---
+def schema_fingerprint(names=None):
+    """Stable hash over name, dtype and nullability of the given (default: all flow) columns."""
+    columns = FLOW_COLUMNS if names is None else [COLUMNS_BY_NAME[n] for n in names if n in COLUMNS_BY_NAME]
+    digest = hashlib.sha256()
+    for column in columns:
+        digest.update(f"{column.name}:{column.dtype}:{int(column.nullable)};".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def schema_descriptor(feature_names):
+    """Describes the schema a preprocessor was fitted on. Stored alongside it in the joblib object."""
+    return {
+        'version': SCHEMA_VERSION,
+        'fingerprint': schema_fingerprint(feature_names),
+        'columns': {n: COLUMNS_BY_NAME[n].dtype for n in feature_names if n in COLUMNS_BY_NAME},
+    }
+
+def check_compatibility(saved_schema, feature_names):
+    """Compares the schema a model was trained on against the current one.
+
+    Returns a list of problems; an empty list means the model can be used as is.
+    Objects saved before the schema was versioned carry no descriptor and are checked by feature name only.
+    """
+    if saved_schema and saved_schema.get('version') == SCHEMA_VERSION \
+            and saved_schema.get('fingerprint') == schema_fingerprint(feature_names):
+        return []
+
+    problems = []
+    saved_columns = (saved_schema or {}).get('columns', {})
+    for name in feature_names:
+        column = COLUMNS_BY_NAME.get(name)
+        if column is None or column.role not in ('num', 'cat'):
+            problems.append(f"Feature '{name}' is not a model input in schema v{SCHEMA_VERSION}.")
+        elif name in saved_columns and saved_columns[name] != column.dtype:
+            problems.append(f"Feature '{name}' changed dtype from '{saved_columns[name]}' to '{column.dtype}'.")
+    return problems
@@ -4,6 +4,7 @@ import os
 import argparse
 import logging
 import numpy as np
+import flow_schema
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -12,6 +13,7 @@ MODELS_DIR = "models"
 # **IMPORTANT: Update path name to match train.py**
 PREPROCESSOR_OBJECT_PATH = os.path.join(MODELS_DIR, "preprocessor_and_features.joblib")
 RF_MODEL_PATH = os.path.join(MODELS_DIR, "rf_model.joblib")
+HGB_MODEL_PATH = os.path.join(MODELS_DIR, "hgb_model.joblib") # train.py --classifier hgb, predicts on raw features
 IF_MODEL_PATH = os.path.join(MODELS_DIR, "if_model.joblib")
 OUTPUT_DIR = "analyse/processed_output/"
 
@@ -26,9 +28,11 @@ def clean_data_chunk(df, numerical_cols, categorical_cols, chunk_num="N/A"):
         if col in df.columns:
             original_dtype = df[col].dtype
             # Convert to numeric, coercing errors (strings) to NaN
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            if df[col].isnull().any() and not pd.api.types.is_numeric_dtype(original_dtype):
-                logging.debug(f"Chunk {chunk_num}, Col '{col}': Coerced non-numeric to NaN.")
+            # Columns already read with their schema dtype need no conversion
+            if not pd.api.types.is_numeric_dtype(original_dtype):
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+                if df[col].isnull().any():
+                    logging.debug(f"Chunk {chunk_num}, Col '{col}': Coerced non-numeric to NaN.")
 
             # Handle infinities AFTER converting strings
             if df[col].dtype.kind in 'if': # Check float/int
@@ -40,6 +44,12 @@ def clean_data_chunk(df, numerical_cols, categorical_cols, chunk_num="N/A"):
                     df[col] = df[col].replace([np.inf, -np.inf], np.nan)
     return df
 
+# --- Helper: Supervised Model Selection ---
+def supervised_model_path():
+    """Returns the most recently trained supervised model (RF or HGB), or None if neither exists."""
+    candidates = [p for p in (RF_MODEL_PATH, HGB_MODEL_PATH) if os.path.exists(p)]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
 # --- Prediction Function ---
 def process_predict_and_save(data_path, output_filename):
     """Loads models, processes new data, predicts, and saves results."""
@@ -58,6 +68,9 @@ def process_predict_and_save(data_path, output_filename):
             logging.info("Preprocessor object (including features) loaded successfully.")
             if not actual_features or not actual_features.get('all'):
                  raise ValueError("Loaded features dictionary is empty or invalid.")
+            schema_problems = flow_schema.check_compatibility(loaded_object.get('schema'), actual_features.get('all'))
+            if schema_problems:
+                 raise ValueError(f"Preprocessor was fitted on an incompatible flow schema, retrain with train.py: {schema_problems}")
             logging.info(f"Using features defined by loaded preprocessor: {actual_features.get('all')}")
         else:
              raise ValueError("Loaded preprocessor file has an unexpected format.")
@@ -71,14 +84,16 @@ def process_predict_and_save(data_path, output_filename):
 
     # --- Load Models (RF & IF) ---
     rf_model = None
-    if os.path.exists(RF_MODEL_PATH):
+    rf_model_path = supervised_model_path()
+    rf_uses_raw_features = rf_model_path == HGB_MODEL_PATH # HGB pipeline encodes the cleaned features itself
+    if rf_model_path:
         try:
-            rf_model = joblib.load(RF_MODEL_PATH)
-            logging.info("Random Forest model loaded.")
+            rf_model = joblib.load(rf_model_path)
+            logging.info(f"Supervised model loaded from {rf_model_path}.")
         except Exception as e:
-            logging.warning(f"Could not load RF model from {RF_MODEL_PATH}: {e}")
+            logging.warning(f"Could not load supervised model from {rf_model_path}: {e}")
     else:
-        logging.info("RF model file not found. Skipping RF predictions.")
+        logging.info("RF/HGB model file not found. Skipping RF predictions.")
 
     if_model = None
     if os.path.exists(IF_MODEL_PATH):
@@ -95,7 +110,7 @@ def process_predict_and_save(data_path, output_filename):
     # --- Load New Data ---
     try:
         # Load the whole file - adjust if new data can also be huge
-        df_new = pd.read_csv(data_path, low_memory=False)
+        df_new = flow_schema.read_flow_csv(data_path)
         logging.info(f"Loaded new data with shape: {df_new.shape}")
         # Keep original data to append predictions to
         df_output = df_new.copy()
@@ -159,12 +174,13 @@ def process_predict_and_save(data_path, output_filename):
     # RF Prediction (if model loaded)
     if rf_model:
         try:
-            rf_predictions = rf_model.predict(X_new_processed)
+            X_rf = X_new if rf_uses_raw_features else X_new_processed
+            rf_predictions = rf_model.predict(X_rf)
             df_output['rf_prediction'] = rf_predictions
             logging.info("RF predictions generated.")
             # Optionally add probabilities if needed
             try:
-                 rf_probabilities = rf_model.predict_proba(X_new_processed)
+                 rf_probabilities = rf_model.predict_proba(X_rf)
                  # Get the probability of the predicted class
                  df_output['rf_confidence'] = np.max(rf_probabilities, axis=1)
                  logging.info("RF confidence scores generated.")
@@ -0,0 +1,76 @@
+"""Tests of the training helpers, run from this directory: python -m unittest test_train"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+import train
+
+MB = 1024 * 1024
+
+def allocate(mb):
+    """Touches mb megabytes (b'x' * n writes every page, unlike calloc'ed zero buffers) and frees them again."""
+    data = b'x' * (mb * MB)
+    return len(data)
+
+@unittest.skipUnless(train.PhaseProfiler._reset_peak_rss(), "needs the resettable high-water mark of Linux")
+class PhaseProfilerTests(unittest.TestCase):
+    def test_small_phase_after_a_large_one_gets_its_own_peak(self):
+        profiler = train.PhaseProfiler(enabled=True)
+        with profiler.phase('large'):
+            allocate(300)
+        with profiler.phase('small'):
+            allocate(1)
+        large, small = profiler.phases['large']['peak_rss_mb'], profiler.phases['small']['peak_rss_mb']
+        self.assertGreater(large - small, 250)
+
+    def test_enclosing_phase_includes_its_children(self):
+        profiler = train.PhaseProfiler(enabled=True)
+        with profiler.phase('train'):
+            with profiler.phase('large'):
+                allocate(300)
+            with profiler.phase('small'):
+                allocate(1)
+        phases = profiler.phases
+        self.assertGreaterEqual(phases['train']['peak_rss_mb'], phases['large']['peak_rss_mb'])
+        self.assertGreater(phases['large']['peak_rss_mb'] - phases['small']['peak_rss_mb'], 250)
+
+class CompactionTests(unittest.TestCase):
+    def test_trees_are_selected_on_validation_and_reported_on_test(self):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(900, 4))
+        y = np.where(X[:, 0] + 0.5 * rng.normal(size=900) > 0, 'Attack', 'Benign')
+        model = RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0).fit(X[:500], y[:500])
+        X_val, y_val, X_test, y_test = X[500:700], y[500:700], X[700:], y[700:]
+        compacted, report = train.compact_random_forest(model, X_val, y_val, X_test, y_test, f1_tolerance=0.05)
+        self.assertLess(len(compacted.estimators_), 20)
+        for stage, stage_model in (('before', model), ('after', compacted)):
+            self.assertEqual(report[stage]['accuracy'], round(float((stage_model.predict(X_test) == y_test).mean()), 4))
+
+class ChunkReaderTests(unittest.TestCase):
+    def write_csv(self, rows):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write("src_ip, dst_port,tot_bytes,Label\n" + ''.join(f"{ip},{port},{size},Benign\n" for ip, port, size in rows))
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_chunks_get_the_schema_dtypes(self):
+        path = self.write_csv([(f"10.0.0.{i}", i, i * 10) for i in range(10)])
+        chunks = list(train.read_chunks(path, 4))
+        self.assertEqual([str(chunk[' dst_port'].dtype) for chunk in chunks], ['int64'] * 3)
+        parts = [list(train.iter_part_chunks(path, part, train.read_header(path), 4)) for part in train.split_csv_byte_ranges(path, 2)]
+        self.assertEqual(sum(len(chunk) for chunks in parts for chunk in chunks), 10)
+        self.assertTrue(all(str(chunk['tot_bytes'].dtype) == 'int64' for chunks in parts for chunk in chunks))
+
+    def test_rows_off_the_schema_fall_back_to_untyped_chunks(self):
+        rows = [(f"10.0.0.{i}", i, i) for i in range(10)] + [("10.0.0.99", "n/a", 5)] + [(f"10.0.1.{i}", i, i) for i in range(5)]
+        with self.assertLogs(level='WARNING'):
+            chunks = list(train.read_chunks(self.write_csv(rows), 4))
+        ips = [ip for chunk in chunks for ip in chunk['src_ip']]
+        self.assertEqual(ips, [ip for ip, _, _ in rows])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,43 +1,42 @@
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, IsolationForest
+from sklearn.ensemble import RandomForestClassifier, IsolationForest, HistGradientBoostingClassifier
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
+from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
+from sklearn.tree._tree import Tree, TREE_LEAF, TREE_UNDEFINED
 import joblib
 import os
 import argparse
 import logging
 import gc
 import numpy as np
+import io
+import json
+import time
+import copy
+from contextlib import contextmanager
 from collections import defaultdict
+from multiprocessing import Pool
+import flow_schema
+
+# --- Optional Parquet Support ---
+try:
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Feature Definitions ---
 # Represents ALL possible features needed by either RF or IF data
-# Ensure consistency in naming (after stripping whitespace)
-# User should replace this with their comprehensive feature list
-DEFAULT_NUMERICAL_FEATURES = [
-    "flow_duration", "fwd_pkts_tot", "bwd_pkts_tot",
-    "fwd_bytes_tot", "bwd_bytes_tot", "fwd_pkt_len_min", "fwd_pkt_len_max",
-    "fwd_pkt_len_mean", "fwd_pkt_len_std", "bwd_pkt_len_min", "bwd_pkt_len_max",
-    "bwd_pkt_len_mean", "bwd_pkt_len_std", "flow_pkt_len_min", "flow_pkt_len_max",
-    "flow_pkt_len_mean", "flow_pkt_len_std", "fwd_iat_min", "fwd_iat_max",
-    "fwd_iat_mean", "fwd_iat_std", "bwd_iat_min", "bwd_iat_max",
-    "bwd_iat_mean", "bwd_iat_std", "flow_iat_min", "flow_iat_max",
-    "flow_iat_mean", "flow_iat_std", "fwd_header_len", "bwd_header_len",
-    "pkts_per_sec", "bytes_per_sec", "down_up_ratio", "avg_pkt_size",
-    "fwd_seg_size_avg", "bwd_seg_size_avg", "init_win_bytes_fwd",
-    "init_win_bytes_bwd",
-    "fwd_PSH_flags", "bwd_PSH_flags", "fwd_URG_flags", "bwd_URG_flags",
-    "SYN_flag_cnt", "FIN_flag_cnt", "RST_flag_cnt", "ACK_flag_cnt",
-    "PSH_flag_cnt", "URG_flag_cnt",
-    "protocol", "dst_port"
-]
-DEFAULT_CATEGORICAL_FEATURES = [] # Explicitly empty if none are categorical by default
+# Taken from the shared flow schema (flow_schema.py) so converter, training,
+# processing and the SecOverview NetworkFlow model agree on names and dtypes
+DEFAULT_NUMERICAL_FEATURES = flow_schema.NUMERICAL_FEATURES
+DEFAULT_CATEGORICAL_FEATURES = flow_schema.CATEGORICAL_FEATURES # Empty unless the schema marks columns as categorical
 LABEL_COLUMN = 'Label' # Expected label column name for RF data
 
 # --- Default Paths and Model Params ---
@@ -45,6 +44,8 @@ MODELS_DIR = "models"
 # Path now points to the combined object (preprocessor + features)
 PREPROCESSOR_OBJECT_PATH = os.path.join(MODELS_DIR, "preprocessor_and_features.joblib")
 RF_MODEL_PATH = os.path.join(MODELS_DIR, "rf_model.joblib")
+# Alternative supervised model (--classifier hgb). Contains its own encoding and predicts on the cleaned raw features.
+HGB_MODEL_PATH = os.path.join(MODELS_DIR, "hgb_model.joblib")
 IF_MODEL_PATH = os.path.join(MODELS_DIR, "if_model.joblib")
 
 DEFAULT_CHUNK_SIZE = 2000000
@@ -52,6 +53,110 @@ DEFAULT_TARGET_SAMPLE_SIZE = 16233002 # Sample size from the RF/main data path
 DEFAULT_N_ESTIMATORS = 100
 DEFAULT_MAX_DEPTH = 50
 DEFAULT_N_JOBS = 3
+DEFAULT_INGEST_WORKERS = 1
+DEFAULT_COMPACT_F1_TOLERANCE = 0.005 # Max. macro F1 the compacted RF may lose on the validation split
+COMPACT_SELECTION_ROWS = 20000 # Validation rows used for the (quadratic) tree selection
+COMPACT_VALIDATION_SIZE = 0.1 # Share of the RF training sample held out for the tree selection
+RF_COMPACTION_REPORT_PATH = os.path.join(MODELS_DIR, "rf_compaction.json")
+DEFAULT_CLASSIFIER = 'rf' # 'rf' (RandomForest on the OHE/scaled matrix) or 'hgb' (HistGradientBoosting, native categoricals)
+
+# --- Profiling (--profile) ---
+class PhaseProfiler:
+    """Collects wall time, CPU time and peak RSS per named training phase.
+
+    Repeated phases (e.g. per chunk) are accumulated. Peak memory uses the kernel's
+    resettable high-water mark (/proc/self/clear_refs) on Linux, so every phase gets
+    its own peak; elsewhere it falls back to the process-lifetime maximum.
+    Disabled profilers add no measurable overhead.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.phases = {}
+        self._stack = [] # Peaks of the running phases so far, innermost last
+
+    @staticmethod
+    def _reset_peak_rss():
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _peak_rss_mb():
+        try:
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _record(self, name, wall, cpu, peak_mb):
+        entry = self.phases.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss_mb': 0.0})
+        entry['calls'] += 1
+        entry['wall_seconds'] += wall
+        entry['cpu_seconds'] += cpu
+        entry['peak_rss_mb'] = max(entry['peak_rss_mb'], peak_mb)
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self._stack: # The high-water mark so far belongs to the enclosing phase
+            self._stack[-1] = max(self._stack[-1], self._peak_rss_mb())
+        self._stack.append(0.0)
+        self._reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            peak_mb = max(self._stack.pop(), self._peak_rss_mb()) # Own peak, including nested phases
+            self._record(name, wall, cpu, peak_mb)
+            if self._stack:
+                self._stack[-1] = max(self._stack[-1], peak_mb)
+
+    def iterate(self, name, iterable):
+        """Yields from iterable, attributing the time spent producing each item (e.g. CSV parsing) to name."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self, extra=None):
+        import resource
+        report = {
+            'phases': {name: {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()} for name, entry in self.phases.items()},
+            'max_rss_mb': round(self._peak_rss_mb() if not self.phases else max(e['peak_rss_mb'] for e in self.phases.values()), 2),
+            'children_max_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 2),
+        }
+        if extra:
+            report.update(extra)
+        return report
+
+PROFILER = PhaseProfiler(enabled=False)
+DEFAULT_PROFILE_PATH = os.path.join(MODELS_DIR, "train_profile.json")
+
+def write_profile_report(path, extra=None):
+    """Writes the collected phase timings as JSON and logs a one-line summary per phase."""
+    report = PROFILER.report(extra)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, entry in report['phases'].items():
+        logging.info(f"Profile {name:<22} {entry['wall_seconds']:>9.2f}s wall {entry['cpu_seconds']:>9.2f}s cpu {entry['peak_rss_mb']:>9.1f} MB peak ({entry['calls']} calls)")
+    logging.info(f"Profile report written to {path}")
+    return report
 
 # --- Memory Optimization Function ---
 def optimize_dtypes(df):
@@ -62,6 +167,120 @@ def optimize_dtypes(df):
         df[col] = pd.to_numeric(df[col], downcast='float')
     return df
 
+# --- Streaming Sampler ---
+class StratifiedReservoirSampler:
+    """Single-pass sampler with a fixed row budget over a stream of DataFrame chunks.
+
+    Every row gets a uniform random priority and, per label, only the rows with the
+    smallest priorities are kept (bottom-k sampling), i.e. an exact uniform sample of
+    that label. The budget is split across labels by water-filling: labels smaller than
+    their share are kept completely, the remainder is divided evenly among the larger
+    ones, so rare attack classes are never sampled away. The share can only shrink as
+    more rows arrive, so trimming a reservoir never loses rows that are needed later.
+    Without a label column the sampler is a plain uniform reservoir sample.
+
+    Memory is bounded by the budget (plus one row per label) and the current chunk.
+    """
+    PRIORITY_COLUMN = '__sample_priority'
+
+    def __init__(self, sample_size, label_column=None, random_state=42):
+        self.sample_size = sample_size
+        self.label_column = label_column
+        self.rng = np.random.default_rng(random_state)
+        self.reservoirs = {} # label -> DataFrame (incl. priority column)
+        self.label_counts = defaultdict(int) # label -> rows seen
+        self.total_rows = 0
+
+    def _split_by_label(self, chunk):
+        if self.label_column is None or self.label_column not in chunk.columns:
+            return [(None, chunk)]
+        groups = []
+        for label, group in chunk.groupby(self.label_column, dropna=False, sort=False):
+            groups.append((None if pd.isna(label) else label, group))
+        return groups
+
+    def _water_level(self):
+        """Per-label share of the budget given the rows seen so far (inf if everything fits)."""
+        counts = sorted(self.label_counts.values())
+        remaining = self.sample_size
+        for i, count in enumerate(counts):
+            share = remaining / (len(counts) - i)
+            if count <= share:
+                remaining -= count
+            else:
+                return share
+        return float('inf')
+
+    def _keep(self, label, frames, cap):
+        combined = pd.concat(frames) if len(frames) > 1 else frames[0]
+        if len(combined) > cap:
+            combined = combined.nsmallest(cap, self.PRIORITY_COLUMN)
+        self.reservoirs[label] = combined
+
+    def _fold(self, new_rows):
+        """Merges label -> rows into the reservoirs, trimming each to the current share."""
+        level = self._water_level()
+        cap = None if level == float('inf') else int(np.ceil(level))
+        for label in set(self.reservoirs) | set(new_rows):
+            current = self.reservoirs.get(label)
+            group = new_rows.get(label)
+            if cap is None:
+                frames = [f for f in (current, group) if f is not None]
+                self.reservoirs[label] = pd.concat(frames) if len(frames) > 1 else frames[0]
+                continue
+            if group is not None and current is not None and len(current) >= cap:
+                # Reservoir is full: only rows beating its worst priority can get in
+                group = group[group[self.PRIORITY_COLUMN] < current[self.PRIORITY_COLUMN].max()]
+            frames = [f for f in (current, group) if f is not None and not f.empty]
+            if frames:
+                self._keep(label, frames, cap)
+
+    def add(self, chunk):
+        """Offers all rows of a chunk to the sample."""
+        if chunk.empty:
+            return
+        chunk = chunk.assign(**{self.PRIORITY_COLUMN: self.rng.random(len(chunk))})
+        groups = self._split_by_label(chunk)
+        for label, group in groups:
+            self.label_counts[label] += len(group)
+        self.total_rows += len(chunk)
+        self._fold(dict(groups))
+
+    def merge(self, other):
+        """Folds in a sampler (same budget, different seed) that saw a disjoint part of the data.
+
+        A part has fewer rows per label, so its share was never below the combined one and its
+        reservoirs hold every row the combined sample can need; the result is exact.
+        """
+        for label, count in other.label_counts.items():
+            self.label_counts[label] += count
+        self.total_rows += other.total_rows
+        self._fold(other.reservoirs)
+
+    def sample(self):
+        """Returns the sample: exactly min(budget, rows seen) rows in random order."""
+        if not self.reservoirs:
+            return pd.DataFrame()
+        level = self._water_level()
+        allocation = {}
+        if level == float('inf'):
+            allocation = {label: len(res) for label, res in self.reservoirs.items()}
+        else:
+            large = sorted((l for l in self.reservoirs if self.label_counts[l] > level), key=lambda l: -self.label_counts[l])
+            for label in self.reservoirs:
+                if label not in large:
+                    allocation[label] = self.label_counts[label]
+            remaining = self.sample_size - sum(allocation.values())
+            base, extra = divmod(remaining, len(large)) if large else (0, 0)
+            for i, label in enumerate(large):
+                allocation[label] = base + (1 if i < extra else 0)
+        frames = [res.nsmallest(allocation[label], self.PRIORITY_COLUMN) for label, res in self.reservoirs.items() if allocation[label] > 0]
+        sampled = pd.concat(frames).sort_values(self.PRIORITY_COLUMN)
+        return sampled.drop(columns=[self.PRIORITY_COLUMN]).reset_index(drop=True)
+
+    def size(self):
+        return sum(len(res) for res in self.reservoirs.values())
+
 # --- Preprocessor Building Function (Including Imputation) ---
 def build_preprocessor(numerical_features, categorical_features, known_categories):
     """Builds a ColumnTransformer including imputation for numerical features."""
@@ -95,6 +314,171 @@ def build_preprocessor(numerical_features, categorical_features, known_categorie
     preprocessor = ColumnTransformer(transformers=transformers, remainder='drop', n_jobs=1)
     return preprocessor
 
+# --- HistGradientBoosting Model Building Function ---
+def build_hgb_classifier(numerical_features, categorical_features, known_categories, max_iter, max_depth, random_state=42):
+    """Builds a HistGradientBoosting pipeline that works on the cleaned raw features.
+
+    No scaling, imputation or one-hot expansion: numeric columns (float32 after optimize_dtypes)
+    are passed through and binned into uint8 by the model, NaNs get their own bin, and
+    categorical columns are ordinal encoded and declared as native categorical features.
+    """
+    transformers = []
+    if numerical_features:
+        transformers.append(('num', 'passthrough', numerical_features))
+    if categorical_features:
+        transformers.append(('cat', OrdinalEncoder(
+            categories=[known_categories.get(f, []) for f in categorical_features],
+            handle_unknown='use_encoded_value', unknown_value=np.nan), categorical_features))
+    encoder = ColumnTransformer(transformers=transformers, remainder='drop', sparse_threshold=0)
+    categorical_mask = [False] * len(numerical_features) + [True] * len(categorical_features)
+    classifier = HistGradientBoostingClassifier(
+        max_iter=max_iter, max_depth=max_depth, class_weight='balanced', random_state=random_state,
+        categorical_features=categorical_mask if any(categorical_mask) else None)
+    return Pipeline(steps=[('encoder', encoder), ('classifier', classifier)])
+
+def known_categories_of(preprocessor, categorical_features):
+    """Reads the category lists back from a fitted preprocessor (its OneHotEncoder)."""
+    if not categorical_features:
+        return {}
+    try:
+        onehot = preprocessor.named_transformers_['cat'].named_steps['onehot']
+        return {f: list(c) for f, c in zip(categorical_features, onehot.categories_)}
+    except (AttributeError, KeyError):
+        return {}
+
+# --- RF Compaction (--compact) ---
+def compact_tree(estimator, max_depth=None):
+    """Returns a copy of a fitted decision tree with depth capped and thresholds quantized to float32.
+
+    Nodes at max_depth become leaves (their stored class distribution is the one of all samples
+    below them) and unreachable nodes are dropped from the node arrays. Trees compare float32
+    features, so rounding each threshold down to the nearest float32 gives identical decisions
+    while the thresholds compress much better on disk.
+    """
+    state = estimator.tree_.__getstate__()
+    nodes, values = state['nodes'], state['values']
+
+    depth = np.full(len(nodes), -1, dtype=np.int64)
+    frontier, level = np.array([0]), 0
+    while frontier.size:
+        depth[frontier] = level
+        internal = frontier[nodes['left_child'][frontier] != TREE_LEAF]
+        if max_depth is not None and level >= max_depth:
+            break
+        frontier = np.concatenate([nodes['left_child'][internal], nodes['right_child'][internal]])
+        level += 1
+
+    keep = depth >= 0
+    new_index = np.cumsum(keep) - 1
+    new_nodes, new_values = nodes[keep].copy(), values[keep].copy()
+    is_leaf = (new_nodes['left_child'] == TREE_LEAF) | (depth[keep] == max_depth if max_depth is not None else False)
+    internal = ~is_leaf
+    new_nodes['left_child'][internal] = new_index[new_nodes['left_child'][internal]]
+    new_nodes['right_child'][internal] = new_index[new_nodes['right_child'][internal]]
+    new_nodes['left_child'][is_leaf] = TREE_LEAF
+    new_nodes['right_child'][is_leaf] = TREE_LEAF
+    new_nodes['feature'][is_leaf] = TREE_UNDEFINED
+    new_nodes['threshold'][is_leaf] = TREE_UNDEFINED
+
+    thresholds = new_nodes['threshold'][internal]
+    quantized = thresholds.astype(np.float32)
+    too_high = quantized.astype(np.float64) > thresholds
+    quantized[too_high] = np.nextafter(quantized[too_high], np.float32(-np.inf))
+    new_nodes['threshold'][internal] = quantized.astype(np.float64)
+
+    old_tree = estimator.tree_
+    tree = Tree(old_tree.n_features, np.asarray(old_tree.n_classes, dtype=np.intp), old_tree.n_outputs)
+    tree.__setstate__({
+        'max_depth': int(depth[keep].max()),
+        'node_count': int(keep.sum()),
+        'nodes': new_nodes,
+        'values': new_values,
+    })
+    compacted = copy.copy(estimator)
+    compacted.tree_ = tree
+    return compacted
+
+def macro_f1(y_true, y_pred, n_classes):
+    """Macro F1 over integer-encoded labels (classes absent from both vectors are ignored)."""
+    tp = np.bincount(y_true[y_true == y_pred], minlength=n_classes)
+    support = np.bincount(y_true, minlength=n_classes)
+    predicted = np.bincount(y_pred, minlength=n_classes)
+    present = (support + predicted) > 0
+    return float(np.mean(2 * tp[present] / (support[present] + predicted[present])))
+
+def model_stats(model, X_val, y_val):
+    """Size (as saved by joblib), accuracy, macro F1 and prediction throughput on the given split."""
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer, compress=3)
+    start = time.perf_counter()
+    y_pred = model.predict(X_val)
+    seconds = time.perf_counter() - start
+    y_true = np.searchsorted(model.classes_, np.asarray(y_val))
+    return {
+        'n_estimators': len(model.estimators_),
+        'max_depth': max(e.tree_.max_depth for e in model.estimators_),
+        'node_count': sum(e.tree_.node_count for e in model.estimators_),
+        'bytes': buffer.getbuffer().nbytes,
+        'accuracy': round(float((y_pred == np.asarray(y_val)).mean()), 4),
+        'f1_macro': round(macro_f1(y_true, np.searchsorted(model.classes_, y_pred), len(model.classes_)), 4),
+        'rows_per_sec': round(X_val.shape[0] / seconds, 1) if seconds > 0 else None,
+    }
+
+def compact_random_forest(model, X_val, y_val, X_test, y_test, f1_tolerance=DEFAULT_COMPACT_F1_TOLERANCE, max_depth=None, min_rows_per_sec=None):
+    """Shrinks a fitted RandomForestClassifier for faster inference and smaller model files.
+
+    1. Caps every tree at max_depth and quantizes thresholds (compact_tree).
+    2. Greedily selects trees (forward selection on averaged validation probabilities) until the
+       macro F1 is within f1_tolerance of the full forest's.
+    3. If min_rows_per_sec is given, the number of trees is additionally limited to what the
+       measured per-tree prediction cost allows; the F1 tolerance may then not be reached.
+
+    The trees are selected on the validation split (X_val, y_val), which must not be used for
+    fitting; the 'before'/'after' statistics are measured on the separate test split, so the
+    report is not biased by the selection.
+
+    Returns (compacted model, report with 'before'/'after' statistics).
+    """
+    before = model_stats(model, X_test, y_test)
+    n_classes = len(model.classes_)
+    y_true = np.searchsorted(model.classes_, np.asarray(y_val))
+    trees = [compact_tree(e, max_depth) for e in model.estimators_]
+
+    X_sel = X_val
+    if X_val.shape[0] > COMPACT_SELECTION_ROWS:
+        rows = np.random.default_rng(42).choice(X_val.shape[0], COMPACT_SELECTION_ROWS, replace=False)
+        X_sel, y_true = X_val[rows], y_true[rows]
+    # Per-tree class probabilities on the selection rows, (n_trees, n_rows, n_classes)
+    probabilities = np.stack([t.predict_proba(X_sel).astype(np.float32) for t in trees])
+    target_f1 = macro_f1(y_true, probabilities.mean(axis=0).argmax(axis=1), n_classes) - f1_tolerance
+
+    max_trees = len(trees)
+    if min_rows_per_sec:
+        start = time.perf_counter()
+        trees[0].predict(X_sel)
+        seconds_per_tree = max(time.perf_counter() - start, 1e-9) / X_sel.shape[0]
+        max_trees = max(1, min(max_trees, int(1.0 / (min_rows_per_sec * seconds_per_tree))))
+
+    selected, remaining = [], list(range(len(trees)))
+    total, f1 = np.zeros_like(probabilities[0]), 0.0
+    while remaining and len(selected) < max_trees and (not selected or f1 < target_f1):
+        scores = [macro_f1(y_true, (total + probabilities[i]).argmax(axis=1), n_classes) for i in remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        selected.append(best)
+        total += probabilities[best]
+        f1 = max(scores)
+    if f1 < target_f1:
+        logging.warning(f"Compaction: {len(selected)} trees reach F1 {f1:.4f}, below the target {target_f1:.4f} (tree limit {max_trees}).")
+
+    compacted = copy.copy(model)
+    compacted.estimators_ = [trees[i] for i in selected]
+    compacted.n_estimators = len(selected)
+    if max_depth is not None:
+        compacted.max_depth = min(max_depth, model.max_depth or max_depth)
+    after = model_stats(compacted, X_test, y_test)
+    return compacted, {'f1_tolerance': f1_tolerance, 'max_depth': max_depth, 'min_rows_per_sec': min_rows_per_sec,
+                       'before': before, 'after': after}
+
 # --- Data Cleaning Function (Reusable) ---
 def clean_data_chunk(df, numerical_cols, categorical_cols, chunk_num="N/A"):
     """Applies cleaning steps (numeric conversion, infinity handling) to a DataFrame."""
@@ -105,9 +489,11 @@ def clean_data_chunk(df, numerical_cols, categorical_cols, chunk_num="N/A"):
         if col in df.columns:
             original_dtype = df[col].dtype
             # Convert to numeric, coercing errors (strings) to NaN
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-            if df[col].isnull().any() and not pd.api.types.is_numeric_dtype(original_dtype):
-                logging.debug(f"Chunk {chunk_num}, Col '{col}': Coerced non-numeric to NaN.")
+            # Columns already read with their schema dtype need no conversion
+            if not pd.api.types.is_numeric_dtype(original_dtype):
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+                if df[col].isnull().any():
+                    logging.debug(f"Chunk {chunk_num}, Col '{col}': Coerced non-numeric to NaN.")
 
             # Handle infinities AFTER converting strings
             if df[col].dtype.kind in 'if': # Check float/int
@@ -122,9 +508,153 @@ def clean_data_chunk(df, numerical_cols, categorical_cols, chunk_num="N/A"):
 
     return df
 
+# --- Parallel Ingestion (CSV byte ranges / Parquet row groups) ---
+def is_parquet(data_path):
+    return data_path.lower().endswith(('.parquet', '.pq'))
+
+def read_header(data_path):
+    """Returns the raw column names of a CSV or Parquet file without reading any rows."""
+    if is_parquet(data_path):
+        if not PYARROW_AVAILABLE:
+            raise ImportError("pyarrow is required to read Parquet files: pip install pyarrow")
+        return list(pq.ParquetFile(data_path).schema_arrow.names)
+    return list(pd.read_csv(data_path, nrows=0).columns)
+
+def split_csv_byte_ranges(data_path, n_parts):
+    """Splits the rows of a CSV file into up to n_parts byte ranges aligned to line starts.
+
+    Assumes no quoted field contains a newline, which holds for flow CSVs.
+    """
+    file_size = os.path.getsize(data_path)
+    with open(data_path, 'rb') as f:
+        f.readline() # Skip header
+        boundaries = [f.tell()]
+        data_size = file_size - boundaries[0]
+        for i in range(1, n_parts):
+            f.seek(boundaries[0] + data_size * i // n_parts)
+            f.readline() # Move to the start of the next line
+            position = f.tell()
+            if position >= file_size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+class ByteRangeFile(io.RawIOBase):
+    """Read-only file object exposing bytes [start, end) of a file, so read_csv can stream one part."""
+
+    def __init__(self, path, start, end):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def typed_csv_chunks(open_source, columns, chunk_size, header_lines, **kwargs):
+    """Yields read_csv chunks with the flow schema dtypes applied at parse time.
+
+    Like flow_schema.read_flow_csv, a file that does not follow the schema is read untyped
+    (cleaned afterwards by clean_data_chunk): from the first chunk that fails, re-opening the
+    source with open_source() and skipping the rows already yielded. columns holds the raw
+    column names, header_lines the number of header lines at the start of the source.
+    """
+    schema_dtypes = flow_schema.pandas_dtypes()
+    dtypes = {name: schema_dtypes[name.strip()] for name in columns if name.strip() in schema_dtypes}
+    done = 0
+    with open_source() as source:
+        reader = pd.read_csv(source, dtype=dtypes, chunksize=chunk_size, **kwargs)
+        while True:
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                return
+            except (ValueError, TypeError) as e:
+                logging.warning(f"Values not matching the flow schema after {done} rows, reading the rest untyped: {e}")
+                break
+            done += len(chunk)
+            yield chunk
+    with open_source() as source:
+        yield from pd.read_csv(source, chunksize=chunk_size, low_memory=False, skiprows=range(header_lines, header_lines + done), **kwargs)
+
+def iter_part_chunks(data_path, part, header, chunk_size):
+    """Yields DataFrame chunks of one part: a (start, end) byte range or a list of Parquet row groups."""
+    if is_parquet(data_path):
+        for batch in pq.ParquetFile(data_path).iter_batches(batch_size=chunk_size, row_groups=part):
+            yield batch.to_pandas()
+        return
+    start, end = part
+    open_part = lambda: io.BufferedReader(ByteRangeFile(data_path, start, end), buffer_size=1 << 20)
+    yield from typed_csv_chunks(open_part, header, chunk_size, 0, header=None, names=header)
+
+def read_chunks(data_path, chunk_size):
+    """Sequential chunk iterator over a whole CSV or Parquet file."""
+    if is_parquet(data_path):
+        read_header(data_path) # Raises if pyarrow is missing
+        return iter_part_chunks(data_path, list(range(pq.ParquetFile(data_path).num_row_groups)), None, chunk_size)
+    return typed_csv_chunks(lambda: open(data_path, 'rb'), read_header(data_path), chunk_size, 1)
+
+def ingest_part(task):
+    """Worker: cleans one part of the file, collecting categories, row counts and a reservoir sample."""
+    data_path, part, header, numerical_cols, categorical_cols, keep_cols, label_column, sample_size, chunk_size, seed = task
+    sampler = StratifiedReservoirSampler(sample_size, label_column=label_column, random_state=seed)
+    categories = defaultdict(set)
+    for i, chunk in enumerate(iter_part_chunks(data_path, part, header, chunk_size)):
+        chunk = clean_data_chunk(chunk, numerical_cols, categorical_cols, chunk_num=f"Part{seed}:{i+1}")
+        chunk = optimize_dtypes(chunk)
+        chunk = chunk[[c for c in keep_cols if c in chunk.columns]]
+        for col in categorical_cols:
+            if col in chunk.columns: categories[col].update(chunk[col].dropna().unique())
+        sampler.add(chunk)
+        del chunk
+    return dict(categories), sampler
+
+def parallel_ingest(data_path, numerical_cols, categorical_cols, keep_cols, label_column, sample_size, chunk_size, workers, random_state=42):
+    """Reads a CSV/Parquet file with a process pool and merges the per-part results.
+
+    Returns (categories per column, merged StratifiedReservoirSampler). Each worker keeps a
+    reservoir of up to sample_size rows, so peak memory grows with the number of workers.
+    """
+    header = read_header(data_path)
+    if is_parquet(data_path):
+        row_groups = list(range(pq.ParquetFile(data_path).num_row_groups))
+        parts = [row_groups[i::workers] for i in range(workers) if row_groups[i::workers]]
+    else:
+        parts = split_csv_byte_ranges(data_path, workers)
+    logging.info(f"Parallel ingestion of {data_path}: {len(parts)} parts on {workers} workers.")
+
+    tasks = [(data_path, part, header, numerical_cols, categorical_cols, keep_cols, label_column, sample_size, chunk_size, random_state + i)
+             for i, part in enumerate(parts)]
+    categories = defaultdict(set)
+    sampler = StratifiedReservoirSampler(sample_size, label_column=label_column, random_state=random_state)
+    with Pool(processes=min(workers, max(1, len(tasks)))) as pool:
+        for part_categories, part_sampler in pool.imap_unordered(ingest_part, tasks):
+            for col, values in part_categories.items():
+                categories[col].update(values)
+            sampler.merge(part_sampler)
+            logging.info(f"  Part merged: {sampler.total_rows:,} rows read so far. Sample size: {sampler.size():,}")
+    return categories, sampler
+
 # --- Function to Load/Sample/Clean/Transform Data using EXISTING Preprocessor ---
-def load_and_process_data(data_path, preprocessor, features_dict, chunk_size, target_sample_size=None, is_rf_data=False):
-    """Loads data (chunked if sampling), cleans, and transforms using a loaded preprocessor."""
+def load_and_process_data(data_path, preprocessor, features_dict, chunk_size, target_sample_size=None, is_rf_data=False, sampling='stratified', ingest_workers=1, raw_features=False):
+    """Loads data (chunked if sampling), cleans, and transforms using a loaded preprocessor.
+
+    With raw_features=True the cleaned feature columns are returned untransformed (for models with their own encoding).
+    """
     logging.info(f"Loading/Processing data from: {data_path}")
     if not os.path.isfile(data_path):
         logging.error(f"Data file not found: {data_path}")
@@ -150,8 +680,10 @@ def load_and_process_data(data_path, preprocessor, features_dict, chunk_size, ta
     if load_all:
         logging.info("Loading entire file (assuming it fits memory)...")
         try:
-            df_full = pd.read_csv(data_path, low_memory=False)
-            df_full = clean_data_chunk(df_full, numerical_cols, categorical_cols, chunk_num="FullLoad")
+            with PROFILER.phase('load.read'):
+                df_full = flow_schema.read_flow_csv(data_path)
+            with PROFILER.phase('load.clean'):
+                df_full = clean_data_chunk(df_full, numerical_cols, categorical_cols, chunk_num="FullLoad")
             df_full = optimize_dtypes(df_full)
 
             missing_cols = [f for f in all_feature_cols if f not in df_full.columns]
@@ -164,7 +696,8 @@ def load_and_process_data(data_path, preprocessor, features_dict, chunk_size, ta
                  y_data = df_full[LABEL_COLUMN].copy()
 
             X_features = df_full[all_feature_cols] # Select only features known to preprocessor
-            X_processed = preprocessor.transform(X_features)
+            with PROFILER.phase('load.transform'):
+                X_processed = X_features.copy() if raw_features else preprocessor.transform(X_features)
             processed_data_list.append(X_processed) # List with one item
             logging.info(f"Successfully loaded and transformed entire file. Shape: {X_processed.shape}")
             del df_full, X_features; gc.collect()
@@ -179,74 +712,72 @@ def load_and_process_data(data_path, preprocessor, features_dict, chunk_size, ta
              logging.error(f"Error loading/processing file {data_path}: {e}", exc_info=True)
              return None, None
     else: # Chunk and Sample
-        logging.info(f"Loading via chunks/sampling (target: {target_sample_size:,})...")
-        sampled_chunks = []
+        logging.info(f"Loading via chunks/sampling (target: {target_sample_size:,}, sampling: {sampling})...")
+        sampler = StratifiedReservoirSampler(target_sample_size, label_column=LABEL_COLUMN if (is_rf_data and sampling == 'stratified') else None)
         total_rows_processed = 0
-        estimated_total_rows = 1
         first_chunk = True
 
         try:
-            reader = pd.read_csv(data_path, chunksize=chunk_size, iterator=True, low_memory=False)
-            for i, chunk in enumerate(reader):
-                chunk = clean_data_chunk(chunk, numerical_cols, categorical_cols, chunk_num=f"Load:{i+1}")
-                chunk = optimize_dtypes(chunk)
-
-                # Select required columns (features + label if needed) defined by preprocessor
-                required_cols = all_feature_cols + ([LABEL_COLUMN] if is_rf_data else [])
-                cols_in_chunk = [c for c in required_cols if c in chunk.columns]
-                missing_req_cols = [c for c in all_feature_cols if c not in chunk.columns] # Check features needed by preprocessor specifically
+            if ingest_workers > 1:
+                header = [c.strip() for c in read_header(data_path)]
+                missing_req_cols = [c for c in all_feature_cols if c not in header]
                 if missing_req_cols:
-                     logging.error(f"Chunk {i+1} is missing required columns for transform: {missing_req_cols}. Stopping processing for this file.")
-                     try: reader.close()
-                     except: pass
+                     logging.error(f"{data_path} is missing required columns for transform: {missing_req_cols}.")
                      return None, None # Cannot proceed if features are missing
-
-                if first_chunk:
-                    # Check for label only once if needed
-                    label_col_present = LABEL_COLUMN in chunk.columns
-                    if is_rf_data and not label_col_present:
-                        logging.warning(f"Label column '{LABEL_COLUMN}' not found in first chunk of {data_path} (required for RF).")
-                        # Continue sampling features, but y_data will remain None
-
-                    # Estimate size (only for sampling calculation)
-                    try:
-                        file_size = os.path.getsize(data_path)
-                        bytes_per_row_est = chunk.memory_usage(index=True,deep=True).sum()/max(1,len(chunk))
-                        if bytes_per_row_est > 0: estimated_total_rows = file_size/bytes_per_row_est
-                    except Exception: pass # Ignore estimation errors here
-                    first_chunk = False
+                label_col_present = LABEL_COLUMN in header
+                if is_rf_data and not label_col_present:
+                    logging.warning(f"Label column '{LABEL_COLUMN}' not found in {data_path} (required for RF).")
+                required_cols = all_feature_cols + ([LABEL_COLUMN] if is_rf_data else [])
+                with PROFILER.phase('load.parallel_ingest'):
+                    _, sampler = parallel_ingest(data_path, numerical_cols, categorical_cols, required_cols, sampler.label_column,
+                                                 target_sample_size, chunk_size, ingest_workers)
+            else:
+                reader = read_chunks(data_path, chunk_size)
+                for i, chunk in enumerate(PROFILER.iterate('load.read', reader)):
+                    with PROFILER.phase('load.clean'):
+                        chunk = clean_data_chunk(chunk, numerical_cols, categorical_cols, chunk_num=f"Load:{i+1}")
+                        chunk = optimize_dtypes(chunk)
+
+                    # Select required columns (features + label if needed) defined by preprocessor
+                    required_cols = all_feature_cols + ([LABEL_COLUMN] if is_rf_data else [])
+                    cols_in_chunk = [c for c in required_cols if c in chunk.columns]
+                    missing_req_cols = [c for c in all_feature_cols if c not in chunk.columns] # Check features needed by preprocessor specifically
+                    if missing_req_cols:
+                         logging.error(f"Chunk {i+1} is missing required columns for transform: {missing_req_cols}. Stopping processing for this file.")
+                         try: reader.close()
+                         except: pass
+                         return None, None # Cannot proceed if features are missing
+
+                    if first_chunk:
+                        # Check for label only once if needed
+                        label_col_present = LABEL_COLUMN in chunk.columns
+                        if is_rf_data and not label_col_present:
+                            logging.warning(f"Label column '{LABEL_COLUMN}' not found in first chunk of {data_path} (required for RF).")
+                            # Continue sampling features, but y_data will remain None
+                        first_chunk = False
                 
-                chunk = chunk[[c for c in cols_in_chunk if c in chunk.columns]] # Select available needed columns
-
-                # Sampling Logic
-                rows_in_chunk = len(chunk)
-                sample_n_this_chunk = 0
-                if estimated_total_rows > 0 and rows_in_chunk > 0:
-                    sample_frac_this_chunk = target_sample_size / estimated_total_rows
-                    sample_n_this_chunk = min(rows_in_chunk, int(np.ceil(rows_in_chunk*sample_frac_this_chunk)))
-                if sample_n_this_chunk < 1 and target_sample_size > 0 and rows_in_chunk > 0: sample_n_this_chunk = 1
-
-                current_sample_total = sum(len(sc) for sc in sampled_chunks)
-                remaining_needed = max(0, target_sample_size - current_sample_total)
-                sample_n_this_chunk = min(sample_n_this_chunk, remaining_needed)
-
-                if sample_n_this_chunk > 0 and not chunk.empty:
-                    sampled_chunks.append(chunk.sample(n=sample_n_this_chunk, random_state=42))
-
-                total_rows_processed += rows_in_chunk
-                logging.info(f"  Load Chunk {i+1}: Processed {total_rows_processed:,}. Sample size: {current_sample_total + (len(sampled_chunks[-1]) if sample_n_this_chunk > 0 and sampled_chunks else 0):,}")
-                del chunk; gc.collect()
-            try: reader.close()
-            except: pass
+                    chunk = chunk[[c for c in cols_in_chunk if c in chunk.columns]] # Select available needed columns
+
+                    # Sampling Logic (single pass, exact size, bounded memory)
+                    with PROFILER.phase('load.sample'):
+                        sampler.add(chunk)
+
+                    total_rows_processed += len(chunk)
+                    logging.info(f"  Load Chunk {i+1}: Processed {total_rows_processed:,}. Sample size: {sampler.size():,}")
+                    del chunk; gc.collect()
+                try: reader.close()
+                except: pass
             logging.info("Finished reading/sampling chunks.")
 
-            if not sampled_chunks:
+            if sampler.total_rows == 0:
                  logging.error("No data sampled from file.")
                  return None, None
 
             # Assemble, process, and store labels
             logging.info("Assembling and transforming sampled data...")
-            sampled_data = pd.concat(sampled_chunks, ignore_index=True); del sampled_chunks; gc.collect()
+            with PROFILER.phase('load.sample'):
+                sampled_data = sampler.sample()
+            del sampler; gc.collect()
 
             missing_cols_final = [f for f in all_feature_cols if f not in sampled_data.columns]
             if missing_cols_final:
@@ -262,7 +793,8 @@ def load_and_process_data(data_path, preprocessor, features_dict, chunk_size, ta
 
             X_features = sampled_data[all_feature_cols]
             try:
-                X_processed = preprocessor.transform(X_features)
+                with PROFILER.phase('load.transform'):
+                    X_processed = X_features.copy() if raw_features else preprocessor.transform(X_features)
                 processed_data_list.append(X_processed)
                 logging.info(f"Successfully transformed sampled data. Shape: {X_processed.shape}")
             except ValueError as ve:
@@ -317,11 +849,18 @@ def train_models_selective(
     chunk_size,         # Chunk size for RF data path if fitting preprocessor
     n_estimators,
     max_depth,
-    n_jobs):
+    n_jobs,
+    sampling='stratified', # 'stratified' (balanced per label) or 'uniform' reservoir sampling
+    ingest_workers=1,      # >1 reads RF data with a process pool (CSV byte ranges / Parquet row groups)
+    classifier=DEFAULT_CLASSIFIER, # Supervised model trained on the RF data: 'rf' or 'hgb'
+    compact=False,                 # Post-training RF compaction (tree selection, depth cap, float32 thresholds)
+    compact_f1_tolerance=DEFAULT_COMPACT_F1_TOLERANCE,
+    compact_max_depth=None,
+    compact_min_rows_per_sec=None):
     """Loads data, preprocesses, and selectively trains RF and/or IF models."""
 
     logging.info("Starting selective training process...")
-    logging.info(f"Train RF: {train_rf_model}, RF Data: {rf_data_path}")
+    logging.info(f"Train RF: {train_rf_model} ({classifier}), RF Data: {rf_data_path}")
     logging.info(f"Train IF: {train_if_model}, IF Data: {if_data_path}")
     os.makedirs(MODELS_DIR, exist_ok=True)
 
@@ -336,6 +875,7 @@ def train_models_selective(
 
 
     # --- Variables Initialization ---
+    rf_requested, if_requested = train_rf_model, train_if_model # Flags below may be cleared if data loading fails
     preprocessor = None
     actual_features = None # Features loaded from file or identified
     X_processed_rf_sample = None
@@ -351,9 +891,13 @@ def train_models_selective(
                 preprocessor = loaded_object['preprocessor']
                 actual_features = loaded_object['features'] # Load features used by this preprocessor
                 logging.info("Successfully loaded preprocessor and associated features.")
+                schema_problems = flow_schema.check_compatibility(loaded_object.get('schema'), actual_features.get('all', []) if actual_features else [])
                 if not actual_features or not actual_features.get('all'): # More robust check
                      logging.warning("Loaded features dictionary seems empty or invalid. Retrying fitting.")
                      preprocessor = None # Force refitting
+                elif schema_problems:
+                     logging.warning(f"Existing preprocessor was fitted on an incompatible flow schema: {schema_problems}. Will attempt to refit.")
+                     preprocessor = None # Force refitting
                 else:
                      logging.info(f"Loaded features - Num: {len(actual_features.get('num',[]))}, Cat: {len(actual_features.get('cat',[]))}, All: {len(actual_features.get('all',[]))}")
             else:
@@ -373,72 +917,73 @@ def train_models_selective(
              return
 
         # --- Original Chunking/Sampling/Fitting Logic ---
-        sampled_chunks_fit = []
+        sampler_fit = StratifiedReservoirSampler(target_sample_size, label_column=LABEL_COLUMN if sampling == 'stratified' else None)
         all_categories_fit = defaultdict(set)
         total_rows_processed_fit = 0
-        estimated_total_rows_fit = 1
         actual_features = {} # Reset features dict for fresh identification
 
         try:
-            reader_fit = pd.read_csv(rf_data_path, chunksize=chunk_size, iterator=True, low_memory=False)
-            for i, chunk in enumerate(reader_fit):
-                logging.debug(f"Fitting phase: Processing chunk {i+1}") # Debug level for fitting chunks
-                if i == 0: # Identify features
-                    chunk.columns = chunk.columns.str.strip()
-                    actual_features['num'] = [f for f in DEFAULT_NUMERICAL_FEATURES if f in chunk.columns]
-                    actual_features['cat'] = [f for f in DEFAULT_CATEGORICAL_FEATURES if f in chunk.columns]
-                    actual_features['all'] = actual_features['num'] + actual_features['cat']
-                    if not actual_features['all']:
-                        logging.error("No relevant features found in first chunk for fitting.")
-                        try: reader_fit.close()
-                        except: pass
-                        return
-                    logging.info(f"Fitting: Identified Numerical Features: {actual_features['num']}")
-                    logging.info(f"Fitting: Identified Categorical Features: {actual_features['cat']}")
-                    # Estimate size
-                    try:
-                        file_size = os.path.getsize(rf_data_path)
-                        bytes_per_row_est = chunk.memory_usage(index=True,deep=True).sum()/max(1,len(chunk))
-                        if bytes_per_row_est > 0: estimated_total_rows_fit = file_size/bytes_per_row_est
-                    except Exception: pass # Ignore estimation errors
-
-                chunk = clean_data_chunk(chunk, actual_features['num'], actual_features['cat'], chunk_num=f"Fit:{i+1}")
-                chunk = optimize_dtypes(chunk)
-                cols_to_keep_fit = actual_features['all'] + ([LABEL_COLUMN] if LABEL_COLUMN in chunk.columns else [])
-                cols_to_keep_fit = [c for c in cols_to_keep_fit if c in chunk.columns]
-                chunk = chunk[cols_to_keep_fit]
-
-                # Gather categories
-                for col in actual_features['cat']:
-                     if col in chunk.columns: all_categories_fit[col].update(chunk[col].dropna().unique())
-
-                # Sampling Logic
-                rows_in_chunk = len(chunk)
-                sample_n_this_chunk = 0
-                if estimated_total_rows_fit > 0 and rows_in_chunk > 0:
-                    sample_frac_this_chunk = target_sample_size / estimated_total_rows_fit
-                    sample_n_this_chunk = min(rows_in_chunk, int(np.ceil(rows_in_chunk*sample_frac_this_chunk)))
-                if sample_n_this_chunk < 1 and target_sample_size > 0 and rows_in_chunk > 0: sample_n_this_chunk = 1
-                current_sample_total = sum(len(sc) for sc in sampled_chunks_fit)
-                remaining_needed = max(0, target_sample_size - current_sample_total)
-                sample_n_this_chunk = min(sample_n_this_chunk, remaining_needed)
-
-                if sample_n_this_chunk > 0 and not chunk.empty:
-                    sampled_chunks_fit.append(chunk.sample(n=sample_n_this_chunk, random_state=42))
-
-                total_rows_processed_fit += rows_in_chunk
-                if (i+1) % 10 == 0: # Log progress occasionally
-                    logging.info(f"  Fitting phase chunk {i+1}: Processed {total_rows_processed_fit:,}. Sample size: {current_sample_total + (len(sampled_chunks_fit[-1]) if sample_n_this_chunk > 0 and sampled_chunks_fit else 0):,}")
-
-                del chunk; gc.collect()
-            try: reader_fit.close()
-            except: pass
+            if ingest_workers > 1:
+                header = [c.strip() for c in read_header(rf_data_path)]
+                actual_features['num'] = [f for f in DEFAULT_NUMERICAL_FEATURES if f in header]
+                actual_features['cat'] = [f for f in DEFAULT_CATEGORICAL_FEATURES if f in header]
+                actual_features['all'] = actual_features['num'] + actual_features['cat']
+                if not actual_features['all']:
+                    logging.error("No relevant features found in header for fitting.")
+                    return
+                logging.info(f"Fitting: Identified Numerical Features: {actual_features['num']}")
+                logging.info(f"Fitting: Identified Categorical Features: {actual_features['cat']}")
+                with PROFILER.phase('fit.parallel_ingest'):
+                    all_categories_fit, sampler_fit = parallel_ingest(
+                        rf_data_path, actual_features['num'], actual_features['cat'], actual_features['all'] + [LABEL_COLUMN],
+                        sampler_fit.label_column, target_sample_size, chunk_size, ingest_workers)
+            else:
+                reader_fit = read_chunks(rf_data_path, chunk_size)
+                for i, chunk in enumerate(PROFILER.iterate('fit.read', reader_fit)):
+                    logging.debug(f"Fitting phase: Processing chunk {i+1}") # Debug level for fitting chunks
+                    if i == 0: # Identify features
+                        chunk.columns = chunk.columns.str.strip()
+                        actual_features['num'] = [f for f in DEFAULT_NUMERICAL_FEATURES if f in chunk.columns]
+                        actual_features['cat'] = [f for f in DEFAULT_CATEGORICAL_FEATURES if f in chunk.columns]
+                        actual_features['all'] = actual_features['num'] + actual_features['cat']
+                        if not actual_features['all']:
+                            logging.error("No relevant features found in first chunk for fitting.")
+                            try: reader_fit.close()
+                            except: pass
+                            return
+                        logging.info(f"Fitting: Identified Numerical Features: {actual_features['num']}")
+                        logging.info(f"Fitting: Identified Categorical Features: {actual_features['cat']}")
+
+                    with PROFILER.phase('fit.clean'):
+                        chunk = clean_data_chunk(chunk, actual_features['num'], actual_features['cat'], chunk_num=f"Fit:{i+1}")
+                        chunk = optimize_dtypes(chunk)
+                    cols_to_keep_fit = actual_features['all'] + ([LABEL_COLUMN] if LABEL_COLUMN in chunk.columns else [])
+                    cols_to_keep_fit = [c for c in cols_to_keep_fit if c in chunk.columns]
+                    chunk = chunk[cols_to_keep_fit]
+
+                    # Gather categories
+                    for col in actual_features['cat']:
+                         if col in chunk.columns: all_categories_fit[col].update(chunk[col].dropna().unique())
+
+                    # Sampling Logic (single pass, exact size, bounded memory)
+                    with PROFILER.phase('fit.sample'):
+                        sampler_fit.add(chunk)
+
+                    total_rows_processed_fit += len(chunk)
+                    if (i+1) % 10 == 0: # Log progress occasionally
+                        logging.info(f"  Fitting phase chunk {i+1}: Processed {total_rows_processed_fit:,}. Sample size: {sampler_fit.size():,}")
+
+                    del chunk; gc.collect()
+                try: reader_fit.close()
+                except: pass
             logging.info("Finished reading RF data chunks for fitting.")
 
-            if not sampled_chunks_fit: logging.error("No data sampled for fitting."); return
+            if sampler_fit.total_rows == 0: logging.error("No data sampled for fitting."); return
 
-            sampled_data_fit = pd.concat(sampled_chunks_fit, ignore_index=True); del sampled_chunks_fit; gc.collect()
-            logging.info(f"Assembled sample data shape for fitting: {sampled_data_fit.shape}")
+            with PROFILER.phase('fit.sample'):
+                sampled_data_fit = sampler_fit.sample()
+            logging.info(f"Assembled sample data shape for fitting: {sampled_data_fit.shape} (rows per label seen: {dict(sampler_fit.label_counts)})")
+            del sampler_fit; gc.collect()
 
             known_categories_list = {k: sorted(list(v)) for k, v in all_categories_fit.items()}
             del all_categories_fit; gc.collect()
@@ -458,14 +1003,17 @@ def train_models_selective(
 
             preprocessor = build_preprocessor(actual_features['num'], actual_features['cat'], known_categories_list)
             logging.info("Fitting preprocessor on the new sample...")
-            preprocessor.fit(X_sample_fit)
+            with PROFILER.phase('preprocessor.fit'):
+                preprocessor.fit(X_sample_fit)
 
             # --- Save the NEW preprocessor AND features ---
             preprocessor_object_to_save = {
                 'preprocessor': preprocessor,
-                'features': actual_features # Save the features identified during this fit
+                'features': actual_features, # Save the features identified during this fit
+                'schema': flow_schema.schema_descriptor(actual_features['all']) # Checked when the object is loaded again
             }
-            joblib.dump(preprocessor_object_to_save, PREPROCESSOR_OBJECT_PATH)
+            with PROFILER.phase('preprocessor.save'):
+                joblib.dump(preprocessor_object_to_save, PREPROCESSOR_OBJECT_PATH)
             logging.info(f"Preprocessor fitted and saved (with features) to {PREPROCESSOR_OBJECT_PATH}")
 
             del X_sample_fit; gc.collect() # Clean up fitting data
@@ -494,7 +1042,10 @@ def train_models_selective(
             features_dict=actual_features, # Use features associated with the preprocessor
             chunk_size=chunk_size,
             target_sample_size=target_sample_size, # Sample the RF data for training
-            is_rf_data=True # To handle label column
+            is_rf_data=True, # To handle label column
+            sampling=sampling,
+            ingest_workers=ingest_workers,
+            raw_features=(classifier == 'hgb') # HGB encodes the raw features itself
         )
         if X_processed_rf_sample is None or y_rf_sample is None:
              logging.error("Failed to load/process RF data for training. Skipping RF model.")
@@ -541,29 +1092,63 @@ def train_models_selective(
                  X_train, X_test, y_train, y_test = train_test_split(
                      X_processed_rf_sample, y_rf_sample, test_size=0.2, random_state=42,
                      stratify=y_rf_sample if len(unique_labels) > 1 else None)
-
-                 rf_classifier = RandomForestClassifier(
-                     n_estimators=n_estimators, max_depth=max_depth, random_state=42,
-                     class_weight='balanced', n_jobs=n_jobs, min_samples_leaf=5)
-                 rf_classifier.fit(X_train, y_train)
-                 logging.info("RF Training completed.")
+                 if compact and classifier == 'rf':
+                     # Trees are selected on a split the forest was not fitted on, the test split is kept for the report
+                     X_train, X_val, y_train, y_val = train_test_split(
+                         X_train, y_train, test_size=COMPACT_VALIDATION_SIZE, random_state=42, stratify=y_train)
+
+                 if classifier == 'hgb':
+                     # n_estimators -> boosting iterations; HGB is multi-threaded via OpenMP (n_jobs does not apply)
+                     rf_classifier = build_hgb_classifier(
+                         actual_features['num'], actual_features['cat'], known_categories_of(preprocessor, actual_features['cat']),
+                         max_iter=n_estimators, max_depth=max_depth)
+                     model_path = HGB_MODEL_PATH
+                 else:
+                     rf_classifier = RandomForestClassifier(
+                         n_estimators=n_estimators, max_depth=max_depth, random_state=42,
+                         class_weight='balanced', n_jobs=n_jobs, min_samples_leaf=5)
+                     model_path = RF_MODEL_PATH
+                 with PROFILER.phase(f'{classifier}.fit'):
+                     rf_classifier.fit(X_train, y_train)
+                 logging.info(f"Supervised model ({classifier}) training completed.")
 
                  # Evaluation
                  try:
                      logging.info("Evaluating RF model...")
-                     accuracy = rf_classifier.score(X_test, y_test)
+                     with PROFILER.phase(f'{classifier}.evaluate'):
+                         accuracy = rf_classifier.score(X_test, y_test)
                      logging.info(f"RF Test Sample Accuracy: {accuracy:.4f}")
                  except Exception as eval_e:
                       logging.warning(f"Could not complete RF evaluation: {eval_e}")
 
+                 # Compaction (trees selected on the validation split, reported on the test split)
+                 save_kwargs = {}
+                 if compact and classifier == 'rf':
+                     logging.info("Compacting RF model...")
+                     with PROFILER.phase('rf.compact'):
+                         rf_classifier, compaction_report = compact_random_forest(
+                             rf_classifier, X_val, y_val, X_test, y_test, f1_tolerance=compact_f1_tolerance,
+                             max_depth=compact_max_depth, min_rows_per_sec=compact_min_rows_per_sec)
+                     for stage in ('before', 'after'):
+                         stats = compaction_report[stage]
+                         logging.info(f"RF {stage} compaction: {stats['n_estimators']} trees, depth {stats['max_depth']}, {stats['bytes']:,} bytes, "
+                                      f"accuracy {stats['accuracy']:.4f}, F1 {stats['f1_macro']:.4f}, {stats['rows_per_sec']:,.0f} rows/sec")
+                     with open(RF_COMPACTION_REPORT_PATH, 'w') as f:
+                         json.dump(compaction_report, f, indent=2)
+                     save_kwargs['compress'] = 3 # Quantized thresholds compress well
+                     del X_val, y_val
+                 elif compact:
+                     logging.warning(f"--compact only applies to the RF classifier, not '{classifier}'. Skipping.")
+
                  # Save RF Model
-                 joblib.dump(rf_classifier, RF_MODEL_PATH)
-                 logging.info(f"Random Forest model saved to {RF_MODEL_PATH}")
+                 with PROFILER.phase(f'{classifier}.save'):
+                     joblib.dump(rf_classifier, model_path, **save_kwargs)
+                 logging.info(f"Supervised model ({classifier}) saved to {model_path}")
 
                  del rf_classifier, X_train, X_test, y_train, y_test; gc.collect()
         except Exception as e:
              logging.error(f"Error during RF training execution: {e}", exc_info=True)
-    elif args.train_rf: # Log if RF was requested but prerequisites failed
+    elif rf_requested: # Log if RF was requested but prerequisites failed
          logging.warning("Skipping RF training because required data was not loaded/processed correctly.")
 
 
@@ -577,14 +1162,16 @@ def train_models_selective(
                   logging.info(f"Training Isolation Forest on data shape {X_processed_if_base.shape}...")
                   if_model = IsolationForest(
                       n_estimators=n_estimators, contamination='auto', random_state=42, n_jobs=n_jobs, max_features=0.8)
-                  if_model.fit(X_processed_if_base)
+                  with PROFILER.phase('if.fit'):
+                      if_model.fit(X_processed_if_base)
                   logging.info("IF Training complete.")
-                  joblib.dump(if_model, IF_MODEL_PATH)
+                  with PROFILER.phase('if.save'):
+                      joblib.dump(if_model, IF_MODEL_PATH)
                   logging.info(f"Isolation Forest model saved to {IF_MODEL_PATH}")
                   del if_model; gc.collect()
         except Exception as e:
              logging.error(f"Error during Isolation Forest training execution: {e}", exc_info=True)
-    elif args.train_if: # Log if IF was requested but prerequisites failed
+    elif if_requested: # Log if IF was requested but prerequisites failed
          logging.warning("Skipping IF training because required data was not loaded/processed correctly.")
 
 
@@ -613,8 +1200,22 @@ if __name__ == "__main__":
                         help=f"If set, train Isolation Forest using --if-data.")
 
     # Training Parameters
+    parser.add_argument("--classifier", choices=['rf', 'hgb'], default=DEFAULT_CLASSIFIER,
+                        help=f"Supervised model for --train-rf: 'rf' RandomForest ({RF_MODEL_PATH}) or 'hgb' HistGradientBoosting with native categorical handling ({HGB_MODEL_PATH}). process.py uses the most recently trained one. Default: {DEFAULT_CLASSIFIER}")
+    parser.add_argument("--compact", action='store_true', default=False,
+                        help=f"After RF training, keep only the trees needed to stay within --compact-f1-tolerance of the full forest's validation F1, quantize thresholds to float32 and save compressed. Report: {RF_COMPACTION_REPORT_PATH}")
+    parser.add_argument("--compact-f1-tolerance", type=float, default=DEFAULT_COMPACT_F1_TOLERANCE,
+                        help=f"Macro F1 the compacted RF may lose on the validation split. Default: {DEFAULT_COMPACT_F1_TOLERANCE}")
+    parser.add_argument("--compact-max-depth", type=int, default=None,
+                        help="Cap the depth of the compacted trees. Default: no cap")
+    parser.add_argument("--compact-min-rows-per-sec", type=float, default=None,
+                        help="Latency budget: limit the number of trees so prediction reaches at least this many rows/sec. Default: no limit")
     parser.add_argument("--target-sample-size", type=int, default=DEFAULT_TARGET_SAMPLE_SIZE,
                         help=f"Target rows to sample from RF data if fitting preprocessor/training RF. Default: {DEFAULT_TARGET_SAMPLE_SIZE:,}")
+    parser.add_argument("--sampling", choices=['stratified', 'uniform'], default='stratified',
+                        help="How --target-sample-size rows are drawn from RF data: 'stratified' keeps rare labels completely and splits the rest evenly, 'uniform' is a plain random sample. Default: stratified")
+    parser.add_argument("--ingest-workers", type=int, default=DEFAULT_INGEST_WORKERS,
+                        help=f"Processes reading RF data in parallel (CSV byte ranges or Parquet row groups). Each keeps up to --target-sample-size rows in memory. Default: {DEFAULT_INGEST_WORKERS}")
     parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
                         help=f"Rows per chunk if reading RF data for fitting. Default: {DEFAULT_CHUNK_SIZE:,}")
     parser.add_argument("--n-estimators", type=int, default=DEFAULT_N_ESTIMATORS,
@@ -623,6 +1224,8 @@ if __name__ == "__main__":
                         help=f"Maximum depth of trees (for RF). Default: {DEFAULT_MAX_DEPTH}")
     parser.add_argument("--n-jobs", type=int, default=DEFAULT_N_JOBS,
                         help=f"Number of CPU cores (-1 for all, 1 uses less peak memory). Default: {DEFAULT_N_JOBS}")
+    parser.add_argument("--profile", nargs='?', const=DEFAULT_PROFILE_PATH, default=None, metavar="JSON_PATH",
+                        help=f"Record wall time, CPU time and peak memory per phase (CSV parse, cleaning, sampling, preprocessor fit, model fit) and write them as JSON. Default path: {DEFAULT_PROFILE_PATH}")
 
     args = parser.parse_args()
 
@@ -657,6 +1260,15 @@ if __name__ == "__main__":
     if args.target_sample_size <= 0:
         parser.error(f"target_sample_size must be positive. Got: {args.target_sample_size}")
         valid = False
+    if args.ingest_workers <= 0:
+        parser.error(f"ingest_workers must be positive. Got: {args.ingest_workers}")
+        valid = False
+    if args.compact_f1_tolerance < 0:
+        parser.error(f"compact_f1_tolerance must not be negative. Got: {args.compact_f1_tolerance}")
+        valid = False
+    if args.compact_max_depth is not None and args.compact_max_depth <= 0:
+        parser.error(f"compact_max_depth must be positive. Got: {args.compact_max_depth}")
+        valid = False
     if args.chunk_size <= 0:
         parser.error(f"chunk_size must be positive. Got: {args.chunk_size}")
         valid = False
@@ -674,17 +1286,28 @@ if __name__ == "__main__":
 
     # --- Proceed only if all validations passed ---
     if valid:
-        train_models_selective(
-            rf_data_path=args.rf_data,
-            if_data_path=args.if_data,
-            train_rf_model=args.train_rf,
-            train_if_model=args.train_if,
-            target_sample_size=args.target_sample_size,
-            chunk_size=args.chunk_size,
-            n_estimators=args.n_estimators,
-            max_depth=args.max_depth,
-            n_jobs=args.n_jobs
-        )
+        PROFILER.enabled = args.profile is not None
+        with PROFILER.phase('total'):
+            train_models_selective(
+                rf_data_path=args.rf_data,
+                if_data_path=args.if_data,
+                train_rf_model=args.train_rf,
+                train_if_model=args.train_if,
+                target_sample_size=args.target_sample_size,
+                chunk_size=args.chunk_size,
+                n_estimators=args.n_estimators,
+                max_depth=args.max_depth,
+                n_jobs=args.n_jobs,
+                sampling=args.sampling,
+                ingest_workers=args.ingest_workers,
+                classifier=args.classifier,
+                compact=args.compact,
+                compact_f1_tolerance=args.compact_f1_tolerance,
+                compact_max_depth=args.compact_max_depth,
+                compact_min_rows_per_sec=args.compact_min_rows_per_sec
+            )
+        if PROFILER.enabled:
+            write_profile_report(args.profile, {'arguments': vars(args)})
     else:
         # parser.error already exits
         pass
\ No newline at end of file